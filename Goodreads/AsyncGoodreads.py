@@ -0,0 +1,491 @@
+import asyncio
+import itertools
+import collections
+
+import aiohttp
+from yarl import URL # OO URLsfrom github
+
+# Parsers
+from parsers.parse_login      import parse_login
+from parsers.parse_search_api import parse_search_api, parse_search_api_page
+from parsers.parse_lookup     import parse_lookup, PREFIX_REQUIRED, PREFIX_TAIL
+from parsers.parse_similar    import parse_similar
+from parsers.parse_shelf      import parse_shelf
+
+from network.RawResponse import RawResponse
+from network.PrefixReader import PrefixReader, PrefixIncomplete
+
+from products.Book import Book
+
+from Goodreads import Goodreads
+
+class AsyncGoodreads(Goodreads):
+	"""
+	asyncio counterpart of Goodreads
+	+ search_api, lookup, similar, shelf, and shelf_iterative are coroutines
+	with the same arguments and return values as the blocking client
+	+ All requests share one pooled aiohttp session; max_concurrency caps
+	the number of requests in flight at once
+	+ Use inside `async with AsyncGoodreads(...) as gr:` or call close()
+	+ With a parse_pool, parsing is awaited in worker processes so the loop
+	keeps serving other requests
+	"""
+	def __init__(self,
+				 client_id:str = 'default',
+				 max_concurrency:int = 50,
+				 pool_size:int = 100,
+				 pool_size_per_host:int = 0,
+				 timeout:float = 30,
+				 **kwargs):
+		"""
+		Takes every option of Goodreads except pool, plus the aiohttp
+		connection pool and concurrency limits
+		"""
+		# Read by set_headers and set_cookies, which Goodreads.__init__ calls
+		self.headers = {}
+		self.cookies = {}
+		self.pool_size = pool_size
+		self.pool_size_per_host = pool_size_per_host
+		self.timeout = timeout
+		self.semaphore = asyncio.Semaphore(max_concurrency)
+
+		super().__init__(client_id = client_id, **kwargs)
+
+	def open_session(self, pool = None):
+		"""
+		Session is created lazily by get_session, as aiohttp sessions must be
+		built inside a running loop
+		"""
+		if pool is not None:
+			raise ValueError('AsyncGoodreads pools its own connections; set pool_size instead of pool')
+		return None
+
+	async def __aenter__(self):
+		self.get_session()
+		return self
+
+	async def __aexit__(self, exc_type, exc, tb):
+		await self.close()
+
+	def get_session(self):
+		"""
+		Returns the shared session, creating it and its connection pool on first use
+		"""
+		if self.sess is None or self.sess.closed:
+			self.logger.debug(f'Opening async session with pool of {self.pool_size} connections')
+			connector = aiohttp.TCPConnector(limit = self.pool_size, limit_per_host = self.pool_size_per_host)
+			self.sess = aiohttp.ClientSession(
+				connector = connector,
+				headers = self.headers,
+				cookies = self.cookies,
+				timeout = aiohttp.ClientTimeout(total = self.timeout)
+			)
+		return self.sess
+
+	async def close(self):
+		"""
+		Closes the session and releases pooled connections
+		"""
+		if self.sess is not None and not self.sess.closed:
+			self.logger.debug('Closing async session')
+			await self.sess.close()
+
+	def set_cookies(self, cookies:dict):
+		"""
+		Sets cookie to the current request session
+		"""
+		self.logger.debug(f'Manually adding new cookie {cookies.keys()} to session')
+		self.cookies.update(cookies)
+		if self.sess is not None:
+			self.sess.cookie_jar.update_cookies(cookies)
+
+	def set_headers(self, headers:dict):
+		"""
+		Sets header to the current request session
+		"""
+		self.logger.debug(f'Manually adding new header {headers.keys()} to session')
+		self.headers.update(headers)
+		if self.sess is not None:
+			self.sess.headers.update(headers)
+
+	async def request(self, url,
+					  method = 'GET',
+					  data = None,
+					  callback = None,
+					  prefix = None):
+		"""
+		Generic request
+		+ Body is read in full and wrapped in a RawResponse so the blocking
+		parser callbacks can be reused unchanged
+		+ Caching, rate limiting, retries, and prefix reads behave as in
+		Goodreads.request
+		+ Cache, archive, and parse memo reads and writes run in worker threads
+		so SQLite and disk work does not stall the loop
+		"""
+		if method not in ('GET', 'POST'):
+			self.logger.debug(f'Request method {method} for url {url} not recognized.')
+			return None, None
+
+		cached, fresh = await asyncio.to_thread(self.check_cache, method = method, url = url)
+		if fresh:
+			self.logger.debug('%s "%s %s?%s" cached', url.host, method, url.raw_path, url.query_string)
+			return await self.async_handle_response(response = cached, method = method, callback = callback)
+		headers = self.cache.validators(cached) if cached else None
+
+		# Make request
+		sess = self.get_session()
+		for attempt in range(self.max_retries + 1):
+			await self.async_wait_for_host(url.host)
+			try:
+				async with self.semaphore:
+					async with sess.request(method, url, data = data, headers = headers) as resp:
+						if prefix is not None and resp.status == 200:
+							content, truncated = await self.async_read_prefix(resp, *prefix)
+						else:
+							content, truncated = await resp.read(), False
+						response = RawResponse(
+							url = resp.url,
+							status_code = resp.status,
+							content = content,
+							headers = resp.headers,
+							encoding = resp.charset,
+							truncated = truncated
+						)
+			except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+				self.logger.debug('%s "%s %s?%s" failed: %s', url.host, method, url.raw_path, url.query_string, e)
+				response = None
+			else:
+				# Log request
+				self.logger.debug(
+					'%s "%s %s?%s" %s', url.host, method, url.raw_path, url.query_string, response.status_code
+				)
+
+			# POSTs (login) are not idempotent, so the first answer or failure
+			# stands; the rate limiter still sees it
+			delay = self.retry_delay(url = url, response = response, attempt = attempt, retry = method == 'GET')
+			if delay is None:
+				break
+			self.logger.debug('Retrying %s in %.2fs (attempt %d of %d)', url, delay, attempt + 1, self.max_retries)
+			await asyncio.sleep(delay)
+
+		if response is None:
+			return None, None
+
+		await asyncio.to_thread(self.archive_response, method = method, url = url, response = response)
+		response = await asyncio.to_thread(self.update_cache, method = method, url = url, response = response, cached = cached)
+
+		try:
+			return await self.async_handle_response(response = response, method = method, callback = callback)
+		except PrefixIncomplete as e:
+			self.logger.debug('%s. Fetching it in full.', e)
+			return await self.request(url = url, method = method, data = data, callback = callback)
+
+	async def async_read_prefix(self, resp, required, tail,
+								chunk_size = 16 * 1024):
+		"""
+		Reads an aiohttp response until PrefixReader stops, then closes it to
+		drop the rest of the download
+		+ Returns (content, truncated)
+		"""
+		reader = PrefixReader(required = required, tail = tail)
+		async for chunk in resp.content.iter_chunked(chunk_size):
+			if reader.feed(chunk):
+				break
+
+		if reader.done:
+			resp.close()
+			self.logger.debug('Stopped reading <%s> after %d bytes', resp.url, reader.bytes_read)
+		return reader.content, reader.done
+
+	async def async_handle_response(self, response, method, callback = None):
+		"""
+		Awaits the parse pool without blocking the loop when one is attached
+		"""
+		if self.parse_pool is None or callback is None or response.status_code != 200 or getattr(callback, 'retains_tree', False):
+			return self.handle_response(response = response, method = method, callback = callback)
+		parsed = await asyncio.to_thread(self.memo_get, response = response, callback = callback)
+		if parsed is None:
+			self.logger.debug('Handing <%s> to parse pool', response.url)
+			parsed = await asyncio.wrap_future(self.parse_pool.submit(callback, response))
+			await asyncio.to_thread(self.memo_store, response = response, callback = callback, parsed = parsed)
+		return parsed, response.status_code
+
+	async def async_wait_for_host(self, host):
+		"""
+		Sleeps without blocking the loop until the rate limiter allows host
+		"""
+		if self.rate_limiter is None:
+			return 0
+		wait = self.rate_limiter.reserve(host)
+		if wait > 0:
+			await asyncio.sleep(wait)
+		return wait
+
+	async def login(self,
+					url = 'https://www.goodreads.com/user/sign_in',
+					userfield = 'user[email]',
+					passfield = 'user[password]'):
+		"""
+		GETs and POSTs to login page using username and password
+		credentials. Cookies verifying login are stored in the shared session.
+		"""
+		self.logger.debug(f'Logging in to <{url}>')
+
+		username, password = self.get_login_cred()
+
+		url = URL(url)
+		payload, _ = await self.request(url = url, callback = parse_login)
+		payload.update({
+			userfield : username,
+			passfield : password
+		})
+
+		# POST login credentials
+		return await self.request(url = url, data = payload, method = 'POST')
+
+	async def search_api(self, search_term,
+						 search_field = 'all',
+						 page = 1,
+						 with_meta = False,
+						 url_scheme = 'https',
+						 url_host = 'www.goodreads.com',
+						 url_path = '/search.xml'):
+		"""
+		Search GoodReads API by book title, author, or ISBN
+		+ With with_meta, returns {'meta' : ..., 'books' : [...]} so callers can
+		see results_end and total_results
+		"""
+		url_query = {
+			'q' : search_term,
+			'page' : page,
+			'key' : self.oauth_key,
+			'search[field]' : search_field
+		}
+
+		url = self.build_url(
+			url_scheme = url_scheme,
+			url_host = url_host,
+			url_path = url_path,
+			url_query = url_query
+		)
+
+		callback = parse_search_api_page if with_meta else parse_search_api
+		return await self.request(url = url, callback = callback)
+
+	async def lookup(self, gr_book_id,
+					 fields = None,
+					 lazy = False,
+					 stream = False,
+					 url_scheme = 'https',
+					 url_host = 'www.goodreads.com',
+					 url_path = '/book/show'):
+		"""
+		Accesses page of a book given its goodreads book id, as in Goodreads.lookup
+		"""
+		url = self.build_url(
+			url_scheme = url_scheme,
+			url_host = url_host,
+			url_path = f'{url_path}/{gr_book_id}'
+		)
+
+		book, status_code = await self.request(url = url, callback = self.lookup_callback(fields = fields, lazy = lazy),
+											   prefix = (PREFIX_REQUIRED, PREFIX_TAIL) if stream else None)
+		if lazy and book is not None:
+			book = Book.from_data(book)
+		return book, status_code
+
+	async def lookup_many(self, gr_book_ids,
+						  fields = None,
+						  stream = False,
+						  saved_dir = None,
+						  save = False,
+						  writer = None):
+		"""
+		Looks up many books at once, as in Goodreads.lookup_many
+		+ Concurrency is bounded by the client's max_concurrency
+		+ Saved books are loaded and saved in worker threads
+		"""
+		books, to_fetch = await asyncio.to_thread(self.load_saved_books, gr_book_ids, saved_dir = saved_dir)
+		failures = {}
+
+		results = await asyncio.gather(
+			*[self.lookup(gr_book_id, fields = fields, stream = stream) for gr_book_id in to_fetch],
+			return_exceptions = True
+		)
+		for gr_book_id, result in zip(to_fetch, results):
+			if isinstance(result, Exception):
+				self.logger.debug(f'Lookup of {gr_book_id} raised {result!r}')
+				result = (None, None)
+			book, status_code = result
+			await asyncio.to_thread(self.collect_lookup, gr_book_id, book, status_code, books, failures,
+									saved_dir = saved_dir, save = save, writer = writer)
+
+		self.logger.debug(f'Looked up {len(books)} books, {len(to_fetch)} requested, {len(failures)} failed')
+		return books, failures
+
+	async def similar(self, similar_url,
+					  url_scheme = 'https',
+					  url_host = 'www.goodreads.com',
+					  url_path = '/book/similar'):
+		"""
+		Accesses similar books and returns ids
+		+ Note a url is requested as input, not a goodreads id number
+		"""
+		url = URL(similar_url)
+
+		return await self.request(url = url, callback = parse_similar)
+
+	async def shelf(self, genre,
+					page = 1,
+					url_scheme = 'https',
+					url_host = 'www.goodreads.com',
+					url_path = '/shelf/show'):
+		"""
+		Accesses single page of shelf
+		"""
+		url = self.build_url(
+			url_scheme = url_scheme,
+			url_host = url_host,
+			url_path = f'{url_path}/{genre}',
+			url_query = {'page' : str(page)}
+		)
+
+		shelf, status_code = await self.request(url = url, callback = parse_shelf)
+
+		return shelf, status_code
+
+	async def shelf_iterative(self, genre,
+							  start_page = 1,
+							  max_page = 25,
+							  url_scheme = 'https',
+							  url_host = 'www.goodreads.com',
+							  url_path = '/shelf/show',
+							  window = None,
+							  stop_early = False):
+		"""
+		Requests shelf pages concurrently and returns one big shelf
+		+ window caps the pages in flight at once (all pages by default);
+		pages are merged back in page order
+		+ With stop_early, no more pages are requested once a page comes back
+		with no books or a non-200 status, and later pages are dropped
+		"""
+		if not window:
+			window = max_page - start_page + 1
+
+		results = {}
+		last_page = max_page
+		next_page = start_page
+		in_flight = {}
+
+		while in_flight or next_page <= last_page:
+			# Keep the window full
+			while next_page <= last_page and len(in_flight) < window:
+				task = asyncio.ensure_future(self.shelf(genre = genre, page = next_page,
+														url_scheme = url_scheme, url_host = url_host, url_path = url_path))
+				in_flight[task] = next_page
+				next_page += 1
+
+			done, _ = await asyncio.wait(in_flight, return_when = asyncio.FIRST_COMPLETED)
+			for task in done:
+				page_num = in_flight.pop(task)
+				results[page_num] = task.result()
+				if stop_early and page_num < last_page and self.is_shelf_end(page_num, *results[page_num]):
+					self.logger.debug(f'Shelf {genre} ended at page {page_num}')
+					last_page = page_num
+
+			# Cancel requests for pages past the end
+			for task, page_num in list(in_flight.items()):
+				if page_num > last_page:
+					task.cancel()
+					in_flight.pop(task)
+
+		return self.merge_shelf_pages(results = results, last_page = last_page)
+
+	async def iter_pages(self, fetch,
+						 start_page = 1,
+						 max_page = None,
+						 prefetch = 0):
+		"""
+		Async generator of (page_num, parsed, status_code) for consecutive pages
+		+ fetch(page_num) returns a coroutine making one page request
+		+ prefetch pages are requested ahead while the caller works on the
+		current one; unused requests are cancelled when iteration stops
+		"""
+		if max_page is None:
+			pages = itertools.count(start_page)
+		else:
+			pages = iter(range(start_page, max_page+1))
+
+		queue = collections.deque()
+		try:
+			for page_num in itertools.islice(pages, prefetch + 1):
+				queue.append((page_num, asyncio.ensure_future(fetch(page_num))))
+
+			while queue:
+				page_num, task = queue.popleft()
+				parsed, status_code = await task
+				yield page_num, parsed, status_code
+
+				page_num = next(pages, None)
+				if page_num is not None:
+					queue.append((page_num, asyncio.ensure_future(fetch(page_num))))
+		finally:
+			for _, task in queue:
+				task.cancel()
+
+	async def iter_shelf(self, genre,
+						 start_page = 1,
+						 max_page = 25,
+						 by_book = False,
+						 prefetch = 0,
+						 url_scheme = 'https',
+						 url_host = 'www.goodreads.com',
+						 url_path = '/shelf/show'):
+		"""
+		Async generator counterpart of Goodreads.iter_shelf
+		"""
+		def fetch(page_num):
+			return self.shelf(genre = genre, page = page_num,
+							  url_scheme = url_scheme, url_host = url_host, url_path = url_path)
+
+		async for page_num, shelf, status_code in self.iter_pages(fetch, start_page = start_page, max_page = max_page, prefetch = prefetch):
+			if self.is_shelf_end(page_num, shelf, status_code):
+				self.logger.debug(f'Shelf {genre} ended at page {page_num} ({status_code})')
+				return
+
+			if by_book:
+				for book in shelf['pages'][page_num]['books']:
+					yield page_num, book
+			else:
+				yield page_num, shelf
+
+	async def iter_search(self, search_term,
+						  search_field = 'all',
+						  start_page = 1,
+						  max_page = None,
+						  by_book = False,
+						  prefetch = 0,
+						  url_scheme = 'https',
+						  url_host = 'www.goodreads.com',
+						  url_path = '/search.xml'):
+		"""
+		Async generator counterpart of Goodreads.iter_search
+		"""
+		def fetch(page_num):
+			return self.search_api(search_term = search_term, search_field = search_field, page = page_num, with_meta = True,
+								   url_scheme = url_scheme, url_host = url_host, url_path = url_path)
+
+		async for page_num, page, status_code in self.iter_pages(fetch, start_page = start_page, max_page = max_page, prefetch = prefetch):
+			if status_code != 200 or not page or not page['books']:
+				self.logger.debug(f'Search {search_term} ended at page {page_num} ({status_code})')
+				return
+
+			if by_book:
+				for book in page['books']:
+					yield page_num, book
+			else:
+				yield page_num, page['books']
+
+			if self.is_search_end(page['meta']):
+				self.logger.debug(f'Search {search_term} ended at page {page_num} (last page)')
+				return
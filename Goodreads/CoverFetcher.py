@@ -0,0 +1,278 @@
+import time
+import hashlib
+import pathlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from products.Book import Book
+
+from network.RateLimiter import backoff_delay
+
+# Client errors worth retrying; any other 4xx means the cover is gone
+RETRY_CLIENT_STATUSES = (408, 429)
+
+class CoverFetcher():
+	"""
+	Downloads book covers concurrently into a content-addressed store
+	+ Each image is stored once as objects/<2 hex>/<sha256>, so the
+	placeholder cover shared by thousands of books takes one file whatever
+	url or extension it is served under
+	+ covers.tsv maps gr_book_id, url, sha256, and file path; it is only
+	ever appended to, and the latest line of a book wins
+	+ Each url is downloaded once per run, and urls already in covers.tsv
+	whose file exists are skipped
+	+ Images are streamed to partial/ in chunk_size pieces and moved into
+	place once complete; an interrupted download resumes from its partial
+	file with a Range request guarded by If-Range
+	+ Failed downloads are retried with jittered exponential backoff; a
+	4xx other than 408 or 429 fails the url at once
+	+ pool: a SharedPool to reuse connections with other clients
+	"""
+	def __init__(self, cover_dir:str = './covers',
+				 max_workers:int = 8,
+				 chunk_size:int = 64 * 1024,
+				 timeout:float = 30,
+				 retries:int = 3,
+				 backoff_base:float = 1.0,
+				 backoff_cap:float = 30.0,
+				 pool = None):
+		self.cover_dir = pathlib.Path(cover_dir)
+		self.object_dir = self.cover_dir.joinpath('objects')
+		self.partial_dir = self.cover_dir.joinpath('partial')
+		self.object_dir.mkdir(parents = True, exist_ok = True)
+		self.partial_dir.mkdir(parents = True, exist_ok = True)
+		self.index_path = self.cover_dir.joinpath('covers.tsv')
+
+		self.max_workers = max_workers
+		self.chunk_size = chunk_size
+		self.timeout = timeout
+		self.retries = retries
+		self.backoff_base = backoff_base
+		self.backoff_cap = backoff_cap
+
+		self.sess = requests.Session()
+		if pool is not None:
+			pool.mount(self.sess)
+		else:
+			adapter = HTTPAdapter(pool_maxsize = max_workers)
+			self.sess.mount('https://', adapter)
+			self.sess.mount('http://', adapter)
+
+		self.lock = threading.Lock()
+		self.books = {} # gr_book_id -> (url, sha256, path)
+		self.urls = {}  # url -> (sha256, path)
+		self.read_index()
+		self.counts = {
+			'downloaded' : 0,
+			'resumed'    : 0,
+			'skipped'    : 0,
+			'duplicates' : 0,
+			'failed'     : 0,
+			'bytes'      : 0
+		}
+
+	def read_index(self):
+		"""
+		Loads covers.tsv, keeping only entries whose image is on disk
+		"""
+		if not self.index_path.exists():
+			return
+		with open(self.index_path, 'r', encoding = 'utf-8') as f:
+			for line in f:
+				try:
+					gr_book_id, url, sha256, path = line.rstrip('\n').split('\t')
+				except ValueError: # Line cut short by a crash while writing
+					continue
+				if self.cover_dir.joinpath(path).exists():
+					self.books[gr_book_id] = (url, sha256, path)
+					self.urls[url] = (sha256, path)
+
+	def path(self, gr_book_id):
+		"""
+		Path of a book's stored cover, or None
+		"""
+		entry = self.books.get(str(gr_book_id))
+		return self.cover_dir.joinpath(entry[2]) if entry is not None else None
+
+	def fetch_many(self, books):
+		"""
+		Fetches the covers of Books, book info dicts, or (gr_book_id, url)
+		pairs and returns {gr_book_id : path or None}
+		+ Books without a cover_url map to None
+		"""
+		wanted = {}
+		for book in books:
+			if isinstance(book, Book):
+				book = book.data
+			if isinstance(book, dict):
+				book = (book.get('gr_book_id'), book.get('cover_url'))
+			gr_book_id, url = book
+			wanted[str(gr_book_id)] = str(url) if url is not None else None
+
+		by_url = {}
+		for gr_book_id, url in wanted.items():
+			if url is not None:
+				by_url.setdefault(url, []).append(gr_book_id)
+
+		with ThreadPoolExecutor(max_workers = self.max_workers) as executor:
+			futures = {url : executor.submit(self.fetch, url) for url in by_url}
+			for url, future in futures.items():
+				try:
+					stored = future.result()
+				except Exception as e:
+					logging.debug(f'Cover download of <{url}> raised {e!r}')
+					stored = None
+				if stored is None:
+					with self.lock:
+						self.counts['failed'] += 1
+					continue
+				self.record(by_url[url], url, *stored)
+
+		return {gr_book_id : self.path(gr_book_id) if url is not None else None
+				for gr_book_id, url in wanted.items()}
+
+	def fetch(self, url):
+		"""
+		Downloads one url unless it is already stored
+		+ Returns (sha256, path relative to cover_dir), or None on failure
+		"""
+		with self.lock:
+			if url in self.urls:
+				self.counts['skipped'] += 1
+				return self.urls[url]
+
+		partial = self.partial_dir.joinpath(hashlib.sha1(url.encode('utf-8')).hexdigest() + '.part')
+		for attempt in range(self.retries + 1):
+			try:
+				done = self.download(url, partial)
+			except (requests.RequestException, OSError) as e:
+				logging.debug(f'Cover download of <{url}> failed: {e!r}')
+				done = False
+			if done:
+				return self.store(url, partial)
+			if done is None: # Not worth retrying
+				self.discard(partial)
+				return None
+			if attempt < self.retries:
+				time.sleep(backoff_delay(attempt = attempt, base = self.backoff_base, cap = self.backoff_cap))
+		return None
+
+	def download(self, url, partial):
+		"""
+		Streams a url into its partial file, resuming from what is there
+		+ A resume sends If-Range with the ETag or Last-Modified of the first
+		response, so a changed image is sent whole instead of spliced onto
+		the old partial file; a partial file without one starts over
+		+ Returns True once the whole body is on disk, False if the download
+		should be retried, or None if the url failed for good
+		"""
+		validator_path = partial.with_suffix('.validator')
+		have = partial.stat().st_size if partial.exists() else 0
+		validator = validator_path.read_text() if validator_path.exists() else None
+
+		headers = {'Accept-Encoding' : 'identity'} # Byte ranges of the stored bytes
+		if have and validator:
+			headers.update({'Range' : f'bytes={have}-', 'If-Range' : validator})
+		else:
+			have = 0
+
+		with self.sess.get(url, headers = headers, stream = True, timeout = self.timeout) as response:
+			if response.status_code == 416: # Range no longer fits the image; start over
+				self.discard(partial)
+				return False
+			if response.status_code not in (200, 206):
+				logging.debug(f'Cover download of <{url}> returned {response.status_code}')
+				if 400 <= response.status_code < 500 and response.status_code not in RETRY_CLIENT_STATUSES:
+					return None
+				return False
+
+			resume = response.status_code == 206
+			if resume:
+				if not response.headers.get('Content-Range', '').startswith(f'bytes {have}-'):
+					self.discard(partial)
+					return False
+				with self.lock:
+					self.counts['resumed'] += 1
+			else:
+				validator = response.headers.get('ETag')
+				if validator is None or validator.startswith('W/'): # Weak ETags cannot be used in If-Range
+					validator = response.headers.get('Last-Modified')
+				if validator:
+					validator_path.write_text(validator)
+				elif validator_path.exists():
+					validator_path.unlink()
+			expected = response.headers.get('Content-Length')
+
+			written = 0
+			with open(partial, 'ab' if resume else 'wb') as f:
+				for chunk in response.iter_content(chunk_size = self.chunk_size):
+					f.write(chunk)
+					written += len(chunk)
+			with self.lock:
+				self.counts['bytes'] += written
+
+			if expected is not None and written != int(expected):
+				return False # Cut short; the next attempt resumes
+			return True
+
+	def discard(self, partial):
+		"""
+		Removes a partial download and its validator
+		"""
+		for path in (partial, partial.with_suffix('.validator')):
+			if path.exists():
+				path.unlink()
+
+	def store(self, url, partial):
+		"""
+		Moves a finished download to its content address
+		"""
+		sha256 = hashlib.sha256()
+		with open(partial, 'rb') as f:
+			for chunk in iter(lambda: f.read(self.chunk_size), b''):
+				sha256.update(chunk)
+		sha256 = sha256.hexdigest()
+
+		path = pathlib.Path('objects', sha256[:2], sha256)
+		target = self.cover_dir.joinpath(path)
+		with self.lock:
+			if target.exists():
+				self.counts['duplicates'] += 1
+			else:
+				target.parent.mkdir(exist_ok = True)
+				partial.replace(target)
+				self.counts['downloaded'] += 1
+			self.discard(partial)
+			self.urls[url] = (sha256, path.as_posix())
+		return sha256, path.as_posix()
+
+	def record(self, gr_book_ids, url, sha256, path):
+		"""
+		Files a url's cover under every book that uses it
+		"""
+		with self.lock:
+			lines = []
+			for gr_book_id in gr_book_ids:
+				if self.books.get(gr_book_id) != (url, sha256, path):
+					self.books[gr_book_id] = (url, sha256, path)
+					lines.append(f'{gr_book_id}\t{url}\t{sha256}\t{path}\n')
+			if lines:
+				with open(self.index_path, 'a', encoding = 'utf-8') as f:
+					f.write(''.join(lines))
+
+	def stats(self):
+		with self.lock:
+			return dict(self.counts, books = len(self.books), images = len(set(self.urls.values())))
+
+	def close(self):
+		self.sess.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self.close()
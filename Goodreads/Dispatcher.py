@@ -4,9 +4,32 @@ import logging
 from concurrent.futures import ThreadPoolExecutor
 
 from Goodreads import Goodreads
+from network.SharedPool import SharedPool
+from network.RateLimiter import RateLimiter
+from ParsePool import ParsePool
 
 class Dispatcher():
-	def __init__(self, max_threads = 5):
+	def __init__(self, max_threads = 5,
+				 share_pool = False,
+				 host_pool_sizes:dict = None,
+				 parse_workers:int = 0,
+				 parse_backend:str = None,
+				 rate_limiter = None,
+				 catalog = None):
+		"""
+		Schedules jobs across clients on a pool of max_threads workers
+		+ With share_pool, every client is handed one SharedPool sized to
+		max_threads, so workers reuse each other's keep-alive connections.
+		host_pool_sizes overrides the pool size of individual hosts.
+		+ With parse_workers, every client is handed one ParsePool of that many
+		processes. Threads then only fetch, so fetch concurrency (max_threads)
+		and parse parallelism (parse_workers) are set independently.
+		+ Every client is handed one RateLimiter, so clients hitting the same
+		host share its rate. Pass rate_limiter to use your own, or False to
+		turn rate limiting off.
+		+ With a Catalog, the books and shelves returned by jobs are queued to
+		its writer thread as each job finishes
+		"""
 		self.queue = []
 		self.history = []
 
@@ -14,6 +37,20 @@ class Dispatcher():
 
 		self.executor = ThreadPoolExecutor(max_workers = max_threads)
 
+		self.pool = None
+		if share_pool:
+			if host_pool_sizes is None:
+				host_pool_sizes = {'www.goodreads.com' : max_threads}
+			self.pool = SharedPool(pool_maxsize = max_threads, host_pool_sizes = host_pool_sizes)
+
+		self.parse_pool = None
+		if parse_workers:
+			self.parse_pool = ParsePool(max_workers = parse_workers, backend = parse_backend)
+
+		self.rate_limiter = RateLimiter() if rate_limiter is None else rate_limiter
+
+		self.catalog = catalog
+
 	def add_client(self, client:type, client_id:str,
 				   jobs_accepted:list = [],
 				   **kwargs):
@@ -36,6 +73,14 @@ class Dispatcher():
 				print('Cannot get acceptable jobs')
 				sys.exit()
 
+		# Clients share the dispatcher's pool unless given their own
+		if self.pool is not None and 'pool' not in kwargs:
+			kwargs['pool'] = self.pool
+		if self.parse_pool is not None and 'parse_pool' not in kwargs:
+			kwargs['parse_pool'] = self.parse_pool
+		if 'rate_limiter' not in kwargs:
+			kwargs['rate_limiter'] = self.rate_limiter
+
 		# Add client to client list
 		self.clients.update({
 			client_id : {
@@ -81,6 +126,7 @@ class Dispatcher():
 		"""
 		Uses ThreadPoolExecutor to schedule and complete jobs
 		https://stackoverflow.com/questions/31159165/python-threadpoolexecutor-on-method-of-instance
+		+ Returns the Future of the job
 		"""
 		if not bool(self.clients):
 			print('Cannot give job to client without any clients')
@@ -89,7 +135,31 @@ class Dispatcher():
 		client_id = self.select_client(job = job)
 		method = getattr(self.clients[client_id]['client_obj'], job) # This must be a BOUND method of the specific class instance
 
-		self.executor.submit(method, **kwargs)
+		future = self.executor.submit(method, **kwargs)
+		if self.catalog is not None:
+			future.add_done_callback(self.catalog_result)
+		return future
+
+	def catalog_result(self, future):
+		"""
+		Queues the result of a finished job to the catalog
+		"""
+		if future.cancelled() or future.exception() is not None:
+			return
+		self.catalog.put_result(future.result())
+
+	def shutdown(self, wait:bool = True):
+		"""
+		Stops the worker threads and releases the shared pools
+		+ With wait, also waits until the catalog has written every result
+		"""
+		self.executor.shutdown(wait = wait)
+		if self.catalog is not None and wait:
+			self.catalog.flush()
+		if self.parse_pool is not None:
+			self.parse_pool.close(wait = wait)
+		if self.pool is not None:
+			self.pool.close()
 
 	def collect_responses(self):
 		"""
@@ -1,35 +1,80 @@
+import time
+import functools
+import itertools
+import collections
 import requests
 import pathlib
 import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from yarl import URL # OO URLsfrom github
 from bs4 import BeautifulSoup
 
 # Parsers
 from parsers.parse_login      import parse_login
-from parsers.parse_search_api import parse_search_api
-from parsers.parse_lookup     import parse_lookup
+from parsers.parse_search_api import parse_search_api, parse_search_api_page
+from parsers.parse_lookup     import parse_lookup, parse_lookup_lazy, check_lookup_fields, PREFIX_REQUIRED, PREFIX_TAIL
 from parsers.parse_similar    import parse_similar
 from parsers.parse_shelf      import parse_shelf
 
 from products.Book  import Book
 from products.Shelf import Shelf
 
+from network.RateLimiter import RateLimiter, parse_retry_after, backoff_delay
+from network.RawResponse import RawResponse
+from network.PrefixReader import PrefixReader, PrefixIncomplete
+
+from queue_logging import attach_queue_handler, attach_file_handler
+
 class Goodreads():
 	def __init__(self, 
 				 client_id:str = 'default', 
 				 headers:dict = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.14; rv:74.0) Gecko/20100101 Firefox/74.0'}, 
 				 cookies:dict = {},
+				 cache = None,
+				 rate_limiter = None,
+				 max_retries:int = 3,
+				 retry_statuses:tuple = (429, 500, 502, 503, 504),
+				 backoff_base:float = 1.0,
+				 backoff_cap:float = 60.0,
+				 pool = None,
+				 parse_pool = None,
+				 parse_memo = None,
+				 archive = None,
+				 queue_logging:bool = False,
 				 **kwargs):
 		# Participant ID used to track responses
 		self.client_id = client_id
 		self.other = kwargs
+		self.queue_logging = queue_logging
+
+		# Optional ResponseCache, which may be shared between clients
+		self.cache = cache
+
+		# RateLimiter, shared between clients hitting the same host; each client
+		# gets its own by default, and rate_limiter = False turns it off
+		if rate_limiter is None:
+			rate_limiter = RateLimiter()
+		self.rate_limiter = rate_limiter or None
+		self.max_retries = max_retries
+		self.retry_statuses = retry_statuses
+		self.backoff_base = backoff_base
+		self.backoff_cap = backoff_cap
+
+		# Optional ParsePool, so parsing runs in worker processes instead of this thread
+		self.parse_pool = parse_pool
+
+		# Optional ParseMemo, so unchanged pages are not parsed again
+		self.parse_memo = parse_memo
+
+		# Optional ResponseArchive keeping raw pages for offline re-parsing
+		self.archive = archive
 
 		# Recording defaults to file in logging_dir
 		self.initialize_logger()
 
 		# Set info about the client
-		self.sess = requests.Session()
+		self.sess = self.open_session(pool = pool)
 		self.set_headers(headers)
 		self.set_cookies(cookies)
 
@@ -50,19 +95,32 @@ class Goodreads():
 		else:
 			filename = f'{filename_root}_{self.client_id}.txt'
 		log_path = pathlib.Path(logging_dir).joinpath(filename)
-		handler = logging.FileHandler(filename = log_path, mode = 'a')
 
 		# Formatting log
 		fh = logging.Formatter(fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-		handler.setFormatter(fh)
 
 		# Creating log
+		# + Handlers are only added once per logger, so reused client ids do not duplicate lines
+		# + With queue_logging, records are written by one background thread per process
 		self.logger = logging.getLogger(name = self.client_id)
 		self.logger.setLevel(logging.DEBUG)
-		self.logger.addHandler(handler)
+		if self.queue_logging:
+			attach_queue_handler(self.logger, log_path = log_path, formatter = fh)
+		else:
+			attach_file_handler(self.logger, log_path = log_path, formatter = fh)
 
 		self.logger.debug(f'Initialized client {self.client_id}')
 
+	def open_session(self, pool = None):
+		"""
+		Session every request goes through
+		+ pool is an optional SharedPool reused by other clients
+		"""
+		sess = requests.Session()
+		if pool is not None:
+			pool.mount(sess)
+		return sess
+
 	def get_login_cred(self,
 					  login_dir:str = './login',
 					  login_file:str = 'test.txt'):
@@ -126,38 +184,233 @@ class Goodreads():
 	def request(self, url,
 				method = 'GET',
 				data = None,
-				callback = None):
+				callback = None,
+				prefix = None):
 		"""
 		Generic request
+		+ When a cache is attached, fresh cached GETs skip the network and
+		stale ones are revalidated with a conditional request
+		+ Every request waits on the rate limiter, which adapts to every
+		response, POSTs included
+		+ Throttled (429/503) and server error responses to GETs are retried
+		with jittered exponential backoff, honoring Retry-After. POSTs are sent
+		once.
+		+ With prefix = (required, tail) patterns, a GET body is streamed and
+		the download is dropped once the parser has what it needs (see
+		PrefixReader). Cut bodies are not cached, and a cut page the parser
+		rejects with PrefixIncomplete is fetched again in full.
+		+ With an archive attached, every page fetched from the network is
+		also kept raw for reparse.py
 		"""
-		# Make request
-		if method == 'GET':
-			response = self.sess.get(url = url, data = data)
-		elif method == 'POST':
-			response = self.sess.post(url = url, data = data)
-		else:
+		if method not in ('GET', 'POST'):
 			self.logger.debug(f'Request method {method} for url {url} not recognized.')
 			return None, None
 
-		# Log request
-		self.logger.debug(
-			f'{url.host} \"{method} {url.raw_path}?{url.query_string}\" {response.status_code}'
+		cached, fresh = self.check_cache(method = method, url = url)
+		if fresh:
+			self.logger.debug('%s "%s %s?%s" cached', url.host, method, url.raw_path, url.query_string)
+			return self.handle_response(response = cached, method = method, callback = callback)
+		headers = self.cache.validators(cached) if cached else None
+
+		# Make request
+		for attempt in range(self.max_retries + 1):
+			self.wait_for_host(url.host)
+			try:
+				if method == 'GET':
+					response = self.sess.get(url = url, data = data, headers = headers, stream = prefix is not None)
+				else:
+					response = self.sess.post(url = url, data = data)
+			except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+				self.logger.debug('%s "%s %s?%s" failed: %s', url.host, method, url.raw_path, url.query_string, e)
+				response = None
+			else:
+				# Log request
+				self.logger.debug(
+					'%s "%s %s?%s" %s', url.host, method, url.raw_path, url.query_string, response.status_code
+				)
+
+			# POSTs (login) are not idempotent, so the first answer or failure
+			# stands; the rate limiter still sees it
+			delay = self.retry_delay(url = url, response = response, attempt = attempt, retry = method == 'GET')
+			if delay is None:
+				break
+			self.logger.debug('Retrying %s in %.2fs (attempt %d of %d)', url, delay, attempt + 1, self.max_retries)
+			if response is not None:
+				response.close() # Frees the connection of an unread streamed response
+			time.sleep(delay)
+
+		if response is None:
+			return None, None
+
+		if prefix is not None:
+			if response.status_code == 200:
+				response = self.read_prefix(response, *prefix)
+			else:
+				response.content # Reads the streamed body so the connection goes back to the pool
+
+		self.archive_response(method = method, url = url, response = response)
+		response = self.update_cache(method = method, url = url, response = response, cached = cached)
+
+		try:
+			return self.handle_response(response = response, method = method, callback = callback)
+		except PrefixIncomplete as e:
+			self.logger.debug('%s. Fetching it in full.', e)
+			return self.request(url = url, method = method, data = data, callback = callback)
+
+	def read_prefix(self, response, required, tail,
+					chunk_size = 16 * 1024):
+		"""
+		Reads a streamed response until PrefixReader stops, then drops the
+		rest of the download
+		"""
+		reader = PrefixReader(required = required, tail = tail)
+		for chunk in response.iter_content(chunk_size = chunk_size):
+			if reader.feed(chunk):
+				break
+		response.close()
+
+		if reader.done:
+			self.logger.debug('Stopped reading <%s> after %d bytes', response.url, reader.bytes_read)
+		return RawResponse(
+			url = response.url,
+			status_code = response.status_code,
+			content = reader.content,
+			headers = response.headers,
+			encoding = response.encoding,
+			truncated = reader.done
+		)
+
+	def wait_for_host(self, host):
+		"""
+		Blocks until the rate limiter allows another request to host
+		"""
+		if self.rate_limiter is None:
+			return 0
+		return self.rate_limiter.acquire(host)
+
+	def retry_delay(self, url, response, attempt,
+					retry = True):
+		"""
+		Reports a response to the rate limiter and returns seconds to wait
+		before retrying, or None if the response should be kept
+		+ A response of None means the connection failed
+		+ Without retry the response is only reported
+		"""
+		status_code = response.status_code if response is not None else None
+		retry_after = None
+		if response is not None:
+			for name, value in response.headers.items():
+				if name.lower() == 'retry-after':
+					retry_after = parse_retry_after(value)
+
+		if self.rate_limiter is not None:
+			self.rate_limiter.update(host = url.host, status_code = status_code, retry_after = retry_after)
+
+		if not retry:
+			return None
+		if response is not None and status_code not in self.retry_statuses:
+			return None
+		if attempt >= self.max_retries:
+			return None
+		return backoff_delay(
+			attempt = attempt,
+			base = self.backoff_base,
+			cap = self.backoff_cap,
+			retry_after = retry_after
 		)
 
+	def check_cache(self, method, url):
+		"""
+		Returns (cached response, fresh) or (None, False) without a cache
+		"""
+		if self.cache is None:
+			return None, False
+		return self.cache.get(method = method, url = url)
+
+	def update_cache(self, method, url, response, cached = None):
+		"""
+		Stores a fresh response, or swaps in the cached copy on 304 Not Modified
+		"""
+		if self.cache is None or getattr(response, 'truncated', False):
+			return response
+		if response.status_code == 304 and cached is not None:
+			self.logger.debug('Cached response for %s revalidated', url)
+			self.cache.revalidate(method = method, url = url)
+			return cached
+		self.cache.store(method = method, url = url, response = response)
+		return response
+
+	def archive_response(self, method, url, response):
+		"""
+		Appends a fetched page to the archive, if one is attached
+		+ Only successful GETs are kept; pages cut short by a prefix read are
+		left out
+		"""
+		if self.archive is None or method != 'GET' or response.status_code != 200 or getattr(response, 'truncated', False):
+			return
+		self.archive.append(method = method, url = url, response = response)
+
+	def cache_stats(self):
+		"""
+		Hit/miss counts of the attached cache
+		"""
+		if self.cache is None:
+			return None
+		stats = self.cache.stats()
+		self.logger.debug(f'Cache stats: {stats}')
+		return stats
+
+	def handle_response(self, response, method, callback = None):
+		"""
+		Checks status code and runs the parser callback
+		"""
 		# Check response code
 		try:
 			assert response.status_code == 200
 		except AssertionError:
-			self.logger.debug(f'Request {method} returned non-200 status code. Cannot parse search results.')
+			self.logger.debug('Request %s returned non-200 status code. Cannot parse search results.', method)
 			return None, response.status_code
 
 		# Get callback
 		if callback:
-			parsed = callback(response = response, logger = self.logger)
+			parsed = self.run_callback(response = response, callback = callback)
 			return parsed, response.status_code
 		else:
 			return response, response.status_code
 
+	def run_callback(self, response, callback):
+		"""
+		Runs the parser callback here, or in the parse pool when one is attached
+		+ With a parse memo, a page parsed before is not parsed again
+		"""
+		parsed = self.memo_get(response = response, callback = callback)
+		if parsed is not None:
+			return parsed
+
+		if self.parse_pool is None or getattr(callback, 'retains_tree', False):
+			parsed = callback(response = response, logger = self.logger)
+		else:
+			self.logger.debug('Handing <%s> to parse pool', response.url)
+			parsed = self.parse_pool.parse(callback, response)
+
+		self.memo_store(response = response, callback = callback, parsed = parsed)
+		return parsed
+
+	def memo_get(self, response, callback):
+		"""
+		Memoized parse of an unchanged page, or None
+		"""
+		if self.parse_memo is None:
+			return None
+		parsed = self.parse_memo.get(callback, response)
+		if parsed is not None:
+			self.logger.debug('Parse of <%s> memoized', response.url)
+		return parsed
+
+	def memo_store(self, response, callback, parsed):
+		if self.parse_memo is not None:
+			self.parse_memo.store(callback, response, parsed)
+
 	def login(self, 
 			  url = 'https://www.goodreads.com/user/sign_in', 
 			  userfield = 'user[email]',
@@ -189,11 +442,14 @@ class Goodreads():
 	def search_api(self, search_term,
 				   search_field = 'all',
 				   page = 1,
+				   with_meta = False,
 				   url_scheme = 'https',
 				   url_host = 'www.goodreads.com',
 				   url_path = '/search.xml'):
 		"""
 		Search GoodReads API by book title, author, or ISBN
+		+ With with_meta, returns {'meta' : ..., 'books' : [...]} so callers can
+		see results_end and total_results
 		"""
 		url_query = {
 			'q' : search_term,
@@ -209,9 +465,13 @@ class Goodreads():
 			url_query = url_query
 		)
 
-		return self.request(url = url, callback = parse_search_api)
+		callback = parse_search_api_page if with_meta else parse_search_api
+		return self.request(url = url, callback = callback)
 
 	def lookup(self, gr_book_id,
+			   fields = None,
+			   lazy = False,
+			   stream = False,
 			   url_scheme = 'https',
 			   url_host = 'www.goodreads.com',
 			   url_path = '/book/show'):
@@ -220,6 +480,11 @@ class Goodreads():
 		+ Some more information about book genres is returned when logged
 		in. A more limited list of genres is returned when not logged in.
 		Otherwise, everything else should be the same.
+		+ With fields, only those fields are parsed (see LOOKUP_FIELDS)
+		+ With lazy, returns a Book whose fields are parsed on first access.
+		Lazy pages are always parsed in this process and never memoized.
+		+ With stream, the download stops at the community reviews, which
+		come after every section that is parsed
 		"""
 		url = self.build_url(
 			url_scheme = url_scheme,
@@ -227,7 +492,100 @@ class Goodreads():
 			url_path = f'{url_path}/{gr_book_id}'
 		)
 
-		return self.request(url = url, callback = parse_lookup)
+		book, status_code = self.request(url = url, callback = self.lookup_callback(fields = fields, lazy = lazy),
+										 prefix = (PREFIX_REQUIRED, PREFIX_TAIL) if stream else None)
+		if lazy and book is not None:
+			book = Book.from_data(book)
+		return book, status_code
+
+	def lookup_callback(self, fields = None, lazy = False):
+		"""
+		Parser for lookup(); partial parsers are plain functions so they can
+		still be sent to a parse pool
+		"""
+		if lazy:
+			return parse_lookup_lazy
+		if fields is not None:
+			check_lookup_fields(fields) # Before the request is made
+			return functools.partial(parse_lookup, fields = tuple(fields))
+		return parse_lookup
+
+	def lookup_many(self, gr_book_ids,
+					fields = None,
+					stream = False,
+					max_workers = 5,
+					saved_dir = None,
+					save = False,
+					writer = None):
+		"""
+		Looks up many books at once
+		+ Duplicate ids are requested once; ids are compared as strings
+		+ Books already saved in saved_dir by Book.save are loaded from disk
+		instead of requested, and fresh pages in the response cache never
+		reach the network
+		+ With save, newly fetched books are saved to saved_dir, or appended to
+		writer (a ShardWriter) when one is given
+		+ With fields, only those fields are parsed from fetched pages; books
+		loaded from saved_dir keep all their fields
+		+ Returns (books, failures): books maps id to book dict in first-seen
+		order, failures maps id to the status code of the failed request
+		"""
+		books, to_fetch = self.load_saved_books(gr_book_ids, saved_dir = saved_dir)
+		failures = {}
+
+		with ThreadPoolExecutor(max_workers = max_workers) as executor:
+			futures = {gr_book_id : executor.submit(self.lookup, gr_book_id, fields = fields, stream = stream) for gr_book_id in to_fetch}
+			for gr_book_id, future in futures.items():
+				try:
+					book, status_code = future.result()
+				except Exception as e:
+					self.logger.debug(f'Lookup of {gr_book_id} raised {e!r}')
+					book, status_code = None, None
+				self.collect_lookup(gr_book_id, book, status_code, books, failures,
+									saved_dir = saved_dir, save = save, writer = writer)
+
+		self.logger.debug(f'Looked up {len(books)} books, {len(to_fetch)} requested, {len(failures)} failed')
+		return books, failures
+
+	def load_saved_books(self, gr_book_ids, saved_dir = None):
+		"""
+		Dedupes ids and loads any already saved in saved_dir
+		+ Returns (books, to_fetch): books holds a slot for every id in
+		first-seen order, to_fetch lists the ids still to be requested
+		"""
+		books = collections.OrderedDict()
+		to_fetch = []
+		for gr_book_id in gr_book_ids:
+			gr_book_id = str(gr_book_id)
+			if gr_book_id in books:
+				continue
+			books[gr_book_id] = None
+
+			if saved_dir is not None:
+				book = Book()
+				if book.load(pathlib.Path(saved_dir).joinpath(gr_book_id).with_suffix('.json')):
+					books[gr_book_id] = book.data
+					continue
+			to_fetch.append(gr_book_id)
+
+		return books, to_fetch
+
+	def collect_lookup(self, gr_book_id, book, status_code, books, failures,
+					   saved_dir = None,
+					   save = False,
+					   writer = None):
+		"""
+		Files one lookup result under books or failures
+		"""
+		if book is None:
+			books.pop(gr_book_id)
+			failures[gr_book_id] = status_code
+			return
+		books[gr_book_id] = book
+		if save and writer is not None:
+			Book.from_data(book).save_to(writer)
+		elif save and saved_dir is not None:
+			Book(**book).save(saved_dir)
 
 	def similar(self, similar_url,
 				url_scheme = 'https',
@@ -271,21 +629,178 @@ class Goodreads():
 						max_page = 25,
 						url_scheme = 'https',
 						url_host = 'www.goodreads.com',
-						url_path = '/shelf/show'):
+						url_path = '/shelf/show',
+						window = 1,
+						stop_early = False):
 		"""
 		Loop through shelf pages and return one big shelf
+		+ With window > 1, a sliding window of that many pages is requested
+		at once; pages are merged back in page order
+		+ With stop_early, no more pages are requested once a page comes back
+		with no books or a non-200 status, and later pages are dropped
+		"""
+		results = {}
+		last_page = max_page
+		next_page = start_page
+		in_flight = {}
+
+		with ThreadPoolExecutor(max_workers = window) as executor:
+			while in_flight or next_page <= last_page:
+				# Keep the window full
+				while next_page <= last_page and len(in_flight) < window:
+					future = executor.submit(self.shelf, genre = genre, page = next_page,
+											 url_scheme = url_scheme, url_host = url_host, url_path = url_path)
+					in_flight[future] = next_page
+					next_page += 1
+
+				done, _ = wait(in_flight, return_when = FIRST_COMPLETED)
+				for future in done:
+					page_num = in_flight.pop(future)
+					results[page_num] = future.result()
+					if stop_early and page_num < last_page and self.is_shelf_end(page_num, *results[page_num]):
+						self.logger.debug(f'Shelf {genre} ended at page {page_num}')
+						last_page = page_num
+
+				# Drop requests for pages past the end that have not started
+				for future, page_num in list(in_flight.items()):
+					if page_num > last_page and future.cancel():
+						in_flight.pop(future)
+
+		return self.merge_shelf_pages(results = results, last_page = last_page)
+
+	def is_shelf_end(self, page_num, shelf, status_code):
+		"""
+		A failed or empty shelf page means there are no pages after it
+		"""
+		if status_code != 200 or not shelf:
+			return True
+		return not shelf['pages'][page_num]['books']
+
+	def merge_shelf_pages(self, results, last_page):
+		"""
+		Merges {page_num : (shelf, status_code)} into one shelf in page order
 		"""
 		shelves = None
 		status_codes = []
 
-		for page_num in range(start_page, max_page+1):
+		for page_num in sorted(results):
+			if page_num > last_page:
+				continue
+			shelf, status_code = results[page_num]
 
-			shelf, status_code = self.shelf(genre = genre, page = page_num)
+			if shelf:
+				if not shelves:
+					shelves = shelf
+				else:
+					shelves['pages'][page_num] = shelf['pages'][page_num]
+			status_codes.append(status_code)
+
+		return shelves, status_codes
+
+	def is_search_end(self, meta):
+		"""
+		True if a search page holds the last of the total results
+		"""
+		try:
+			return meta['results_end'] >= meta['total_results']
+		except (KeyError, TypeError):
+			return False
+
+	def iter_pages(self, fetch,
+				   start_page = 1,
+				   max_page = None,
+				   prefetch = 0):
+		"""
+		Yields (page_num, parsed, status_code) for consecutive pages in order
+		+ fetch(page_num) makes one page request, e.g. a bound shelf()
+		+ prefetch pages are requested ahead in background threads while the
+		caller works on the current one
+		+ Without max_page, pages continue until the caller stops iterating
+		"""
+		if max_page is None:
+			pages = itertools.count(start_page)
+		else:
+			pages = iter(range(start_page, max_page+1))
 
-			if not shelves:
-				shelves = shelf
+		executor = ThreadPoolExecutor(max_workers = prefetch + 1)
+		queue = collections.deque()
+		try:
+			for page_num in itertools.islice(pages, prefetch + 1):
+				queue.append((page_num, executor.submit(fetch, page_num)))
+
+			while queue:
+				page_num, future = queue.popleft()
+				parsed, status_code = future.result()
+				yield page_num, parsed, status_code
+
+				page_num = next(pages, None)
+				if page_num is not None:
+					queue.append((page_num, executor.submit(fetch, page_num)))
+		finally:
+			executor.shutdown(wait = False, cancel_futures = True)
+
+	def iter_shelf(self, genre,
+				   start_page = 1,
+				   max_page = 25,
+				   by_book = False,
+				   prefetch = 0,
+				   url_scheme = 'https',
+				   url_host = 'www.goodreads.com',
+				   url_path = '/shelf/show'):
+		"""
+		Yields (page_num, shelf) for each shelf page as soon as it is parsed
+		+ Each shelf holds a single page, so it can be saved or merged on its own
+		+ With by_book, yields (page_num, book) for every book instead
+		+ Stops at the first empty or failed page; resume an interrupted run
+		with start_page set to the last page_num seen (plus one if that page
+		was fully processed)
+		"""
+		def fetch(page_num):
+			return self.shelf(genre = genre, page = page_num,
+							  url_scheme = url_scheme, url_host = url_host, url_path = url_path)
+
+		for page_num, shelf, status_code in self.iter_pages(fetch, start_page = start_page, max_page = max_page, prefetch = prefetch):
+			if self.is_shelf_end(page_num, shelf, status_code):
+				self.logger.debug(f'Shelf {genre} ended at page {page_num} ({status_code})')
+				return
+
+			if by_book:
+				for book in shelf['pages'][page_num]['books']:
+					yield page_num, book
 			else:
-				shelves['pages'][page_num] = shelf['pages'][page_num]
-			status_codes.append(status_code)
+				yield page_num, shelf
+
+	def iter_search(self, search_term,
+					search_field = 'all',
+					start_page = 1,
+					max_page = None,
+					by_book = False,
+					prefetch = 0,
+					url_scheme = 'https',
+					url_host = 'www.goodreads.com',
+					url_path = '/search.xml'):
+		"""
+		Yields (page_num, books) for each page of search results as soon as
+		it is parsed
+		+ With by_book, yields (page_num, book) for every book instead
+		+ Stops after the page holding the last result, or at the first empty
+		or failed page; resume with start_page
+		"""
+		def fetch(page_num):
+			return self.search_api(search_term = search_term, search_field = search_field, page = page_num, with_meta = True,
+								   url_scheme = url_scheme, url_host = url_host, url_path = url_path)
+
+		for page_num, page, status_code in self.iter_pages(fetch, start_page = start_page, max_page = max_page, prefetch = prefetch):
+			if status_code != 200 or not page or not page['books']:
+				self.logger.debug(f'Search {search_term} ended at page {page_num} ({status_code})')
+				return
+
+			if by_book:
+				for book in page['books']:
+					yield page_num, book
+			else:
+				yield page_num, page['books']
 
-		return shelves, status_codes
\ No newline at end of file
+			if self.is_search_end(page['meta']):
+				self.logger.debug(f'Search {search_term} ended at page {page_num} (last page)')
+				return
@@ -0,0 +1,184 @@
+import sys
+import time
+import zlib
+import pickle
+import sqlite3
+import hashlib
+import pathlib
+import datetime
+import threading
+
+from yarl import URL
+
+# Keys refreshed on every hit, as they describe the fetch rather than the page
+SOURCE_KEYS = ('source',)
+DATETIME_KEYS = ('accessed_datetime', 'accesed_date')
+
+class ParseMemo():
+	"""
+	Memo of parser results keyed by the content of the page
+	+ Keys are a hash of the response body, the parser name and its module's
+	PARSER_VERSION, and the url without the OAuth `key` param (parsers read
+	ids and page numbers from the url)
+	+ Only parsers whose module sets PARSER_VERSION are memoized; bump it
+	whenever a parser's output changes so old results are not reused
+	+ On a hit the stored result is returned with source and accessed date
+	fields refreshed, so unchanged pages cost a hash instead of a parse
+	+ Results are pickled, so every hit is a fresh copy callers may modify
+	+ In memory by default; give cache_dir to keep results between runs
+	+ At most max_entries results are kept; least recently used go first
+	+ Safe to share across Dispatcher threads
+	"""
+	def __init__(self,
+				 cache_dir:str = None,
+				 filename:str = 'parsed.sqlite',
+				 max_entries:int = 100000):
+		if cache_dir is None:
+			self.path = ':memory:'
+		else:
+			pathlib.Path(cache_dir).mkdir(parents = True, exist_ok = True)
+			self.path = str(pathlib.Path(cache_dir).joinpath(filename))
+		self.max_entries = max_entries
+
+		self.lock = threading.Lock()
+		self.conn = sqlite3.connect(self.path, check_same_thread = False)
+		self.conn.execute('PRAGMA journal_mode=WAL')
+		self.conn.execute("""
+			CREATE TABLE IF NOT EXISTS parsed (
+				key         TEXT PRIMARY KEY,
+				parser      TEXT,
+				result      BLOB,
+				accessed_at REAL
+			)
+		""")
+		self.conn.execute('CREATE INDEX IF NOT EXISTS parsed_accessed ON parsed (accessed_at)')
+		self.conn.commit()
+
+		self.entries = self.conn.execute('SELECT COUNT(*) FROM parsed').fetchone()[0]
+		self.counts = {
+			'hits'    : 0,
+			'misses'  : 0,
+			'stored'  : 0,
+			'evicted' : 0
+		}
+
+	def parser_version(self, callback):
+		"""
+		PARSER_VERSION of the callback's module, or None if not memoizable
+		+ Partial parsers (e.g. lookup with fields) and parsers whose results
+		hold the page tree are not memoized
+		"""
+		if not hasattr(callback, '__qualname__') or getattr(callback, 'retains_tree', False):
+			return None
+		module = sys.modules.get(getattr(callback, '__module__', None))
+		return getattr(module, 'PARSER_VERSION', None)
+
+	def make_key(self, callback, response):
+		"""
+		Hash of body, parser name and version, and url without the OAuth key
+		"""
+		version = self.parser_version(callback)
+		if version is None:
+			return None
+
+		url = URL(str(response.url))
+		url = url.with_query([(k, v) for k, v in url.query.items() if k != 'key'])
+
+		digest = hashlib.blake2b(response.content, digest_size = 16)
+		digest.update(f'{callback.__module__}.{callback.__qualname__}:{version} {url}'.encode('utf-8'))
+		return digest.hexdigest()
+
+	def get(self, callback, response):
+		"""
+		Returns the memoized result with volatile fields refreshed, or None
+		"""
+		key = self.make_key(callback, response)
+		if key is None:
+			return None
+
+		with self.lock:
+			row = self.conn.execute('SELECT result FROM parsed WHERE key = ?', (key,)).fetchone()
+			if row is None:
+				self.counts['misses'] += 1
+				return None
+			self.conn.execute('UPDATE parsed SET accessed_at = ? WHERE key = ?', (time.time(), key))
+			self.conn.commit()
+			self.counts['hits'] += 1
+
+		parsed = pickle.loads(zlib.decompress(row[0]))
+		return refresh_volatile(parsed, source = response.url, accessed = str(datetime.datetime.now()))
+
+	def store(self, callback, response, parsed):
+		"""
+		Memoizes a parser result, evicting old entries if over max_entries
+		"""
+		key = self.make_key(callback, response)
+		if key is None or parsed is None:
+			return False
+
+		result = zlib.compress(pickle.dumps(parsed, protocol = pickle.HIGHEST_PROTOCOL), 1)
+		with self.lock:
+			exists = self.conn.execute('SELECT 1 FROM parsed WHERE key = ?', (key,)).fetchone()
+			self.conn.execute(
+				'INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?)',
+				(key, callback.__qualname__, result, time.time())
+			)
+			if not exists:
+				self.entries += 1
+			self.counts['stored'] += 1
+			self._evict()
+			self.conn.commit()
+		return True
+
+	def _evict(self):
+		"""
+		Drops least recently used entries until at max_entries
+		+ Caller must hold the lock
+		"""
+		excess = self.entries - self.max_entries
+		if excess <= 0:
+			return
+		self.conn.execute(
+			'DELETE FROM parsed WHERE key IN (SELECT key FROM parsed ORDER BY accessed_at LIMIT ?)',
+			(excess,)
+		)
+		self.entries -= excess
+		self.counts['evicted'] += excess
+
+	def stats(self):
+		"""
+		Hit/miss counts for this process plus current entry count
+		"""
+		with self.lock:
+			stats = dict(self.counts)
+		stats['entries'] = self.entries
+		lookups = stats['hits'] + stats['misses']
+		stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+		return stats
+
+	def clear(self):
+		with self.lock:
+			self.conn.execute('DELETE FROM parsed')
+			self.conn.commit()
+			self.entries = 0
+
+	def close(self):
+		with self.lock:
+			self.conn.close()
+
+def refresh_volatile(parsed, source, accessed):
+	"""
+	Sets source and accessed date fields anywhere in a parsed result
+	"""
+	if isinstance(parsed, dict):
+		for k, v in parsed.items():
+			if k in SOURCE_KEYS:
+				parsed[k] = source
+			elif k in DATETIME_KEYS:
+				parsed[k] = accessed
+			else:
+				refresh_volatile(v, source, accessed)
+	elif isinstance(parsed, list):
+		for v in parsed:
+			refresh_volatile(v, source, accessed)
+	return parsed
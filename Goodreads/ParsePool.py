@@ -0,0 +1,70 @@
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from network.RawResponse import RawResponse
+from parsers import backends
+
+def _init_worker(backend):
+	"""
+	Runs once in each worker process
+	"""
+	if backend is not None:
+		backends.set_backend(backend)
+
+def _parse(callback, response):
+	"""
+	Runs a parser callback inside a worker process
+	+ Worker processes have no client logger, so parsers log to the root logger
+	"""
+	return callback(response = response, logger = None)
+
+class ParsePool():
+	"""
+	Process pool that runs parser callbacks off the network threads
+	+ Fetching threads hand over the raw body and url as a RawResponse and
+	get the parsed result back through a Future, so BeautifulSoup parsing
+	no longer competes with the I/O threads for the GIL
+	+ Callbacks must be module-level functions, like those in parsers/, so
+	they can be pickled
+	+ Workers use the given backend, or the backend of the current process
+	+ Share one ParsePool between clients (Dispatcher(parse_workers = n)
+	does this) and close() it when done
+	"""
+	def __init__(self, max_workers:int = None,
+				 backend:str = None):
+		self.max_workers = max_workers or os.cpu_count() or 1
+		self.backend = backend or backends.get_backend()
+		self.executor = ProcessPoolExecutor(
+			max_workers = self.max_workers,
+			initializer = _init_worker,
+			initargs = (self.backend,)
+		)
+		logging.debug(f'Started parse pool of {self.max_workers} {self.backend} workers')
+
+	def submit(self, callback, response):
+		"""
+		Schedules callback(response) in a worker and returns its Future
+		+ requests.Response objects are copied to a RawResponse, which is
+		cheaper to send to another process
+		"""
+		if not isinstance(response, RawResponse):
+			response = RawResponse.from_response(response)
+		return self.executor.submit(_parse, callback, response)
+
+	def parse(self, callback, response):
+		"""
+		Parses in a worker and waits for the result
+		+ The calling thread releases the GIL while it waits, so other
+		threads keep fetching
+		"""
+		return self.submit(callback, response).result()
+
+	def close(self, wait:bool = True):
+		self.executor.shutdown(wait = wait, cancel_futures = not wait)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self.close()
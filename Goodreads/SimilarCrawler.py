@@ -0,0 +1,225 @@
+import os
+import json
+import heapq
+import pathlib
+import logging
+
+from Goodreads import Goodreads
+
+class IdBitmap():
+	"""
+	Compact set of non-negative integer ids, one bit per id
+	+ Goodreads book ids are dense integers, so a few hundred million ids
+	fit in tens of megabytes
+	"""
+	def __init__(self, data:bytes = b''):
+		self.bits = bytearray(data)
+		self.count = int.from_bytes(self.bits, 'little').bit_count()
+
+	def add(self, i:int):
+		byte = i >> 3
+		if byte >= len(self.bits):
+			self.bits.extend(bytes(max(byte + 1, 2 * len(self.bits)) - len(self.bits)))
+		mask = 1 << (i & 7)
+		if not self.bits[byte] & mask:
+			self.bits[byte] |= mask
+			self.count += 1
+
+	def __contains__(self, i:int):
+		byte = i >> 3
+		return byte < len(self.bits) and bool(self.bits[byte] & (1 << (i & 7)))
+
+	def __len__(self):
+		return self.count
+
+	def to_bytes(self):
+		return bytes(self.bits)
+
+class SimilarCrawler():
+	"""
+	Walks the similar-books graph outward from seed books
+	+ order = 'bfs' visits books by depth; order = 'best' visits books linked
+	from the most rated books first (a book's own rating count is only known
+	after its lookup, so neighbours inherit the rating_count of the book
+	that linked to them)
+	+ Books are looked up in concurrent batches with Goodreads.lookup_many;
+	already saved books in save_dir are read from disk instead
+	+ Every discovered id is recorded in an IdBitmap so no book is queued twice
+	+ The frontier and visited set are checkpointed every checkpoint_every
+	books, and a new crawler with the same checkpoint_path resumes from there.
+	A checkpoint written with another order, or for other seeds, raises a
+	ValueError instead of being resumed; pass a checkpoint_path per crawl.
+	+ Only the blocking Goodreads client is supported
+	"""
+	def __init__(self, client:Goodreads,
+				 order:str = 'bfs',
+				 max_depth:int = 3,
+				 max_nodes:int = 10000,
+				 batch_size:int = 10,
+				 full_similar:bool = False,
+				 save_dir:str = None,
+				 on_book = None,
+				 checkpoint_path:str = './crawl/checkpoint.json',
+				 checkpoint_every:int = 100):
+		if order not in ('bfs', 'best'):
+			raise ValueError(f'Crawl order {order} not recognized')
+
+		self.client = client
+		self.order = order
+		self.max_depth = max_depth
+		self.max_nodes = max_nodes
+		self.batch_size = batch_size
+		self.full_similar = full_similar
+		self.save_dir = save_dir
+		self.on_book = on_book
+		self.checkpoint_path = pathlib.Path(checkpoint_path)
+		self.checkpoint_every = checkpoint_every
+
+		self.frontier = []
+		self.visited = IdBitmap()
+		self.seeds = []
+		self.resumed = False
+		self.seq = 0
+		self.processed = 0
+		self.failed = []
+		self.last_checkpoint = 0
+
+		if self.checkpoint_path.exists():
+			self.load_checkpoint()
+
+	def push(self, gr_book_id, depth:int, priority:float):
+		"""
+		Queues a book unless it has been seen before
+		"""
+		gr_book_id = int(gr_book_id)
+		if gr_book_id in self.visited:
+			return False
+		self.visited.add(gr_book_id)
+		heapq.heappush(self.frontier, (priority, self.seq, gr_book_id, depth))
+		self.seq += 1
+		return True
+
+	def seed(self, gr_book_ids):
+		"""
+		Queues starting books at depth 0
+		+ After resuming, the first call must pass the checkpoint's seeds
+		"""
+		gr_book_ids = [int(gr_book_id) for gr_book_id in gr_book_ids]
+		if self.resumed:
+			if sorted(set(gr_book_ids)) != self.seeds:
+				raise ValueError(f'Checkpoint {self.checkpoint_path} was written for seeds {self.seeds}, not {sorted(set(gr_book_ids))}')
+			self.resumed = False
+			return
+		self.seeds = sorted(set(self.seeds + gr_book_ids))
+		for gr_book_id in gr_book_ids:
+			self.push(gr_book_id, depth = 0, priority = 0 if self.order == 'bfs' else -float(2**53))
+
+	def expand(self, book, depth:int):
+		"""
+		Queues the neighbours of a looked up book
+		"""
+		neighbours = list(book.get('similar_book_ids') or [])
+		if self.full_similar and book.get('full_similar_link'):
+			similar_ids, _ = self.client.similar(book['full_similar_link'])
+			neighbours += similar_ids or []
+
+		if self.order == 'bfs':
+			priority = depth + 1
+		else:
+			priority = -(book.get('rating_count') or 0)
+
+		for gr_book_id in neighbours:
+			try:
+				self.push(gr_book_id, depth = depth + 1, priority = priority)
+			except ValueError: # Malformed id
+				continue
+
+	def crawl(self):
+		"""
+		Crawls until the frontier is empty or max_nodes books are processed
+		+ Returns the number of books processed, including earlier runs
+		"""
+		while self.frontier and self.processed < self.max_nodes:
+			size = min(self.batch_size, len(self.frontier), self.max_nodes - self.processed)
+			batch = [heapq.heappop(self.frontier) for _ in range(size)]
+
+			books, _ = self.client.lookup_many(
+				[gr_book_id for _, _, gr_book_id, _ in batch],
+				max_workers = self.batch_size,
+				saved_dir = self.save_dir,
+				save = self.save_dir is not None
+			)
+
+			for _, _, gr_book_id, depth in batch:
+				self.processed += 1
+				book = books.get(str(gr_book_id))
+				if book is None:
+					self.failed.append(gr_book_id)
+					continue
+				if self.on_book:
+					self.on_book(book, depth)
+				if depth < self.max_depth:
+					self.expand(book, depth)
+
+			if self.processed - self.last_checkpoint >= self.checkpoint_every:
+				self.save_checkpoint()
+
+		self.save_checkpoint()
+		logging.debug(f'Crawl stopped after {self.processed} books with {len(self.frontier)} queued')
+		return self.processed
+
+	def save_checkpoint(self):
+		"""
+		Atomically writes the frontier, counters, and visited bitmap
+		"""
+		self.checkpoint_path.parent.mkdir(parents = True, exist_ok = True)
+		bitmap_path = self.checkpoint_path.with_suffix('.bitmap')
+
+		state = {
+			'order'     : self.order,
+			'seeds'     : self.seeds,
+			'frontier'  : self.frontier,
+			'seq'       : self.seq,
+			'processed' : self.processed,
+			'failed'    : self.failed
+		}
+		tmp_path = self.checkpoint_path.with_suffix('.json.tmp')
+		with open(tmp_path, 'w') as f:
+			json.dump(obj = state, fp = f)
+		os.replace(tmp_path, self.checkpoint_path)
+
+		# Bitmap goes second, so a crash in between can only re-queue books, never lose them
+		tmp_path = bitmap_path.with_suffix('.bitmap.tmp')
+		with open(tmp_path, 'wb') as f:
+			f.write(self.visited.to_bytes())
+		os.replace(tmp_path, bitmap_path)
+
+		self.last_checkpoint = self.processed
+		logging.debug(f'Crawl checkpoint at {self.processed} books written to {self.checkpoint_path}')
+
+	def load_checkpoint(self):
+		"""
+		Restores crawl state written by save_checkpoint
+		"""
+		with open(self.checkpoint_path, 'r') as f:
+			state = json.load(f)
+		if state.get('order') != self.order:
+			# Depth and rating priorities cannot share one frontier
+			raise ValueError(f"Checkpoint {self.checkpoint_path} was written by a {state.get('order')!r} crawl, not {self.order!r}")
+		try:
+			with open(self.checkpoint_path.with_suffix('.bitmap'), 'rb') as f:
+				self.visited = IdBitmap(f.read())
+		except FileNotFoundError:
+			self.visited = IdBitmap()
+
+		self.frontier = [tuple(entry) for entry in state['frontier']]
+		heapq.heapify(self.frontier)
+		for _, _, gr_book_id, _ in self.frontier: # Bitmap may be older than the frontier
+			self.visited.add(gr_book_id)
+		self.seeds = state.get('seeds', [])
+		self.resumed = True
+		self.seq = state['seq']
+		self.processed = state['processed']
+		self.failed = state['failed']
+		self.last_checkpoint = self.processed
+		logging.debug(f'Resumed crawl from {self.checkpoint_path} at {self.processed} books')
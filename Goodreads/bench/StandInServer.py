@@ -0,0 +1,151 @@
+import sys
+import time
+import random
+import pathlib
+import logging
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from bench.make_fixtures import FIXTURE_DIR, make_fixtures
+
+class StandInHandler(BaseHTTPRequestHandler):
+	"""
+	Serves fixtures for the Goodreads endpoints the client uses
+	+ Accepts both plain paths and the absolute urls sent to an http proxy,
+	so clients can reach it either directly or through sess.proxies
+	"""
+	protocol_version = 'HTTP/1.1' # Keep-alive, as on the live site
+
+	routes = {
+		'/book/show'    : ('book_show.html', 'text/html; charset=utf-8'),
+		'/book/similar' : ('book_similar.html', 'text/html; charset=utf-8'),
+		'/shelf/show'   : ('shelf_show.html', 'text/html; charset=utf-8'),
+		'/search.xml'   : ('search.xml', 'application/xml; charset=utf-8'),
+		'/user/sign_in' : ('user_sign_in.html', 'text/html; charset=utf-8'),
+	}
+
+	def do_GET(self):
+		config = self.server.config
+		url = urllib.parse.urlsplit(self.path)
+		query = urllib.parse.parse_qs(url.query)
+		self.server.count_request()
+
+		# Latency is drawn uniformly around the configured mean
+		latency = config['latency'] * random.uniform(1 - config['jitter'], 1 + config['jitter'])
+		if latency > 0:
+			time.sleep(latency)
+
+		draw = random.random()
+		if draw < config['throttle_rate']:
+			self.send_body(429, b'Too Many Requests', 'text/plain', {'Retry-After' : str(config['retry_after'])})
+			return
+		if draw < config['throttle_rate'] + config['error_rate']:
+			self.send_body(503, b'Service Unavailable', 'text/plain')
+			return
+
+		route = next((prefix for prefix in self.routes if url.path.startswith(prefix)), None)
+		if route is None:
+			self.send_body(404, b'Not Found', 'text/plain')
+			return
+
+		filename, content_type = self.routes[route]
+		if route == '/shelf/show':
+			page = int(query.get('page', ['1'])[0])
+			if page > config['shelf_pages']:
+				filename = 'shelf_show_empty.html'
+		self.send_body(200, self.server.fixtures[filename], content_type)
+
+	def send_body(self, status_code, body, content_type, headers = None):
+		self.send_response(status_code)
+		self.send_header('Content-Type', content_type)
+		self.send_header('Content-Length', str(len(body)))
+		for name, value in (headers or {}).items():
+			self.send_header(name, value)
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		logging.debug('StandInServer: ' + format, *args)
+
+class StandInServer(ThreadingHTTPServer):
+	"""
+	Local stand-in for www.goodreads.com used for offline load tests
+	+ latency: mean seconds before each response (jitter is the +/- fraction)
+	+ error_rate: share of requests answered with 503
+	+ throttle_rate: share of requests answered with 429 and Retry-After
+	+ shelf_pages: shelf pages past this one come back without books
+	+ Run with `with StandInServer() as server:`; the server listens on a
+	free port in a background thread, and server.proxies routes a
+	requests.Session through it
+	"""
+	daemon_threads = True
+
+	def __init__(self,
+				 host:str = '127.0.0.1',
+				 port:int = 0,
+				 fixture_dir = FIXTURE_DIR,
+				 latency:float = 0.05,
+				 jitter:float = 0.5,
+				 error_rate:float = 0.0,
+				 throttle_rate:float = 0.0,
+				 retry_after:float = 1,
+				 shelf_pages:int = 25):
+		super().__init__((host, port), StandInHandler)
+		self.config = {
+			'latency'       : latency,
+			'jitter'        : jitter,
+			'error_rate'    : error_rate,
+			'throttle_rate' : throttle_rate,
+			'retry_after'   : retry_after,
+			'shelf_pages'   : shelf_pages
+		}
+
+		make_fixtures(fixture_dir)
+		self.fixtures = {}
+		for filename, _ in list(StandInHandler.routes.values()) + [('shelf_show_empty.html', None)]:
+			with open(pathlib.Path(fixture_dir).joinpath(filename), 'rb') as f:
+				self.fixtures[filename] = f.read()
+
+		self.requests_served = 0
+		self.count_lock = threading.Lock()
+		self.thread = None
+
+	@property
+	def url(self):
+		host, port = self.server_address[:2]
+		return f'http://{host}:{port}'
+
+	@property
+	def proxies(self):
+		"""
+		Proxy settings that send a session's http:// requests here
+		"""
+		return {'http' : self.url}
+
+	def handle_error(self, request, client_address):
+		"""
+		Clients that stop reading early (streamed lookups) drop the connection
+		"""
+		if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+			return
+		super().handle_error(request, client_address)
+
+	def count_request(self):
+		with self.count_lock:
+			self.requests_served += 1
+
+	def start(self):
+		self.thread = threading.Thread(target = self.serve_forever, daemon = True)
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.shutdown()
+		self.server_close()
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, exc_type, exc, tb):
+		self.stop()
@@ -0,0 +1 @@
+pass
\ No newline at end of file
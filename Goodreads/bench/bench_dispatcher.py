@@ -0,0 +1,172 @@
+"""
+Throughput benchmark of Dispatcher against the local StandInServer
++ Run from the Goodreads directory:
+	python -m bench.bench_dispatcher --threads 1 4 16 --jobs 400
++ The server runs in its own process so its CPU use does not count against
+the client. Clients reach it by sending http:// Goodreads urls through it
+as a proxy.
++ Reports requests/sec, p50/p99 request latency, and the share of client
+CPU time spent inside parser callbacks
++ With --parse-workers, parsing moves to a ParsePool and parse cpu is not
+measured, since it is spent in the worker processes
+"""
+
+import time
+import logging
+import contextlib
+import argparse
+import threading
+import statistics
+import multiprocessing
+
+import Goodreads as goodreads_module
+from Goodreads import Goodreads
+from Dispatcher import Dispatcher
+from bench.StandInServer import StandInServer
+
+PARSERS = ['parse_lookup', 'parse_shelf', 'parse_similar', 'parse_search_api']
+
+def serve(config, port_queue):
+	"""
+	Runs a StandInServer until the process is terminated
+	"""
+	server = StandInServer(**config)
+	port_queue.put(server.server_address[1])
+	server.serve_forever()
+
+def job_mix(num_jobs):
+	"""
+	Lookups dominate, as in a book survey run, with some shelf, similar, and search jobs
+	"""
+	jobs = []
+	for i in range(num_jobs):
+		kind = i % 10
+		if kind < 6:
+			jobs.append(('lookup', {'gr_book_id' : 1000 + i, 'url_scheme' : 'http'}))
+		elif kind < 8:
+			jobs.append(('shelf', {'genre' : 'fantasy', 'page' : i % 25 + 1, 'url_scheme' : 'http'}))
+		elif kind < 9:
+			jobs.append(('similar', {'similar_url' : f'http://www.goodreads.com/book/similar/{i}-book'}))
+		else:
+			jobs.append(('search_api', {'search_term' : 'harry potter', 'page' : i % 5 + 1, 'url_scheme' : 'http'}))
+	return jobs
+
+class ParseTimer():
+	"""
+	Wraps the parser callbacks used by Goodreads to sum their CPU time
+	"""
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.cpu_seconds = 0.0
+		self.originals = {}
+
+	def wrap(self, parser):
+		def timed(*args, **kwargs):
+			start = time.thread_time()
+			try:
+				return parser(*args, **kwargs)
+			finally:
+				with self.lock:
+					self.cpu_seconds += time.thread_time() - start
+		return timed
+
+	def __enter__(self):
+		for name in PARSERS:
+			self.originals[name] = getattr(goodreads_module, name)
+			setattr(goodreads_module, name, self.wrap(self.originals[name]))
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		for name, parser in self.originals.items():
+			setattr(goodreads_module, name, parser)
+
+def run(proxy_url, threads, jobs, max_retries = 3, parse_workers = 0):
+	"""
+	Pushes every job through a Dispatcher with the given number of threads
+	"""
+	# Raw throughput against the stand-in, so no client-side rate limit
+	dispatcher = Dispatcher(max_threads = threads, share_pool = True, parse_workers = parse_workers, rate_limiter = False)
+	latencies = []
+	statuses = []
+
+	def record(response, *args, **kwargs):
+		latencies.append(response.elapsed.total_seconds())
+		statuses.append(response.status_code)
+
+	for i in range(threads):
+		client_id = f'bench_{threads}_{i}'
+		dispatcher.add_client(client = Goodreads, client_id = client_id, log = 'bench',
+							  max_retries = max_retries, backoff_base = 0.05, queue_logging = True)
+		client = dispatcher.clients[client_id]['client_obj']
+		client.sess.proxies = {'http' : proxy_url}
+		client.sess.hooks['response'].append(record)
+		client.oauth_key = 'bench'
+
+	# Timed wrappers are closures, which cannot be sent to parse workers
+	timer = ParseTimer()
+	with (timer if not parse_workers else contextlib.nullcontext()):
+		cpu_start = time.process_time()
+		wall_start = time.perf_counter()
+		futures = [dispatcher.submit_job(job = job, **kwargs) for job, kwargs in jobs]
+		failed = sum(1 for future in futures if future.result()[0] is None)
+		wall = time.perf_counter() - wall_start
+		cpu = time.process_time() - cpu_start
+
+	dispatcher.shutdown(wait = True)
+
+	percentiles = statistics.quantiles(latencies, n = 100) if len(latencies) > 1 else [0.0] * 99
+	return {
+		'threads'     : threads,
+		'parsers'     : parse_workers,
+		'jobs'        : len(jobs),
+		'requests'    : len(latencies),
+		'failed_jobs' : failed,
+		'throttled'   : sum(1 for status in statuses if status == 429),
+		'wall_s'      : wall,
+		'req_per_s'   : len(latencies) / wall if wall else 0.0,
+		'p50_ms'      : percentiles[49] * 1000,
+		'p99_ms'      : percentiles[98] * 1000,
+		'parse_cpu'   : timer.cpu_seconds / cpu if cpu else 0.0
+	}
+
+def report(results):
+	print(f'{"threads":>7} {"parsers":>7} {"jobs":>6} {"reqs":>6} {"failed":>6} {"429s":>5} {"wall s":>7} {"req/s":>8} {"p50 ms":>7} {"p99 ms":>7} {"parse cpu":>9}')
+	for r in results:
+		print(f'{r["threads"]:>7} {r["parsers"]:>7} {r["jobs"]:>6} {r["requests"]:>6} {r["failed_jobs"]:>6} {r["throttled"]:>5} '
+			  f'{r["wall_s"]:>7.2f} {r["req_per_s"]:>8.1f} {r["p50_ms"]:>7.1f} {r["p99_ms"]:>7.1f} {r["parse_cpu"]:>8.1%}')
+
+def main():
+	parser = argparse.ArgumentParser(description = 'Offline Dispatcher throughput benchmark')
+	parser.add_argument('--threads', type = int, nargs = '+', default = [1, 2, 4, 8, 16])
+	parser.add_argument('--jobs', type = int, default = 200)
+	parser.add_argument('--latency', type = float, default = 0.05)
+	parser.add_argument('--error-rate', type = float, default = 0.0)
+	parser.add_argument('--throttle-rate', type = float, default = 0.0)
+	parser.add_argument('--retry-after', type = float, default = 0.1)
+	parser.add_argument('--max-retries', type = int, default = 3)
+	parser.add_argument('--parse-workers', type = int, default = 0, help = 'parser processes; 0 parses on the fetching threads')
+	args = parser.parse_args()
+
+	config = {
+		'latency'       : args.latency,
+		'error_rate'    : args.error_rate,
+		'throttle_rate' : args.throttle_rate,
+		'retry_after'   : args.retry_after
+	}
+	port_queue = multiprocessing.Queue()
+	server = multiprocessing.Process(target = serve, args = (config, port_queue), daemon = True)
+	server.start()
+	proxy_url = f'http://127.0.0.1:{port_queue.get(timeout = 30)}'
+
+	try:
+		jobs = job_mix(args.jobs)
+		results = [run(proxy_url, threads, jobs, max_retries = args.max_retries, parse_workers = args.parse_workers)
+				   for threads in args.threads]
+	finally:
+		server.terminate()
+
+	report(results)
+
+if __name__ == '__main__':
+	logging.getLogger().addHandler(logging.NullHandler())
+	main()
@@ -0,0 +1,232 @@
+"""
+Microbenchmark of the page parsers
++ Run from the Goodreads directory:
+	python -m bench.bench_parsers [--pages DIR ...] [--update-baseline]
++ Every parser runs over small, medium, and large pages built by
+make_fixtures, plus any recorded pages in the given directories, with each
+installed backend
++ Reports time per page, peak traced memory while parsing, and the memory
+blocks still held by the parsed result. Python keeps no running count of
+allocations, so retained blocks stand in for it.
++ Each page is also timed through a bare html.parser BeautifulSoup build
+in the same process, and parse times are gated as a ratio to it, so a
+faster or slower host does not move the gate; milliseconds are only
+reported
++ Results are compared with bench/parser_baseline.json and the run exits
+with status 1 if any page is slower or uses more memory than the baseline
+allows. --update-baseline rewrites the baseline from this run.
++ The backend parity check (bench/parity.py) runs first over the same
+pages, and any mismatch also fails the run, so a parser change cannot make
+the backends drift apart unnoticed. --skip-parity leaves it out.
+"""
+
+import gc
+import sys
+import json
+import time
+import pathlib
+import argparse
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from network.RawResponse import RawResponse
+from parsers import backends
+from bench import make_fixtures as fixtures
+from bench.parity import PAGE_TYPES, corpus, check
+
+BASELINE_PATH = pathlib.Path(__file__).parent.joinpath('parser_baseline.json')
+
+# Page type -> {size : builder}
+SIZES = {
+	'book_show'    : {
+		'small'  : lambda: fixtures.book_show(num_reviews = 5),
+		'medium' : lambda: fixtures.book_show(num_reviews = 30),
+		'large'  : lambda: fixtures.book_show(num_reviews = 200)
+	},
+	'shelf_show'   : {
+		'small'  : lambda: fixtures.shelf_show(num_books = 10),
+		'medium' : lambda: fixtures.shelf_show(num_books = 50),
+		'large'  : lambda: fixtures.shelf_show(num_books = 200)
+	},
+	'book_similar' : {
+		'small'  : lambda: fixtures.book_similar(num_books = 10),
+		'medium' : lambda: fixtures.book_similar(num_books = 30),
+		'large'  : lambda: fixtures.book_similar(num_books = 100)
+	},
+	'search'       : {
+		'small'  : lambda: fixtures.search_xml(num_works = 5),
+		'medium' : lambda: fixtures.search_xml(num_works = 20),
+		'large'  : lambda: fixtures.search_xml(num_works = 200)
+	},
+}
+
+def pages(directories = ()):
+	"""
+	Yields (name, parser, response) for built and recorded pages
+	"""
+	for kind, sizes in SIZES.items():
+		parser, url = PAGE_TYPES[kind]
+		for size, build in sizes.items():
+			content = build().encode('utf-8')
+			yield f'{kind}/{size}', parser, RawResponse(url = url, content = content)
+
+	for path, parser, url in corpus(directories):
+		with open(path, 'rb') as f:
+			yield f'recorded/{path.name}', parser, RawResponse(url = url, content = f.read())
+
+def time_parser(parser, response, min_time = 0.2, repeat = 3):
+	"""
+	Best mean seconds per parse over repeat runs of at least min_time each
+	"""
+	best = None
+	for _ in range(repeat):
+		count = 0
+		start = time.perf_counter()
+		while True:
+			parser(response = response)
+			count += 1
+			elapsed = time.perf_counter() - start
+			if elapsed >= min_time:
+				break
+		per_page = elapsed / count
+		best = per_page if best is None else min(best, per_page)
+	return best
+
+def calibrate(response, min_time = 0.2):
+	"""
+	Seconds per bare html.parser soup build of a page, the yardstick parse
+	times are divided by
+	+ Only bs4 runs, so a change to the repo's parsers cannot move it
+	"""
+	return time_parser(lambda response: BeautifulSoup(response.content, 'html.parser'), response, min_time = min_time)
+
+def trace_parser(parser, response):
+	"""
+	Returns (peak KiB traced while parsing, blocks held by the result)
+	"""
+	gc.collect()
+	tracemalloc.start()
+	try:
+		before = tracemalloc.take_snapshot()
+		tracemalloc.reset_peak()
+		base, _ = tracemalloc.get_traced_memory()
+		parsed = parser(response = response)
+		_, peak = tracemalloc.get_traced_memory()
+		gc.collect() # Soup trees are cycles, freed only by the collector
+		after = tracemalloc.take_snapshot()
+	finally:
+		tracemalloc.stop()
+
+	# Leave out the first snapshot, which is itself traced
+	own = [tracemalloc.Filter(False, tracemalloc.__file__)]
+	stats = after.filter_traces(own).compare_to(before.filter_traces(own), 'filename')
+	retained = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+	del parsed
+	return (peak - base) / 1024, retained
+
+def run(directories = (), min_time = 0.2):
+	"""
+	Measures every page with every installed backend
+	+ Returns {'<page>/<backend>' : {ms_per_page, time_ratio, peak_kb,
+	retained_blocks, kb}}; time_ratio is ms_per_page over the page's
+	calibration time
+	"""
+	installed = [name for name in backends.BACKENDS if backends.set_backend(name) == name]
+	results = {}
+	try:
+		for name, parser, response in pages(directories):
+			calibration = calibrate(response, min_time = min_time)
+			for backend in installed:
+				backends.set_backend(backend)
+				parser(response = response) # Warm up caches so they are not counted
+				peak_kb, retained = trace_parser(parser, response)
+				per_page = time_parser(parser, response, min_time = min_time)
+				results[f'{name}/{backend}'] = {
+					'kb'              : len(response.content) / 1024,
+					'ms_per_page'     : per_page * 1000,
+					'time_ratio'      : per_page / calibration,
+					'peak_kb'         : peak_kb,
+					'retained_blocks' : retained
+				}
+	finally:
+		backends.set_backend('html.parser')
+	return results
+
+def compare(results, baseline, time_tolerance = 0.5, memory_tolerance = 0.1):
+	"""
+	Returns a list of (key, metric, baseline, result) past the tolerances
+	+ Time is checked as time_ratio, never as milliseconds, which depend on
+	the host
+	+ Time varies more between runs than memory, so it is allowed more slack
+	+ A small absolute allowance keeps tiny pages from failing on noise
+	+ Pages or metrics missing from the baseline are not checked
+	"""
+	limits = {
+		'time_ratio'      : (time_tolerance, 0.05),
+		'peak_kb'         : (memory_tolerance, 16),
+		'retained_blocks' : (memory_tolerance, 16)
+	}
+	regressions = []
+	for key, result in results.items():
+		if key not in baseline:
+			continue
+		for metric, (tolerance, allowance) in limits.items():
+			if metric not in baseline[key]:
+				continue
+			if result[metric] > baseline[key][metric] * (1 + tolerance) + allowance:
+				regressions.append((key, metric, baseline[key][metric], result[metric]))
+	return regressions
+
+def report(results, baseline):
+	print(f'{"page":<36} {"KiB":>7} {"ms/page":>9} {"ratio":>7} {"base":>7} {"peak KiB":>9} {"retained":>9}')
+	for key, r in results.items():
+		base = baseline.get(key, {}).get('time_ratio')
+		base = f'{base:>7.2f}' if base is not None else f'{"-":>7}'
+		print(f'{key:<36} {r["kb"]:>7.1f} {r["ms_per_page"]:>9.2f} {r["time_ratio"]:>7.2f} {base} {r["peak_kb"]:>9.0f} {r["retained_blocks"]:>9}')
+
+def main():
+	parser = argparse.ArgumentParser(description = 'Parser microbenchmark')
+	parser.add_argument('--pages', nargs = '*', default = [], help = 'directories of recorded pages')
+	parser.add_argument('--min-time', type = float, default = 0.2, help = 'seconds each timing run lasts')
+	parser.add_argument('--time-tolerance', type = float, default = 0.5)
+	parser.add_argument('--memory-tolerance', type = float, default = 0.1)
+	parser.add_argument('--baseline', default = str(BASELINE_PATH))
+	parser.add_argument('--update-baseline', action = 'store_true')
+	parser.add_argument('--skip-parity', action = 'store_true', help = 'do not check backend parity first')
+	args = parser.parse_args()
+
+	mismatches = []
+	if not args.skip_parity:
+		fixtures.make_fixtures()
+		mismatches = check([fixtures.FIXTURE_DIR] + args.pages)
+
+	baseline = {}
+	if pathlib.Path(args.baseline).exists():
+		with open(args.baseline, 'r') as f:
+			baseline = json.load(f)
+
+	results = run(args.pages, min_time = args.min_time)
+	report(results, baseline)
+
+	if mismatches:
+		print(f'PARITY  {len(mismatches)} backend mismatches; fix them before trusting these timings')
+		sys.exit(1)
+
+	if args.update_baseline:
+		with open(args.baseline, 'w') as f:
+			rounded = {key : {metric : round(value, 3) for metric, value in r.items()} for key, r in results.items()}
+			json.dump(rounded, f, indent = 1, sort_keys = True)
+		print(f'Baseline written to {args.baseline}')
+		return
+
+	regressions = compare(results, baseline,
+						  time_tolerance = args.time_tolerance,
+						  memory_tolerance = args.memory_tolerance)
+	for key, metric, base, result in regressions:
+		print(f'REGRESSION  {key} {metric}: {base:.2f} -> {result:.2f}')
+	if regressions:
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,371 @@
+"""
+Writes the page fixtures served by StandInServer
++ Pages follow the Goodreads layout the parsers were written against. Real
+recorded pages can be dropped into the fixtures directory under the same
+filenames to replace them.
++ Book pages carry a tail of reviews and scripts after the parsed sections,
+as real pages do, so parse cost is representative
+"""
+
+import sys
+import pathlib
+
+FIXTURE_DIR = pathlib.Path(__file__).parent.joinpath('fixtures')
+
+def book_show(num_reviews = 30):
+	authors = ''.join(f"""
+		<div class="authorName__container">
+			<a class="authorName" itemprop="url" href="https://www.goodreads.com/author/show/{1077326 + i}.Author_{i}"><span itemprop="name">Author Number{i}</span></a>{'<span class="authorName greyText smallText role">(Illustrator)</span>' if i else ''}
+		</div>""" for i in range(2))
+
+	genres = ''.join(f"""
+		<div class="elementList ">
+			<div class="left">
+				<a class="actionLinkLite bookPageGenreLink" href="/genres/genre-{i}">Genre {i}</a>
+			</div>
+			<div class="right"><a title="{1000 - i} people shelved this book as &#39;genre-{i}&#39;" class="actionLinkLite greyText bookPageGenreLink" rel="nofollow" href="/shelf/users/3.Title?shelf=genre-{i}">{1000 - i} users</a></div>
+			<div class="clear"></div>
+		</div>""" for i in range(10))
+
+	carousel = ''.join(f"""
+			<li class="cover" id="bookCover{i}">
+				<a href="https://www.goodreads.com/book/show/{100 + i}.Similar_Book_{i}"><img alt="Similar Book {i}" src="https://i.gr-assets.com/images/S/compressed.photo.goodreads.com/books/{100 + i}._SY180_.jpg" /></a>
+			</li>""" for i in range(18))
+
+	reviews = ''.join(f"""
+		<div id="review_{2000000 + i}" class="review" itemprop="reviews" itemscope itemtype="http://schema.org/Review">
+			<div class="left bodycol">
+				<div class="reviewHeader uitext stacked">
+					<a class="reviewDate createdAt right" href="/review/show/{2000000 + i}">Jan {1 + i % 28}, 2019</a>
+					<span itemprop="author"><a title="Reader {i}" class="user" href="/user/show/{500 + i}-reader">Reader {i}</a></span>
+					<span class=" staticStars notranslate" title="it was amazing"><span size="15x15" class="staticStar p10">it was amazing</span></span>
+				</div>
+				<div class="reviewText stacked">
+					<span id="reviewTextContainer{i}" class="readable">
+						<span id="freeTextContainer{i}">{'This book was a delight to read and I would recommend it to anyone. ' * 12}</span>
+					</span>
+				</div>
+				<div class="updateActionLinks">
+					<a class="likeItContainer" href="#">Like</a> &middot; <a href="/review/show/{2000000 + i}#comment_form">comment</a>
+				</div>
+			</div>
+		</div>
+		<script type="text/javascript">
+			//<![CDATA[
+			new ReviewLikes({{"reviewId": {2000000 + i}, "likes": {i * 3}, "liked": false}});
+			//]]>
+		</script>""" for i in range(num_reviews))
+
+	return f"""<!DOCTYPE html>
+<html class="desktop">
+<head>
+	<title>Harry Potter and the Half-Blood Prince (Harry Potter, #6) by J.K. Rowling</title>
+	<meta property="og:title" content="Harry Potter and the Half-Blood Prince (Harry Potter, #6)"/>
+	<script type="text/javascript">
+		var gr = window.gr || {{}}; gr.config = {{"env": "production", "features": [{', '.join(f'"feature_{i}"' for i in range(40))}]}};
+	</script>
+	<link rel="stylesheet" media="all" href="https://s.gr-assets.com/assets/goodreads.css" />
+</head>
+<body>
+<div class="content">
+	<div class="mainContentContainer">
+		<div class="mainContent">
+			<div class="mainContentFloat">
+				<div id="topcol" class="last col">
+					<div class="leftContainer">
+						<div id="imagecol" class="col stacked">
+							<div class="bookCoverContainer">
+								<div class="bookCoverPrimary">
+									<a rel="nofollow" itemprop="image" href="/book/photo/1.Harry_Potter_and_the_Half_Blood_Prince"><img id="coverImage" alt="Harry Potter and the Half-Blood Prince (Harry Potter, #6)" src="https://i.gr-assets.com/images/S/compressed.photo.goodreads.com/books/1587697303l/1._SX318_.jpg" /></a>
+								</div>
+							</div>
+						</div>
+						<div id="metacol" class="last col">
+							<h2 id="bookSeries">
+								<a class="greyText" href="/series/45175-harry-potter">(Harry Potter #6)</a>
+							</h2>
+							<h1 id="bookTitle" class="gr-h1 gr-h1--serif" itemprop="name">
+								Harry Potter and the Half-Blood Prince
+							</h1>
+							<div id="bookAuthors" class="">
+								<span class='by'>by</span>
+								{authors}
+							</div>
+							<div id="bookMeta" itemprop="aggregateRating" itemscope="" itemtype="http://schema.org/AggregateRating">
+								<span itemprop="ratingValue">
+									4.57
+								</span>
+								<a class="gr-hyperlink" href="#other_reviews">
+									<meta itemprop="ratingCount" content="2293963" />
+									2,293,963 ratings
+								</a>
+								<meta itemprop="reviewCount" content="37163" />
+							</div>
+							<div id="description" class="readable stacked">
+								<span id="freeTextContainer">The war against Voldemort is not going well; there is trouble even in the Muggle world.</span>
+							</div>
+							<div id="details" class="uitext darkGreyText">
+								<div class="row"><span itemprop="bookFormat">Paperback</span>, <span itemprop="numberOfPages">652 pages</span></div>
+								<div class="row">
+									Published
+									September 16th 2006
+									by Scholastic Inc.
+									<nobr class="greyText">
+										(first published July 16th 2005)
+									</nobr>
+								</div>
+								<div id="bookDataBox" class="uitext greyText">
+									<div class="clearFloats">
+										<div class="infoBoxRowTitle">Original Title</div>
+										<div class="infoBoxRowItem">Harry Potter and the Half-Blood Prince</div>
+									</div>
+									<div class="clearFloats">
+										<div class="infoBoxRowTitle">ISBN</div>
+										<div class="infoBoxRowItem">
+											0439785960
+											<span class="greyText">(ISBN13: <span itemprop='isbn'>9780439785969</span>)</span>
+										</div>
+									</div>
+									<div class="clearFloats">
+										<div class="infoBoxRowTitle">Edition Language</div>
+										<div class="infoBoxRowItem" itemprop='inLanguage'>English</div>
+									</div>
+									<div class="clearFloats">
+										<div class="infoBoxRowTitle">Series</div>
+										<div class="infoBoxRowItem">
+											<a href="/series/45175-harry-potter">Harry Potter #6</a>
+										</div>
+									</div>
+									<div class="clearFloats">
+										<div class="infoBoxRowTitle">Characters</div>
+										<div class="infoBoxRowItem">
+											<a href="/characters/1-harry-potter">Harry Potter</a>, <a href="/characters/2-ron-weasley">Ron Weasley</a>, <a href="/characters/3-hermione-granger">Hermione Granger</a>, <a href="/characters/4-albus-dumbledore">Albus Dumbledore</a>
+											<a onclick="this.next().toggle(); this.toggle(); return false;" href="#">...more</a>
+										</div>
+									</div>
+								</div>
+							</div>
+						</div>
+					</div>
+				</div>
+				<div class="rightContainer">
+					<div class="h2Container gradientHeaderContainer">
+						<h2 class="brownBackground"><a href="/work/shelves/41335427">Genres</a></h2>
+					</div>
+					<div class="bigBoxBody">
+						<div class="bigBoxContent containerWithHeaderContent">
+							{genres}
+						</div>
+					</div>
+					<div class="h2Container gradientHeaderContainer">
+						<h2 class="brownBackground">Readers also enjoyed</h2>
+					</div>
+					<div class="bookCarousel">
+						<div class="carouselRow" style="width: 2000px;">
+							<ul>{carousel}
+							</ul>
+						</div>
+					</div>
+					<a class="actionLink right seeMoreLink" href="https://www.goodreads.com/book/similar/41335427-harry-potter-and-the-half-blood-prince">See similar books…</a>
+				</div>
+				<div id="bookReviews">
+					<h2 class="gr-h2">Community Reviews</h2>
+					{reviews}
+				</div>
+			</div>
+		</div>
+	</div>
+</div>
+<script type="text/javascript">
+	//<![CDATA[
+	{'window.gr.analytics.push({"event": "pageview", "book": 1});' * 50}
+	//]]>
+</script>
+</body>
+</html>
+"""
+
+def shelf_show(num_books = 50, genre = 'Fantasy'):
+	books = ''.join(f"""
+	<div class="elementList" style="padding-top: 10px;">
+		<div class="left">
+			<a class="leftAlignedImage" title="Book Title {i}" href="/book/show/{3 + i}.Book_Title_{i}"><img alt="Book Title {i}" src="https://i.gr-assets.com/images/S/compressed.photo.goodreads.com/books/{3 + i}._SY75_.jpg" /></a>
+			<a class="bookTitle" href="/book/show/{3 + i}.Book_Title_{i}">Book Title {i} (Series, #{i % 7 + 1})</a>
+			<br>
+			<span class="by">by</span>
+			<span itemprop="author" itemscope="" itemtype="http://schema.org/Person">
+				<div class="authorName__container">
+					<a class="authorName" itemprop="url" href="https://www.goodreads.com/author/show/{900 + i}.Author"><span itemprop="name">Author {i}</span></a>
+				</div>
+			</span>
+			<br>
+			<span class="greyText smallText">
+				avg rating 4.{i % 10}{i % 7} &mdash; {100000 + i * 37} ratings &mdash; published {1950 + i}
+			</span>
+		</div>
+		<div class="right">
+			<a class="smallText" href="/shelf/users/{3 + i}?shelf={genre.lower()}">(shelved {50000 - i * 11} times as {genre.lower()})</a>
+		</div>
+		<div class="clear"></div>
+	</div>""" for i in range(num_books))
+
+	return f"""<!DOCTYPE html>
+<html class="desktop">
+<head>
+	<title>{genre} Books</title>
+	<script type="text/javascript">
+		var gr = window.gr || {{}}; gr.shelf = {{"name": "{genre.lower()}"}};
+	</script>
+</head>
+<body>
+<div class="content">
+	<div class="mainContentContainer">
+		<div class="mainContent">
+			<div class="genreHeader">
+				<h1 class="left">
+					<a href="/genres/{genre.lower()}">Popular {genre} Books</a>
+				</h1>
+			</div>
+			<div class="leftContainer">
+				{books}
+			</div>
+			<div class="rightContainer">
+				{'<div class="ad"><script>googletag.display("ad");</script></div>' * 5}
+			</div>
+		</div>
+	</div>
+</div>
+</body>
+</html>
+"""
+
+def book_similar(num_books = 30):
+	books = ''.join(f"""
+		<div class="u-paddingBottomXSmall">
+			<div class="responsiveBook" itemscope itemtype="http://schema.org/Book">
+				<div class="objectLockupContent">
+					<div class="objectLockupContent__media">
+						<a itemprop="url" href="/book/show/{200 + i}.Similar_Title_{i}"><img alt="Similar Title {i}" src="https://i.gr-assets.com/images/S/compressed.photo.goodreads.com/books/{200 + i}._SX98_.jpg" /></a>
+					</div>
+					<div class="objectLockupContent__main">
+						<a class="gr-h3 gr-h3--serif gr-h3--noMargin" itemprop="url" href="/book/show/{200 + i}.Similar_Title_{i}"><span itemprop="name">Similar Title {i}</span></a>
+						<div class="u-paddingBottomXSmall">by <a class="gr-hyperlink" href="/author/show/{700 + i}.Author">Author {i}</a></div>
+						<div class="communityRating">
+							<span class="communityRating__stars"></span> 4.{i % 10} avg rating &mdash; {2000 + i * 13} ratings
+						</div>
+						<div class="expandableHtml"><span>{'A sweeping tale of adventure. ' * 8}</span></div>
+					</div>
+				</div>
+			</div>
+		</div>""" for i in range(num_books + 1))
+
+	return f"""<!DOCTYPE html>
+<html class="desktop">
+<head>
+	<title>Books similar to Harry Potter and the Half-Blood Prince</title>
+</head>
+<body>
+<div class="content">
+	<div class="mainContentContainer">
+		<div class="mainContent">
+			<h1 class="gr-h1 gr-h1--serif">Readers who enjoyed <a href="/book/show/1">Harry Potter and the Half-Blood Prince</a> also enjoyed</h1>
+			{books}
+		</div>
+	</div>
+</div>
+</body>
+</html>
+"""
+
+def search_xml(num_works = 20, page = 1, total = 1260):
+	start = (page - 1) * 20 + 1
+	works = ''.join(f"""
+      <work>
+        <id type="integer">{41335427 + i}</id>
+        <books_count type="integer">{100 + i}</books_count>
+        <ratings_count type="integer">{2293963 - i * 1000}</ratings_count>
+        <text_reviews_count type="integer">{37163 - i}</text_reviews_count>
+        <original_publication_year type="integer">{1997 + i % 20}</original_publication_year>
+        <original_publication_month type="integer">{1 + i % 12}</original_publication_month>
+        <original_publication_day type="integer">{1 + i % 28}</original_publication_day>
+        <average_rating>4.{50 + i % 50}</average_rating>
+        <best_book type="Book">
+          <id type="integer">{1 + i}</id>
+          <title>Book Result {i}</title>
+          <author>
+            <id type="integer">{1077326 + i}</id>
+            <name>Author {i}</name>
+          </author>
+          <image_url>https://i.gr-assets.com/images/S/compressed.photo.goodreads.com/books/{1 + i}m/{1 + i}.jpg</image_url>
+          <small_image_url>https://i.gr-assets.com/images/S/compressed.photo.goodreads.com/books/{1 + i}s/{1 + i}.jpg</small_image_url>
+        </best_book>
+      </work>""" for i in range(num_works))
+
+	return f"""<?xml version="1.0" encoding="UTF-8"?>
+<GoodreadsResponse>
+  <Request>
+    <authentication>true</authentication>
+      <key><![CDATA[bench]]></key>
+    <method><![CDATA[search_index]]></method>
+  </Request>
+  <search>
+  <query><![CDATA[harry potter]]></query>
+    <results-start>{start}</results-start>
+    <results-end>{start + num_works - 1}</results-end>
+    <total-results>{total}</total-results>
+    <source>Goodreads</source>
+    <query-time-seconds>0.12</query-time-seconds>
+    <results>{works}
+    </results>
+  </search>
+</GoodreadsResponse>
+"""
+
+def user_sign_in():
+	return """<!DOCTYPE html>
+<html class="desktop">
+<head>
+	<title>Sign in</title>
+	<meta name="csrf-token" content="bench-csrf-token" />
+</head>
+<body>
+<div class="content">
+	<form name="sign_in" id="sign_in_form" action="https://www.goodreads.com/user/sign_in?source=home" accept-charset="UTF-8" method="post">
+		<input name="utf8" type="hidden" value="&#x2713;" />
+		<input type="hidden" name="authenticity_token" value="bench-authenticity-token" />
+		<label for="user_email">Email address</label>
+		<input type="email" name="user[email]" id="user_email" />
+		<label for="user_password">Password</label>
+		<input type="password" name="user[password]" id="user_password" />
+		<input type="hidden" name="n" id="n" value="123456" />
+		<input type="submit" name="next" value="Sign in" class="gr-button gr-button--large" />
+	</form>
+</div>
+</body>
+</html>
+"""
+
+FIXTURES = {
+	'book_show.html'        : lambda: book_show(),
+	'shelf_show.html'       : lambda: shelf_show(),
+	'shelf_show_empty.html' : lambda: shelf_show(num_books = 0),
+	'book_similar.html'     : lambda: book_similar(),
+	'search.xml'            : lambda: search_xml(),
+	'user_sign_in.html'     : lambda: user_sign_in(),
+}
+
+def make_fixtures(fixture_dir = FIXTURE_DIR, overwrite = False):
+	"""
+	Writes any missing fixtures, leaving recorded pages in place
+	"""
+	fixture_dir = pathlib.Path(fixture_dir)
+	fixture_dir.mkdir(parents = True, exist_ok = True)
+	for filename, build in FIXTURES.items():
+		path = fixture_dir.joinpath(filename)
+		if path.exists() and not overwrite:
+			continue
+		with open(path, 'w', encoding = 'utf-8') as f:
+			f.write(build())
+
+if __name__ == '__main__':
+	make_fixtures(overwrite = '--overwrite' in sys.argv)
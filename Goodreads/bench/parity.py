@@ -0,0 +1,112 @@
+"""
+Checks that every parser backend returns identical results
++ Run from the Goodreads directory:
+	python -m bench.parity [--pages DIR ...]
++ Every fixture, plus any saved pages in the given directories, is parsed
+with each installed backend and compared with the html.parser result
++ Saved pages are matched to parsers by filename prefix (book_show,
+shelf_show, book_similar, search, user_sign_in)
++ Book pages are also parsed from the prefix a streamed lookup keeps,
+which must match the full page unless the parser rejects the cut (the
+lookup then fetches the page in full)
++ Exits with status 1 on any mismatch
++ bench_parsers runs check() before timing, so parity is gated with the
+benchmark; only the fixtures and given pages are covered, not live pages
+"""
+
+import sys
+import pathlib
+import argparse
+
+from network.RawResponse import RawResponse
+from network.PrefixReader import PrefixReader, PrefixIncomplete
+from parsers import backends
+from parsers.parse_login      import parse_login
+from parsers.parse_search_api import parse_search_api
+from parsers.parse_lookup     import parse_lookup, PREFIX_REQUIRED, PREFIX_TAIL
+from parsers.parse_similar    import parse_similar
+from parsers.parse_shelf      import parse_shelf
+from bench.make_fixtures import FIXTURE_DIR, make_fixtures
+
+# Filename prefix -> (parser, url the page is served from)
+PAGE_TYPES = {
+	'book_show'    : (parse_lookup, 'https://www.goodreads.com/book/show/1.Harry_Potter_and_the_Half_Blood_Prince'),
+	'shelf_show'   : (parse_shelf, 'https://www.goodreads.com/shelf/show/fantasy?page=1'),
+	'book_similar' : (parse_similar, 'https://www.goodreads.com/book/similar/41335427'),
+	'search'       : (parse_search_api, 'https://www.goodreads.com/search.xml?q=harry+potter&page=1'),
+	'user_sign_in' : (parse_login, 'https://www.goodreads.com/user/sign_in'),
+}
+
+# Fields that change on every parse
+VOLATILE = ('accesed_date', 'accessed_datetime')
+
+def strip_volatile(parsed):
+	if isinstance(parsed, dict):
+		return {k : strip_volatile(v) for k, v in parsed.items() if k not in VOLATILE}
+	if isinstance(parsed, list):
+		return [strip_volatile(v) for v in parsed]
+	return parsed
+
+def page_type(path):
+	for prefix in PAGE_TYPES:
+		if path.name.startswith(prefix):
+			return prefix
+	return None
+
+def corpus(directories):
+	"""
+	Yields (path, parser, url) for every recognized page
+	"""
+	for directory in directories:
+		for path in sorted(pathlib.Path(directory).iterdir()):
+			kind = page_type(path)
+			if kind:
+				parser, url = PAGE_TYPES[kind]
+				yield path, parser, url
+
+def check(directories):
+	"""
+	Returns a list of (path, backend) pairs whose output differs
+	"""
+	installed = [name for name in backends.BACKENDS if backends.set_backend(name) == name]
+	mismatches = []
+	for path, parser, url in corpus(directories):
+		with open(path, 'rb') as f:
+			content = f.read()
+
+		results = {}
+		for name in installed:
+			backends.set_backend(name)
+			results[name] = strip_volatile(parser(response = RawResponse(url = url, content = content)))
+
+		if parser is parse_lookup:
+			reader = PrefixReader(required = PREFIX_REQUIRED, tail = PREFIX_TAIL)
+			reader.feed(content)
+			backends.set_backend('html.parser')
+			try:
+				results['prefix'] = strip_volatile(parser(response = RawResponse(url = url, content = reader.content, truncated = reader.done)))
+			except PrefixIncomplete: # A lookup would fetch this page again in full
+				print(f'{"refetch":>8}  {"prefix":<12} {path.name}')
+
+		for name in list(results)[1:]:
+			status = 'ok' if results[name] == results['html.parser'] else 'MISMATCH'
+			print(f'{status:>8}  {name:<12} {path.name}')
+			if status != 'ok':
+				mismatches.append((path, name))
+
+	backends.set_backend('html.parser')
+	return mismatches
+
+def main():
+	parser = argparse.ArgumentParser(description = 'Parser backend parity check')
+	parser.add_argument('--pages', nargs = '*', default = [], help = 'directories of saved pages')
+	args = parser.parse_args()
+
+	make_fixtures()
+	mismatches = check([FIXTURE_DIR] + args.pages)
+	if mismatches:
+		print(f'{len(mismatches)} mismatches')
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
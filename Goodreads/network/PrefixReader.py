@@ -0,0 +1,72 @@
+import re
+
+class PrefixIncomplete(Exception):
+	"""
+	Raised by a parser when a cut body is missing a section it needs, so
+	the page is fetched again in full
+	"""
+
+class PrefixReader():
+	"""
+	Collects a streamed body until the part a parser needs has arrived
+	+ required: regex patterns (bytes or compiled) that must all match
+	before stopping. Anchor them to the tag holding the section, e.g.
+	rb'<div\\b[^>]*\\bid="details"', so a class name in inline CSS or JS
+	does not count.
+	+ tail: patterns that start the unneeded rest of the page; reading
+	stops at the first one after every required match, and the body is cut
+	at the start of the tag holding it
+	+ If a required pattern never matches the whole body is kept, so a page
+	with an unexpected layout parses as it would in full
+	+ Matches longer than overlap bytes may be missed where chunks meet
+	+ Feed chunks in order; feed() returns True once reading can stop
+	"""
+	def __init__(self, required = (), tail = (),
+				 overlap:int = 4096):
+		self.required = tuple(re.compile(pattern) for pattern in required)
+		self.tail = tuple(re.compile(pattern) for pattern in tail)
+		self.overlap = overlap
+
+		self.buffer = bytearray()
+		self.found = {} # required pattern -> end offset of its first match
+		self.cut = None
+
+	@property
+	def done(self):
+		return self.cut is not None
+
+	@property
+	def content(self):
+		if self.cut is None:
+			return bytes(self.buffer)
+		return bytes(self.buffer[:self.cut])
+
+	@property
+	def bytes_read(self):
+		return len(self.buffer)
+
+	def feed(self, chunk):
+		if self.done:
+			return True
+
+		# Matches may straddle chunks, so rescan the end of the previous one
+		start = max(0, len(self.buffer) - self.overlap)
+		self.buffer.extend(chunk)
+
+		for pattern in self.required:
+			if pattern not in self.found:
+				match = pattern.search(self.buffer, start)
+				if match is not None:
+					self.found[pattern] = match.end()
+
+		if len(self.found) < len(self.required):
+			return False
+
+		after = max(self.found.values(), default = 0)
+		for pattern in self.tail:
+			match = pattern.search(self.buffer, max(start, after))
+			if match is not None:
+				tag = self.buffer.rfind(b'<', after, match.start() + 1)
+				self.cut = tag if tag != -1 else match.start()
+				return True
+		return False
@@ -0,0 +1,145 @@
+import time
+import random
+import logging
+import threading
+import email.utils
+
+class TokenBucket():
+	"""
+	Token bucket for a single host
+	+ Tokens refill at `rate` per second up to `burst`
+	+ Reservations may drive the bucket negative, so concurrent callers
+	queue up behind each other instead of all waking at once
+	"""
+	def __init__(self, rate:float, burst:float):
+		self.rate = rate
+		self.burst = burst
+		self.tokens = burst
+		self.updated = time.monotonic()
+		self.blocked_until = 0.0
+		self.last_decrease = 0.0
+
+	def refill(self, now):
+		self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+		self.updated = now
+
+	def reserve(self, now):
+		"""
+		Takes one token and returns the seconds to wait before using it
+		"""
+		self.refill(now)
+		self.tokens -= 1
+		wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+		return max(wait, self.blocked_until - now)
+
+class RateLimiter():
+	"""
+	Adaptive per-host rate limiter
+	+ Each host gets a token bucket starting at `rate` requests per second
+	+ The rate adapts AIMD style: every accepted response adds `increase`
+	requests per second, every throttled response (429/503) multiplies the
+	rate by `decrease`, at most once per `cooldown` seconds
+	+ A Retry-After header pauses the whole host for that long
+	+ One limiter can be shared by all clients hitting the same host
+	"""
+	def __init__(self,
+				 rate:float = 1.0,
+				 burst:float = 5,
+				 min_rate:float = 0.1,
+				 max_rate:float = 10.0,
+				 increase:float = 0.05,
+				 decrease:float = 0.5,
+				 cooldown:float = 1.0,
+				 throttle_statuses:tuple = (429, 503)):
+		self.rate = rate
+		self.burst = burst
+		self.min_rate = min_rate
+		self.max_rate = max_rate
+		self.increase = increase
+		self.decrease = decrease
+		self.cooldown = cooldown
+		self.throttle_statuses = throttle_statuses
+
+		self.lock = threading.Lock()
+		self.buckets = {}
+
+	def get_bucket(self, host):
+		"""
+		Caller must hold the lock
+		"""
+		if host not in self.buckets:
+			self.buckets[host] = TokenBucket(rate = self.rate, burst = self.burst)
+		return self.buckets[host]
+
+	def reserve(self, host):
+		"""
+		Reserves a request slot for host and returns seconds to wait
+		+ Waiting is left to the caller so threads can time.sleep and
+		coroutines can asyncio.sleep
+		"""
+		with self.lock:
+			return self.get_bucket(host).reserve(time.monotonic())
+
+	def acquire(self, host):
+		"""
+		Blocks until a request to host is allowed
+		"""
+		wait = self.reserve(host)
+		if wait > 0:
+			time.sleep(wait)
+		return wait
+
+	def update(self, host, status_code, retry_after = None):
+		"""
+		Adapts the rate of host to an observed response
+		"""
+		now = time.monotonic()
+		with self.lock:
+			bucket = self.get_bucket(host)
+			if retry_after:
+				bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+
+			if status_code in self.throttle_statuses:
+				if now - bucket.last_decrease >= self.cooldown:
+					bucket.refill(now)
+					bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+					bucket.last_decrease = now
+					logging.debug(f'Rate limit for {host} decreased to {bucket.rate:.3f}/s after {status_code}')
+			elif status_code is not None and status_code < 500:
+				bucket.refill(now)
+				bucket.rate = min(self.max_rate, bucket.rate + self.increase)
+
+	def stats(self):
+		"""
+		Current rate in requests per second of each host
+		"""
+		with self.lock:
+			return {host : bucket.rate for host, bucket in self.buckets.items()}
+
+def parse_retry_after(value):
+	"""
+	Seconds to wait from a Retry-After header, given as seconds or an HTTP date
+	"""
+	if not value:
+		return None
+	try:
+		return max(0.0, float(value))
+	except ValueError:
+		pass
+	try:
+		retry_at = email.utils.parsedate_to_datetime(value)
+		return max(0.0, retry_at.timestamp() - time.time())
+	except (TypeError, ValueError):
+		return None
+
+def backoff_delay(attempt:int,
+				  base:float = 1.0,
+				  cap:float = 60.0,
+				  retry_after:float = None):
+	"""
+	Exponential backoff with full jitter, or the server's Retry-After if longer
+	"""
+	delay = random.uniform(0, min(cap, base * 2 ** attempt))
+	if retry_after is not None:
+		delay = max(delay, retry_after)
+	return delay
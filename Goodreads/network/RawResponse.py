@@ -0,0 +1,45 @@
+class RawResponse():
+	"""
+	Minimal stand-in for requests.Response handed to parser callbacks
+	+ Parsers only read url, text, content, and status_code, so any HTTP
+	backend (aiohttp, cache, archive) can wrap its body in this object
+	+ Plain attributes only, so the object pickles cleanly
+	"""
+	def __init__(self, url,
+				 status_code:int = 200,
+				 content:bytes = b'',
+				 headers:dict = None,
+				 encoding:str = None,
+				 truncated:bool = False):
+		self.url = str(url)
+		self.status_code = status_code
+		self.content = content
+		self.headers = dict(headers) if headers else {}
+		self.encoding = encoding
+		self.truncated = truncated # Body is only the prefix a parser needs
+		self._text = None
+
+	@property
+	def text(self):
+		"""
+		Body decoded with the response charset, falling back to utf-8
+		"""
+		if self._text is None:
+			try:
+				self._text = self.content.decode(self.encoding or 'utf-8', errors = 'replace')
+			except LookupError: # Unknown charset from server
+				self._text = self.content.decode('utf-8', errors = 'replace')
+		return self._text
+
+	@classmethod
+	def from_response(cls, response):
+		"""
+		Copies the parts of a requests.Response that parsers rely on
+		"""
+		return cls(
+			url = response.url,
+			status_code = response.status_code,
+			content = response.content,
+			headers = response.headers,
+			encoding = response.encoding
+		)
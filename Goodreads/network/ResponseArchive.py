@@ -0,0 +1,183 @@
+import json
+import time
+import zlib
+import struct
+import pathlib
+import logging
+import threading
+
+from yarl import URL
+
+from network.RawResponse import RawResponse
+
+class ResponseArchive():
+	"""
+	Append-only archive of raw HTTP responses, kept so pages can be parsed
+	again offline after a parser changes
+	+ Responses are written to numbered shard files; a new shard is started
+	once the current one passes shard_bytes
+	+ Each record is compressed on its own, so any record can be read from
+	its (shard, offset, length) entry in the index without the rest
+	+ index.tsv holds one line per record: shard, offset, length, fetched_at,
+	and url. Both files are only ever appended to.
+	+ Safe to share across Dispatcher threads; use one archive per process
+	"""
+	HEADER = struct.Struct('>I') # Byte length of the compressed record
+
+	def __init__(self,
+				 archive_dir:str = './archive',
+				 shard_bytes:int = 256 * 1024 * 1024,
+				 level:int = 6):
+		self.archive_dir = pathlib.Path(archive_dir)
+		self.archive_dir.mkdir(parents = True, exist_ok = True)
+		self.index_path = self.archive_dir.joinpath('index.tsv')
+		self.shard_bytes = shard_bytes
+		self.level = level
+
+		self.lock = threading.Lock()
+		shards = sorted(self.archive_dir.glob('shard-*.bin'))
+		self.shard = int(shards[-1].stem.split('-')[1]) if shards else 0
+		self.shard_file = None
+		self.index_file = None
+		self.counts = {
+			'archived' : 0,
+			'bytes'    : 0
+		}
+
+	def shard_path(self, shard):
+		return self.archive_dir.joinpath(f'shard-{shard:05d}.bin')
+
+	def append(self, method, url, response):
+		"""
+		Archives a response and returns its (shard, offset, length)
+		+ Indexed under the response url, which parsers read, rather than the
+		requested url, which may have redirected
+		"""
+		header = {
+			'method'      : method,
+			'request_url' : str(url),
+			'url'         : str(response.url),
+			'status_code' : response.status_code,
+			'headers'     : dict(response.headers),
+			'encoding'    : response.encoding,
+			'fetched_at'  : time.time()
+		}
+		record = zlib.compress(json.dumps(header).encode('utf-8') + b'\n' + response.content, self.level)
+
+		with self.lock:
+			self.open_shard()
+			offset = self.shard_file.tell()
+			self.shard_file.write(self.HEADER.pack(len(record)) + record)
+			self.shard_file.flush()
+
+			length = self.HEADER.size + len(record)
+			self.index_file.write(f'{self.shard}\t{offset}\t{length}\t{header["fetched_at"]:.3f}\t{header["url"]}\n')
+			self.index_file.flush()
+			self.counts['archived'] += 1
+			self.counts['bytes'] += length
+		return self.shard, offset, length
+
+	def open_shard(self):
+		"""
+		Opens the current shard for appending, rolling over to a new one when full
+		+ Caller must hold the lock
+		"""
+		if self.index_file is None:
+			self.index_file = open(self.index_path, 'a', encoding = 'utf-8')
+
+		if self.shard_file is not None and self.shard_file.tell() >= self.shard_bytes:
+			self.shard_file.close()
+			self.shard_file = None
+			self.shard += 1
+		if self.shard_file is None:
+			path = self.shard_path(self.shard)
+			if path.exists() and path.stat().st_size >= self.shard_bytes: # Full shard from an earlier run
+				self.shard += 1
+				path = self.shard_path(self.shard)
+			self.shard_file = open(path, 'ab')
+			logging.debug(f'Archiving responses to {path}')
+
+	def entries(self, path_prefix:str = None, latest:bool = False):
+		"""
+		Index entries as dicts of shard, offset, length, fetched_at, and url
+		+ path_prefix keeps urls under one endpoint, e.g. '/book/show'
+		+ With latest, only the most recent entry of each url is kept
+		"""
+		if not self.index_path.exists():
+			return []
+
+		entries = []
+		with open(self.index_path, 'r', encoding = 'utf-8') as f:
+			for line in f:
+				try:
+					shard, offset, length, fetched_at, url = line.rstrip('\n').split('\t', 4)
+				except ValueError: # Line cut short by a crash while writing
+					continue
+				if path_prefix is not None and not URL(url).path.startswith(path_prefix):
+					continue
+				entries.append({
+					'shard'      : int(shard),
+					'offset'     : int(offset),
+					'length'     : int(length),
+					'fetched_at' : float(fetched_at),
+					'url'        : url
+				})
+
+		if latest:
+			entries = list({entry['url'] : entry for entry in entries}.values())
+		return entries
+
+	def read(self, entry, f = None):
+		"""
+		Reads one archived response as a RawResponse
+		+ Pass an open shard file to avoid reopening it for every record
+		"""
+		if f is None:
+			with open(self.shard_path(entry['shard']), 'rb') as f:
+				return self.read(entry, f)
+
+		f.seek(entry['offset'])
+		data = f.read(entry['length'])
+		(size,) = self.HEADER.unpack_from(data)
+		header, content = zlib.decompress(data[self.HEADER.size:self.HEADER.size + size]).split(b'\n', 1)
+		header = json.loads(header)
+		return RawResponse(
+			url = header['url'],
+			status_code = header['status_code'],
+			content = content,
+			headers = header['headers'],
+			encoding = header['encoding']
+		)
+
+	def iter_responses(self, entries = None):
+		"""
+		Yields (entry, RawResponse) in archive order
+		"""
+		if entries is None:
+			entries = self.entries()
+
+		f = None
+		shard = None
+		try:
+			for entry in sorted(entries, key = lambda entry: (entry['shard'], entry['offset'])):
+				if entry['shard'] != shard:
+					if f is not None:
+						f.close()
+					shard = entry['shard']
+					f = open(self.shard_path(shard), 'rb')
+				yield entry, self.read(entry, f)
+		finally:
+			if f is not None:
+				f.close()
+
+	def stats(self):
+		with self.lock:
+			return dict(self.counts, shard = self.shard)
+
+	def close(self):
+		with self.lock:
+			for f in (self.shard_file, self.index_file):
+				if f is not None:
+					f.close()
+			self.shard_file = None
+			self.index_file = None
@@ -0,0 +1,220 @@
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import pathlib
+import logging
+import threading
+
+from yarl import URL
+
+from network.RawResponse import RawResponse
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache():
+	"""
+	Persistent on-disk cache of raw HTTP responses
+	+ Entries are keyed by method and url, ignoring the OAuth `key` query
+	param so the cache is shared across keys and clients
+	+ Each endpoint (url path prefix) has its own time-to-live in seconds;
+	endpoints without a ttl are never cached
+	+ Total stored size is bounded; least recently used entries are evicted
+	+ Stale entries carrying an ETag or Last-Modified header are revalidated
+	with a conditional request instead of being refetched
+	+ Safe to share across Dispatcher threads
+	"""
+	def __init__(self,
+				 cache_dir:str = './cache',
+				 filename:str = 'responses.sqlite',
+				 max_bytes:int = 512 * 1024 * 1024,
+				 ttls:dict = {
+					 '/book/show'    : 7 * 24 * 60 * 60,
+					 '/book/similar' : 7 * 24 * 60 * 60,
+					 '/shelf/show'   : 24 * 60 * 60,
+					 '/search.xml'   : 24 * 60 * 60
+				 },
+				 default_ttl:int = 0):
+		pathlib.Path(cache_dir).mkdir(parents = True, exist_ok = True)
+		self.path = pathlib.Path(cache_dir).joinpath(filename)
+		self.max_bytes = max_bytes
+		self.ttls = dict(ttls)
+		self.default_ttl = default_ttl
+
+		self.lock = threading.Lock()
+		self.conn = sqlite3.connect(str(self.path), check_same_thread = False)
+		self.conn.execute('PRAGMA journal_mode=WAL')
+		self.conn.execute("""
+			CREATE TABLE IF NOT EXISTS responses (
+				key         TEXT PRIMARY KEY,
+				url         TEXT,
+				status_code INTEGER,
+				headers     TEXT,
+				encoding    TEXT,
+				content     BLOB,
+				size        INTEGER,
+				stored_at   REAL,
+				accessed_at REAL
+			)
+		""")
+		self.conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)')
+		self.conn.commit()
+
+		self.total_bytes = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+		self.counts = {
+			'hits'        : 0,
+			'misses'      : 0,
+			'stale'       : 0,
+			'revalidated' : 0,
+			'stored'      : 0,
+			'evicted'     : 0
+		}
+
+	def make_key(self, method, url):
+		"""
+		Hash of method and url without the OAuth key
+		"""
+		url = URL(str(url))
+		query = [(k, v) for k, v in url.query.items() if k != 'key']
+		url = url.with_query(query)
+		return hashlib.sha1(f'{method} {url}'.encode('utf-8')).hexdigest()
+
+	def get_ttl(self, url):
+		"""
+		Time-to-live of the longest endpoint prefix matching the url path
+		"""
+		path = URL(str(url)).path
+		matches = [prefix for prefix in self.ttls if path.startswith(prefix)]
+		if not matches:
+			return self.default_ttl
+		return self.ttls[max(matches, key = len)]
+
+	def is_cacheable(self, method, url):
+		return method == 'GET' and self.get_ttl(url) > 0
+
+	def get(self, method, url):
+		"""
+		Returns (response, fresh) for a cached url, or (None, False)
+		+ A stale response is still returned so the caller can revalidate it
+		"""
+		if not self.is_cacheable(method, url):
+			return None, False
+
+		key = self.make_key(method, url)
+		now = time.time()
+		with self.lock:
+			row = self.conn.execute(
+				'SELECT url, status_code, headers, encoding, content, stored_at FROM responses WHERE key = ?',
+				(key,)
+			).fetchone()
+			if row is None:
+				self.counts['misses'] += 1
+				return None, False
+
+			self.conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+			self.conn.commit()
+
+			fresh = (now - row[5]) < self.get_ttl(url)
+			if fresh:
+				self.counts['hits'] += 1
+			else:
+				self.counts['stale'] += 1
+
+		response = RawResponse(
+			url = row[0],
+			status_code = row[1],
+			headers = json.loads(row[2]),
+			encoding = row[3],
+			content = zlib.decompress(row[4])
+		)
+		return response, fresh
+
+	def validators(self, response):
+		"""
+		Conditional request headers for a stale cached response
+		"""
+		headers = {}
+		for name, value in response.headers.items():
+			if name.lower() == 'etag':
+				headers['If-None-Match'] = value
+			elif name.lower() == 'last-modified':
+				headers['If-Modified-Since'] = value
+		return headers
+
+	def revalidate(self, method, url):
+		"""
+		Marks a cached response as fresh again after a 304 Not Modified
+		"""
+		key = self.make_key(method, url)
+		with self.lock:
+			self.conn.execute('UPDATE responses SET stored_at = ? WHERE key = ?', (time.time(), key))
+			self.conn.commit()
+			self.counts['revalidated'] += 1
+
+	def store(self, method, url, response):
+		"""
+		Stores a successful response, evicting old entries if over max_bytes
+		"""
+		if not self.is_cacheable(method, url) or response.status_code != 200:
+			return False
+
+		key = self.make_key(method, url)
+		content = zlib.compress(response.content, 1)
+		now = time.time()
+		with self.lock:
+			old = self.conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+			if old:
+				self.total_bytes -= old[0]
+			self.conn.execute(
+				'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+				(key, str(response.url), response.status_code, json.dumps(dict(response.headers)),
+				 response.encoding, content, len(content), now, now)
+			)
+			self.total_bytes += len(content)
+			self.counts['stored'] += 1
+			self._evict()
+			self.conn.commit()
+		return True
+
+	def _evict(self):
+		"""
+		Drops least recently used entries until under max_bytes
+		+ Caller must hold the lock
+		"""
+		while self.total_bytes > self.max_bytes:
+			rows = self.conn.execute(
+				'SELECT key, size FROM responses ORDER BY accessed_at LIMIT 64'
+			).fetchall()
+			if not rows:
+				self.total_bytes = 0
+				break
+			for key, size in rows:
+				self.conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+				self.total_bytes -= size
+				self.counts['evicted'] += 1
+				if self.total_bytes <= self.max_bytes:
+					break
+			logger.debug('Response cache at %d bytes after eviction', self.total_bytes)
+
+	def stats(self):
+		"""
+		Hit/miss counts for this process plus current cache size
+		"""
+		with self.lock:
+			stats = dict(self.counts)
+			stats['entries'] = self.conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+		stats['bytes'] = self.total_bytes
+		lookups = stats['hits'] + stats['misses'] + stats['stale']
+		stats['hit_rate'] = (stats['hits'] + stats['revalidated']) / lookups if lookups else 0.0
+		return stats
+
+	def clear(self):
+		with self.lock:
+			self.conn.execute('DELETE FROM responses')
+			self.conn.commit()
+			self.total_bytes = 0
+
+	def close(self):
+		with self.lock:
+			self.conn.close()
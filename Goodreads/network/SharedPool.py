@@ -0,0 +1,50 @@
+from requests.adapters import HTTPAdapter
+
+class SharedPool():
+	"""
+	Connection pool shared by several requests.Session objects
+	+ Each session keeps its own cookies and headers but mounts the same
+	adapters, so keep-alive connections and TLS sessions are reused across
+	clients instead of every client opening its own pool
+	+ host_pool_sizes gives selected hosts a dedicated pool of their own size;
+	every other host uses the default pool of pool_maxsize connections
+	+ urllib3 pools are thread-safe, so one SharedPool can back all
+	Dispatcher workers
+	"""
+	def __init__(self,
+				 pool_maxsize:int = 10,
+				 pool_connections:int = 10,
+				 host_pool_sizes:dict = None,
+				 pool_block:bool = True):
+		self.default_adapter = HTTPAdapter(
+			pool_connections = pool_connections,
+			pool_maxsize = pool_maxsize,
+			pool_block = pool_block
+		)
+		self.host_adapters = {}
+		for host, size in (host_pool_sizes or {}).items():
+			self.host_adapters[host] = HTTPAdapter(
+				pool_connections = 1,
+				pool_maxsize = size,
+				pool_block = pool_block
+			)
+
+	def mount(self, session):
+		"""
+		Routes all of a session's connections through the shared adapters
+		+ requests picks the longest matching prefix, so host adapters win
+		over the default adapter
+		"""
+		for scheme in ('https://', 'http://'):
+			session.mount(scheme, self.default_adapter)
+			for host, adapter in self.host_adapters.items():
+				session.mount(f'{scheme}{host}/', adapter)
+		return session
+
+	def close(self):
+		"""
+		Closes every pooled connection
+		"""
+		self.default_adapter.close()
+		for adapter in self.host_adapters.values():
+			adapter.close()
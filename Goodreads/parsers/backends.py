@@ -0,0 +1,61 @@
+"""
+Parser backend shared by every parser
++ 'html.parser' is the pure-Python builder the parsers were written with
++ 'lxml' builds the same BeautifulSoup tree with the C lxml builder, and
+reads search API XML with lxml.etree
++ Choose with set_backend() or the GOODREADS_PARSER_BACKEND environment
+variable, which also reaches parser worker processes
++ Only the tree builder and XML reader change; the parsers walk the same
+tree either way, so lxml is about 1.1-1.7x faster on book pages, not more
++ bench/parity.py checks that all backends return identical dicts, and
+bench/bench_parsers.py runs that check before every benchmark
+"""
+
+import os
+import logging
+import xml.etree.ElementTree as ET # Core library
+
+from bs4 import BeautifulSoup
+
+try:
+	from lxml import etree as lxml_etree
+except ImportError:
+	lxml_etree = None
+
+BACKENDS = ('html.parser', 'lxml')
+
+def _available(name):
+	return name == 'html.parser' or (name == 'lxml' and lxml_etree is not None)
+
+def set_backend(name:str):
+	"""
+	Selects the backend used by all parsers in this process
+	"""
+	global _backend
+	if name not in BACKENDS:
+		raise ValueError(f'Parser backend {name} not recognized. Choose from {BACKENDS}')
+	if not _available(name):
+		logging.debug(f'Parser backend {name} not installed. Using html.parser')
+		name = 'html.parser'
+	_backend = name
+	return _backend
+
+def get_backend():
+	return _backend
+
+def make_soup(markup, parse_only = None):
+	"""
+	BeautifulSoup tree of an HTML page built by the current backend
+	"""
+	return BeautifulSoup(markup, _backend, parse_only = parse_only)
+
+def iterparse_xml(source, events = ('end',)):
+	"""
+	Incremental XML parser; lxml elements share the ElementTree API
+	"""
+	if _backend == 'lxml':
+		return lxml_etree.iterparse(source, events = events)
+	return ET.iterparse(source, events = events)
+
+_backend = 'html.parser'
+set_backend(os.environ.get('GOODREADS_PARSER_BACKEND', 'html.parser'))
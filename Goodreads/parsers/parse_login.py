@@ -1,16 +1,16 @@
 import logging
-from bs4 import BeautifulSoup
+from parsers.backends import make_soup
 
 def parse_login(response, logger = None):
 	"""
 	Get arguments for POST from the GET request
 	"""
 	if logger:
-		logger.debug(f'Parsing login <{response.url}>')
+		logger.debug('Parsing login <%s>', response.url)
 	else:
-		logging.debug(f'Parsing login <{response.url}>')
+		logging.debug('Parsing login <%s>', response.url)
 
-	soup = BeautifulSoup(response.text, 'html.parser')
+	soup = make_soup(response.text)
 
 	return {
 		'authenticity_token' : soup.find('input', {'name' : 'authenticity_token'})['value'],
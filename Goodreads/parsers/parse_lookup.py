@@ -2,44 +2,186 @@ import re
 import datetime
 import logging
 
-from bs4 import BeautifulSoup
 from yarl import URL
 
-def parse_lookup(response, logger = None):
+from bs4 import NavigableString
+
+from parsers.backends import make_soup
+
+from network.PrefixReader import PrefixIncomplete
+
+# Bump when the output changes, so memoized results are not reused
+PARSER_VERSION = 1
+
+SIMILAR_LINK_TEXT = "See similar books…"
+
+# Streamed book pages can stop at the reviews once every section read here has arrived
+# + Each pattern is anchored to the tag _index_lookup reads, so the same
+# names in inline CSS or JS do not count
+PREFIX_REQUIRED = (
+	rb'<div\b[^>]*\bid="details"',
+	rb'<a\b[^>]*\bclass="actionLinkLite bookPageGenreLink"',
+	rb'<div\b[^>]*\bclass="(?:[^"]*\s)?bookCarousel[\s"]',
+	rb'<a\b[^>]*>' + re.escape(SIMILAR_LINK_TEXT.encode('utf-8')) + rb'<',
+)
+PREFIX_TAIL = (rb'<div\b[^>]*\bid="bookReviews"',)
+
+# Index entries a cut page must have; see check_prefix
+PREFIX_SECTIONS = ('details', 'genres', 'carousel', 'similar_link')
+
+def parse_lookup(response, logger = None,
+				 fields = None):
 	"""
 	Get all info aboutbook, returning dictionary of info
+	+ With fields, only those fields are parsed (source, accesed_date, and
+	gr_book_id are always included); see LOOKUP_FIELDS for the names
 	"""
 	if logger:
-		logger.debug(f'Parsing lookup <{response.url}>')
+		logger.debug('Parsing lookup <%s>', response.url)
 	else:
-		logging.debug(f'Parsing lookup <{response.url}>')
+		logging.debug('Parsing lookup <%s>', response.url)
+
+	if fields is None:
+		fields = LOOKUP_FIELDS
+	check_lookup_fields(fields)
 
-	soup = BeautifulSoup(response.text, 'html.parser')
+	soup = make_soup(response.text)
+	index = _index_lookup(soup)
+	check_prefix(response, index)
 
 	book_info = {
 		'source'             : response.url,
 		'accesed_date'       : str(datetime.datetime.now()),
 		'gr_book_id'         : _parse_gr_book_id(response.url),
-		'title'              : _parse_lookup_title(soup),
-		'authors'            : _parse_lookup_author(soup),
-		'cover_url'          : _parse_lookup_cover_url(soup),
-		'rating_avg'         : _parse_lookup_rating_avg(soup),
-		'rating_count'       : _parse_lookup_rating_count(soup),
-		'pages'              : _parse_lookup_pages(soup),
-		'pub_date'           : _parse_lookup_pub_date(soup),
-		'title_original'     : _parse_lookup_title_original(soup),
-		'isbn'               : _parse_lookup_isbn(soup),
-		'gr_series_id'       : _parse_lookup_series_id(soup),
-		'series_name'        : _parse_lookup_series_name(soup),
-		'series_book_num'    : _parse_lookup_series_book_num(soup),
-		'characters'         : _parse_lookup_character(soup),
-		'top_genres'         : _parse_lookup_genres(soup),
-		'similar_book_ids'   : _parse_lookup_abridged_similar(soup),
-		'full_similar_link'  : _parse_lookup_full_similar_link(soup),
 	}
+	for field in fields:
+		book_info[field] = LOOKUP_FIELDS[field](index)
 
 	return book_info
 
+def parse_lookup_lazy(response, logger = None):
+	"""
+	Get a LazyLookup, which parses each field of the book on first access
+	"""
+	if logger:
+		logger.debug('Parsing lazy lookup <%s>', response.url)
+	else:
+		logging.debug('Parsing lazy lookup <%s>', response.url)
+
+	index = _index_lookup(make_soup(response.text))
+	check_prefix(response, index)
+
+	return LazyLookup(index, {
+		'source'             : response.url,
+		'accesed_date'       : str(datetime.datetime.now()),
+		'gr_book_id'         : _parse_gr_book_id(response.url),
+	})
+
+# The result holds the page tree, so it cannot be sent between processes or memoized
+parse_lookup_lazy.retains_tree = True
+
+class LazyLookup(dict):
+	"""
+	Book info dict whose LOOKUP_FIELDS are parsed when first read
+	+ The page index is kept until every field is parsed or resolve() is
+	called, so only hold on to a LazyLookup while it is being read
+	+ Iteration and json only see fields parsed so far; call resolve() first
+	to get the full dict
+	"""
+	def __init__(self, index, book_info):
+		super().__init__(book_info)
+		self.index = index
+
+	def __missing__(self, field):
+		if field not in LOOKUP_FIELDS or self.index is None:
+			raise KeyError(field)
+		self[field] = LOOKUP_FIELDS[field](self.index)
+		if all(dict.__contains__(self, name) for name in LOOKUP_FIELDS):
+			self.index = None
+		return dict.__getitem__(self, field)
+
+	def __contains__(self, field):
+		return dict.__contains__(self, field) or (self.index is not None and field in LOOKUP_FIELDS)
+
+	def get(self, field, default = None):
+		try:
+			return self[field]
+		except KeyError:
+			return default
+
+	def resolve(self):
+		"""
+		Parses all remaining fields and releases the page tree
+		"""
+		for field in LOOKUP_FIELDS:
+			self[field]
+		self.index = None
+		return self
+
+def check_lookup_fields(fields):
+	unknown = [field for field in fields if field not in LOOKUP_FIELDS]
+	if unknown:
+		raise ValueError(f'Lookup fields {unknown} not recognized. Choose from {list(LOOKUP_FIELDS)}')
+
+def check_prefix(response, index):
+	"""
+	Raises PrefixIncomplete if a page cut short by a streamed read is
+	missing a section that was seen before the cut
+	+ A page is only cut once every PREFIX_REQUIRED pattern matched, so an
+	empty section means the cut dropped it
+	"""
+	if not getattr(response, 'truncated', False):
+		return
+	missing = [section for section in PREFIX_SECTIONS if not index[section]]
+	if missing:
+		raise PrefixIncomplete(f'Cut page <{response.url}> is missing {missing}')
+
+def _index_lookup(soup):
+	"""
+	Walks the page once and records every node the field parsers read
+	+ Detail rows (ISBN, Series, ...) are keyed by their row title
+	+ Field parsers then only search inside small subtrees like topcol
+	"""
+	index = {
+		'topcol'       : None,
+		'details'      : None,
+		'carousel'     : None,
+		'page_count'   : None,
+		'similar_link' : None,
+		'authors'      : [],
+		'genres'       : [],
+		'detail_rows'  : {},
+	}
+
+	for tag in soup.find_all(True):
+		classes = tag.get('class') or []
+		if tag.name == 'div':
+			if tag.get('id') == 'topcol' and index['topcol'] is None:
+				index['topcol'] = tag
+			elif tag.get('id') == 'details' and index['details'] is None:
+				index['details'] = tag
+			elif 'clearFloats' in classes:
+				row_title = tag.find(name = 'div', attrs = {'class' : 'infoBoxRowTitle'})
+				if row_title is not None and row_title.string not in index['detail_rows']:
+					index['detail_rows'][row_title.string] = tag
+			elif 'authorName__container' in classes:
+				index['authors'].append(tag)
+			elif 'bookCarousel' in classes and index['carousel'] is None:
+				index['carousel'] = tag
+		elif tag.name == 'a':
+			if ' '.join(classes) == 'actionLinkLite bookPageGenreLink':
+				index['genres'].append(tag)
+			if index['similar_link'] is None:
+				for child in tag.contents:
+					if isinstance(child, NavigableString) and child == SIMILAR_LINK_TEXT:
+						index['similar_link'] = tag
+						break
+		elif tag.name == 'span':
+			if tag.get('itemprop') == 'numberOfPages' and index['page_count'] is None:
+				index['page_count'] = tag
+
+	return index
+
 def _parse_gr_book_id(url):
 	url = URL(url)
 	try:
@@ -52,18 +194,18 @@ def _parse_gr_book_id(url):
 		except:
 			return None
 
-def _parse_lookup_title(soup):
+def _parse_lookup_title(index):
 	try:
-		_ = soup.find(name = 'div', attrs = {'id' : 'topcol'})
+		_ = index['topcol']
 		title = _.find(name = 'h1', attrs = {'id' : 'bookTitle'}).string.strip()
 		return title
 	except:
 		return None
 
-def _parse_lookup_author(soup):
+def _parse_lookup_author(index):
 	authors = {}
 	try:
-		all_author_html = soup.find_all(name = 'div', attrs = {'class' : 'authorName__container'})
+		all_author_html = index['authors']
 
 		for author_num, author_html in enumerate(all_author_html):
 			author = {}
@@ -93,42 +235,42 @@ def _parse_lookup_author(soup):
 	except:
 		return authors
 
-def _parse_lookup_cover_url(soup):
+def _parse_lookup_cover_url(index):
 	try:
-		_ = soup.find(name = 'div', attrs = {'id' : 'topcol'})
+		_ = index['topcol']
 		cover = URL(_.find(name = 'img', attrs = {'id' : 'coverImage'})['src'])
 		return str(cover)
 	except:
 		return None
 
-def _parse_lookup_rating_avg(soup):
+def _parse_lookup_rating_avg(index):
 	try:
-		_ = soup.find(name = 'div', attrs = {'id' : 'topcol'})
+		_ = index['topcol']
 		rating_avg = _.find(name = 'span', attrs = {'itemprop' : 'ratingValue'}).string.strip()
 		return float(rating_avg)
 	except:
 		return None
 
-def _parse_lookup_rating_count(soup):
+def _parse_lookup_rating_count(index):
 	try:
-		_ = soup.find(name = 'div', attrs = {'id' : 'topcol'})
+		_ = index['topcol']
 		rating_count = _.find(name = 'meta', attrs = {'itemprop' : 'ratingCount'})['content']
 		return int(rating_count)
 	except:
 		return None
 
-def _parse_lookup_pages(soup):
+def _parse_lookup_pages(index):
 	try:
-		page_str = soup.find(name = 'span', attrs = {'itemprop' : 'numberOfPages'}).string.strip()
+		page_str = index['page_count'].string.strip()
 		pages = re.search(r'^[\d]*', page_str).group(0)
 		return int(pages)
 	except:
 		return None
 
-def _parse_lookup_pub_date(soup):
+def _parse_lookup_pub_date(index):
 	pubs = {}
 	try:
-		details = soup.find(name = 'div', attrs = {'id' : 'details'})
+		details = index['details']
 		pub_details = details.find_all(name = 'div', attrs = {'class' : 'row'})[1] # Second row
 	except:
 		return None
@@ -163,34 +305,28 @@ def _parse_lookup_pub_date(soup):
 
 	return pubs
 
-def __parse_lookup_detail_row(soup, target_name, 
+def __parse_lookup_detail_row(index, target_name, 
 							  return_item = True):
 	"""
 	Returns the section of html that contains a target row name (e.g. 'ISBN')
 	"""
-	try:
-		segments = soup.find_all(name = 'div', attrs = {'class' : 'clearFloats'})
-		for segment in segments:
-			if segment.find(name = 'div', attrs = {'class' : 'infoBoxRowTitle'}).string == target_name:
-				if return_item:
-					return segment.find(name = 'div', attrs = {'class' : 'infoBoxRowItem'})
-				else:
-					return segment
-	except:
-		return None
+	segment = index['detail_rows'].get(target_name)
+	if segment is None or not return_item:
+		return segment
+	return segment.find(name = 'div', attrs = {'class' : 'infoBoxRowItem'})
 
-def _parse_lookup_title_original(soup):
+def _parse_lookup_title_original(index):
 	try:
-		title_original_info = __parse_lookup_detail_row(soup, target_name = 'Original Title')
+		title_original_info = __parse_lookup_detail_row(index, target_name = 'Original Title')
 		title_original = title_original_info.string.strip()
 		return title_original
 	except:
 		return None
 
-def _parse_lookup_isbn(soup):
+def _parse_lookup_isbn(index):
 	isbns = {}
 	try:
-		isbn_info = __parse_lookup_detail_row(soup, target_name = 'ISBN')
+		isbn_info = __parse_lookup_detail_row(index, target_name = 'ISBN')
 	except:
 		return None
 	try:
@@ -204,55 +340,54 @@ def _parse_lookup_isbn(soup):
 		isbns['isbn13'] = None
 		return isbns
 
-def _parse_lookup_series_id(soup):
+def _parse_lookup_series_id(index):
 	try:
-		series_info = __parse_lookup_detail_row(soup, target_name = 'Series')
+		series_info = __parse_lookup_detail_row(index, target_name = 'Series')
 		href = series_info.find(name = 'a')['href']
 		series_id = re.search(r'^(\d)*', href.split('/')[-1].replace('.', '-')).group(0)
 		return series_id
 	except:
 		return None
 
-def _parse_lookup_series_name(soup):
+def _parse_lookup_series_name(index):
 	try:
 
-		series_info = __parse_lookup_detail_row(soup, target_name = 'Series')
+		series_info = __parse_lookup_detail_row(index, target_name = 'Series')
 		series_string = series_info.find(name = 'a').string
 		series_name = re.search(r'([^#]+)', series_string).group(0)
 		return series_name
 	except:
 		return None
 
-def _parse_lookup_series_book_num(soup):
+def _parse_lookup_series_book_num(index):
 	try:
-		series_info = __parse_lookup_detail_row(soup, target_name = 'Series')
+		series_info = __parse_lookup_detail_row(index, target_name = 'Series')
 		series_string = series_info.find(name = 'a').string
 		series_book_num = re.findall(r'(?<=\#).*', series_string)[-1]
 		return series_book_num
 	except:
 		return None
 
-def _parse_lookup_character(soup):
+def _parse_lookup_character(index):
 	try:
-		chars_segment = __parse_lookup_detail_row(soup, target_name = 'Characters', return_item = False)
+		chars_segment = __parse_lookup_detail_row(index, target_name = 'Characters', return_item = False)
 		all_a_rows = chars_segment.find_all(name = 'a')
 		all_chars = [row.string.strip() for row in all_a_rows if not row.has_attr('onclick')]
 		return all_chars
 	except:
 		return None
 
-def _parse_lookup_genres(soup):
+def _parse_lookup_genres(index):
 	"""
 	More genres are shown in the sidebar when logged in
 	"""
 	try:
-		genres = soup.find_all(name = 'a', attrs = {'class' : 'actionLinkLite bookPageGenreLink'})
-		genres = [genre.string.strip() for genre in genres]
+		genres = [genre.string.strip() for genre in index['genres']]
 		return genres
 	except:
 		return None
 
-def _parse_lookup_abridged_similar(soup,
+def _parse_lookup_abridged_similar(index,
 						  		   url_scheme = 'https',
 								   url_host = 'www.goodreads.com'):
 	"""
@@ -261,7 +396,7 @@ def _parse_lookup_abridged_similar(soup,
 	"""
 	abridged_similar_book_ids = []
 	try:
-		carousel = soup.find(name = 'div', attrs = {'class' : 'bookCarousel'})
+		carousel = index['carousel']
 		for book in carousel.find_all(name = 'a'):
 			book = URL(book['href'])
 			book = re.search("^[0-9]*(?=-)", book.parts[-1].replace('.', '-')).group(0)
@@ -270,14 +405,34 @@ def _parse_lookup_abridged_similar(soup,
 	except:
 		return abridged_similar_book_ids
 
-def _parse_lookup_full_similar_link(soup):
+def _parse_lookup_full_similar_link(index):
 	"""
 	There is a larger list on a different page
 	Usually around 30 books
 	Oddly, the similar link does not follow the same goodreads book ID as the rest of the site
 	"""
 	try:
-		full_similar_link = soup.find(text = "See similar books…").parent['href']
+		full_similar_link = index['similar_link']['href']
 		return full_similar_link
 	except:
-		return None
\ No newline at end of file
+		return None
+
+# Field name -> parser of that field from the page index, in output order
+LOOKUP_FIELDS = {
+	'title'              : _parse_lookup_title,
+	'authors'            : _parse_lookup_author,
+	'cover_url'          : _parse_lookup_cover_url,
+	'rating_avg'         : _parse_lookup_rating_avg,
+	'rating_count'       : _parse_lookup_rating_count,
+	'pages'              : _parse_lookup_pages,
+	'pub_date'           : _parse_lookup_pub_date,
+	'title_original'     : _parse_lookup_title_original,
+	'isbn'               : _parse_lookup_isbn,
+	'gr_series_id'       : _parse_lookup_series_id,
+	'series_name'        : _parse_lookup_series_name,
+	'series_book_num'    : _parse_lookup_series_book_num,
+	'characters'         : _parse_lookup_character,
+	'top_genres'         : _parse_lookup_genres,
+	'similar_book_ids'   : _parse_lookup_abridged_similar,
+	'full_similar_link'  : _parse_lookup_full_similar_link,
+}
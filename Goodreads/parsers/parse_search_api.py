@@ -1,38 +1,85 @@
+import io
 import logging
 import datetime
-import xml.etree.ElementTree as ET # Core library
 
 from yarl import URL
 
+from parsers.backends import iterparse_xml
+
+# Bump when the output changes, so memoized results are not reused
+PARSER_VERSION = 3
+
+# Pagination fields of the <search> element
+SEARCH_META = {
+	'results-start' : 'results_start',
+	'results-end'   : 'results_end',
+	'total-results' : 'total_results'
+}
+
 def parse_search_api(response, logger = None):
 	"""
 	Parse XML of search response
 	Returns list of Book objects returned by search
 	"""
 	if logger:
-		logger.debug(f'Parsing search API <{response.url}>')
+		logger.debug('Parsing search API <%s>', response.url)
 	else:
-		logging.debug(f'Parsing search API <{response.url}>')
-
-	# Generate XML object and find books, which are stored as 'work' elements
-	root = ET.fromstring(response.content)
-	works = root.findall('.//work')
-
-	# Generate Book object for each book
-	books = []
-	for work in works:
-		books.append({
-			'source'      : response.url,
-			'accessed_datetime' : str(datetime.datetime.now()),
-			'gr_book_id'  : _parse_search_api_id(work),
-			'title'       : _parse_search_api_title(work),
-			'author'      : _parse_search_api_author(work),
-			'cover_url'   : _parse_search_api_cover_url(work),
-			'pub_date'    : _parse_search_api_pub_date(work),
-			'rating_count': _parse_search_api_rating_count(work),
-			'rating_avg'  : _parse_search_api_rating_avg(work)
-		})
-	return books
+		logging.debug('Parsing search API <%s>', response.url)
+
+	return list(iter_search_api(response))
+
+def parse_search_api_page(response, logger = None):
+	"""
+	Parse XML of search response along with its pagination fields
+	+ Returns {'meta' : {results_start, results_end, total_results}, 'books' : [...]}
+	"""
+	if logger:
+		logger.debug('Parsing search API page <%s>', response.url)
+	else:
+		logging.debug('Parsing search API page <%s>', response.url)
+
+	meta = {}
+	books = list(iter_search_api(response, meta = meta))
+	return {'meta' : meta, 'books' : books}
+
+def iter_search_api(response, meta = None):
+	"""
+	Streams books from a search response, one per 'work' element
+	+ The XML is read incrementally and each work is removed from the tree
+	once parsed, so the whole document is never held in memory
+	+ If a meta dict is given, it is filled with the pagination fields,
+	which come before the works in the response
+	"""
+	parents = []
+	for event, elem in iterparse_xml(io.BytesIO(response.content), events = ('start', 'end')):
+		if event == 'start':
+			parents.append(elem)
+			continue
+		parents.pop()
+
+		if elem.tag == 'work':
+			yield _parse_search_api_work(work = elem, source = response.url)
+			elem.clear()
+			if parents:
+				parents[-1].remove(elem)
+		elif elem.tag in SEARCH_META and meta is not None:
+			try:
+				meta[SEARCH_META[elem.tag]] = int(elem.text)
+			except (TypeError, ValueError):
+				meta[SEARCH_META[elem.tag]] = None
+
+def _parse_search_api_work(work, source):
+	return {
+		'source'      : source,
+		'accessed_datetime' : str(datetime.datetime.now()),
+		'gr_book_id'  : _parse_search_api_id(work),
+		'title'       : _parse_search_api_title(work),
+		'author'      : _parse_search_api_author(work),
+		'cover_url'   : _parse_search_api_cover_url(work),
+		'pub_date'    : _parse_search_api_pub_date(work),
+		'rating_count': _parse_search_api_rating_count(work),
+		'rating_avg'  : _parse_search_api_rating_avg(work)
+	}
 
 def _parse_search_api_id(work):
 	try:
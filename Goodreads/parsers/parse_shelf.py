@@ -2,16 +2,31 @@ import re
 import datetime
 import logging
 
-from bs4 import BeautifulSoup
 from yarl import URL
 
-def parse_shelf(response, logger = None):
+from bs4 import SoupStrainer
+
+from parsers.backends import make_soup
+
+# Bump when the output changes, so memoized results are not reused
+PARSER_VERSION = 1
+
+# Only the genre header and the book entries are read from a shelf page
+SHELF_STRAINER = SoupStrainer(name = 'div', attrs = {'class' : ['genreHeader', 'elementList']})
+
+def parse_shelf(response, logger = None,
+				partial = True):
+	"""
+	Get the books listed on one page of a shelf
+	+ With partial, only the genre header and book entries are built into
+	the tree; scripts, ads, and the rest of the page are skipped
+	"""
 	if logger:
-		logger.debug(f'Parsing shelf <{response.url}>')
+		logger.debug('Parsing shelf <%s>', response.url)
 	else:
-		logging.debug(f'Parsing shelf <{response.url}>')
+		logging.debug('Parsing shelf <%s>', response.url)
 		
-	soup = BeautifulSoup(response.text, 'html.parser')
+	soup = make_soup(response.text, parse_only = SHELF_STRAINER if partial else None)
 
 	page_num = int(URL(response.url).query['page'])
 	shelf = {
@@ -48,7 +63,7 @@ def _parse_shelf_genre(soup):
 def _parse_shelf_title(soup):
 	try:
 		title = soup.find(name = 'a', attrs = {'class' : 'bookTitle'}).string
-		return title
+		return str(title) if title is not None else None # Plain str does not hold on to the tree
 	except:
 		return None
 
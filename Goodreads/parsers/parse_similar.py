@@ -1,18 +1,28 @@
 import re
 import logging
 
-from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
 
-def parse_similar(response, logger = None):
+from parsers.backends import make_soup
+
+# Bump when the output changes, so memoized results are not reused
+PARSER_VERSION = 1
+
+# Only book links are read from a similar page
+SIMILAR_STRAINER = SoupStrainer(name = 'a', attrs = {'itemprop' : 'url'})
+
+def parse_similar(response, logger = None,
+				  partial = True):
 	"""
 	Get a list of similar book ids
+	+ With partial, only book links are built into the tree
 	"""
 	if logger:
-		logger.debug(f'Parsing similar <{response.url}>')
+		logger.debug('Parsing similar <%s>', response.url)
 	else:
-		logging.debug(f'Parsing similar <{response.url}>')
+		logging.debug('Parsing similar <%s>', response.url)
 
-	soup = BeautifulSoup(response.text, 'html.parser')
+	soup = make_soup(response.text, parse_only = SIMILAR_STRAINER if partial else None)
 
 	similar_book_ids = []
 
@@ -1,7 +1,16 @@
 import json
+import shutil
 import pathlib
 import logging
 
+import requests
+from yarl import URL
+
+def shared_index(saved_dir):
+	# BookIndex reads ShardWriter shards, and ShardWriter imports Book
+	from products.BookIndex import shared_index
+	return shared_index(saved_dir)
+
 class Book():
 	def __init__(self, *args, **kwargs):
 		self.data = kwargs
@@ -10,6 +19,15 @@ class Book():
 		except KeyError:
 			logging.debug(f'Generated empty Book object')
 
+	@classmethod
+	def from_data(cls, data):
+		"""
+		Wraps book info without copying it, so a LazyLookup stays lazy
+		"""
+		book = cls()
+		book.data = data
+		return book
+
 	def __str__(self):
 		return self.data['title']
 
@@ -53,14 +71,18 @@ class Book():
 						cover_dir = './temp_covers'):
 		"""
 		Requests a cover image from server or returns None if no url reference exists
+		+ For many books, CoverFetcher downloads concurrently and stores each
+		distinct image once
 		"""
-		if self.cover_url == None:
+		cover_url = self.data.get('cover_url')
+		if cover_url == None:
 			return None
 
-		cover_data = requests.get(self.cover_url, stream = True)
+		cover_data = requests.get(cover_url, stream = True)
 
 		if save_cover:
-			cover_path = pathlib.Path(cover_dir).joinpath(f'{gr_book_id}.{self.cover_url[-3:]}')
+			pathlib.Path(cover_dir).mkdir(parents = True, exist_ok = True)
+			cover_path = pathlib.Path(cover_dir).joinpath(f'{self.data["gr_book_id"]}{pathlib.PurePosixPath(URL(cover_url).path).suffix}')
 			with open(cover_path, 'wb') as f:
 				cover_data.raw.decode_content = True
 				shutil.copyfileobj(cover_data.raw, f)
@@ -79,6 +101,10 @@ class Book():
 
 		filepath = pathlib.Path(directory).joinpath(self.data['gr_book_id']).with_suffix('.json')
 
+		# Lazy book info is parsed in full before writing
+		if hasattr(self.data, 'resolve'):
+			self.data.resolve()
+
 		# If file exists and we do not want to overwrite, do not create file
 		if filepath.exists() and not overwrite:
 			logging.debug(f'Write Book failed: Book ({self.data["gr_book_id"]}) exists on disk in {directory}')
@@ -90,6 +116,31 @@ class Book():
 				json.dump(obj = self.data, fp = f, indent = 4, sort_keys = True)
 			return True
 
+	def save_to(self, writer):
+		"""
+		Appends book to a ShardWriter, written with the writer's next batch
+		"""
+		writer.write(self)
+
+	@classmethod
+	def load_by_id(cls, gr_book_id, saved_dir = './books'):
+		"""
+		Reads one saved book through the BookIndex of saved_dir, or returns
+		None if it is not there
+		"""
+		with shared_index(saved_dir) as index:
+			data = index.load(gr_book_id) if index is not None else None
+		return cls(**data) if data is not None else None
+
+	@classmethod
+	def load_many(cls, gr_book_ids, saved_dir = './books'):
+		"""
+		Maps each saved id to its Book; ids not saved are left out
+		"""
+		with shared_index(saved_dir) as index:
+			books = index.load_many(gr_book_ids) if index is not None else {}
+		return {gr_book_id : cls(**data) for gr_book_id, data in books.items()}
+
 	def load(self, filepath):
 		"""
 		Reads in json file to dictionary
@@ -0,0 +1,288 @@
+import os
+import mmap
+import json
+import struct
+import pathlib
+import contextlib
+import logging
+import threading
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+from products.ShardWriter import read_index
+
+class BookIndex():
+	"""
+	Memory-mapped index of saved books, sorted by gr_book_id
+	+ Built over a ShardWriter directory (from its index.tsv) or over a
+	directory of Book.save files; either way books.idx is written next to
+	the records
+	+ Lookups binary search the mapped index and decode only the requested
+	records, with orjson when it is installed
+	+ open() rebuilds books.idx when records were added since it was built,
+	and shared_index() reopens a cached index once it is stale
+	+ Book.save files are read whole on every load, so a file overwritten
+	in place is read as it is now rather than at its indexed length
+	+ Safe to share across threads
+	"""
+	MAGIC = b'GRBKIDX2'
+	HEADER = struct.Struct('<8sQQI') # Magic, source stamp, record count, byte length of shard names
+	RECORD = struct.Struct('<QIQIII') # gr_book_id, shard, offset, length, position, size
+	FILENAME = 'books.idx'
+
+	def __init__(self, saved_dir:str = './books'):
+		self.saved_dir = pathlib.Path(saved_dir)
+		self.path = self.saved_dir.joinpath(self.FILENAME)
+
+		self.file = open(self.path, 'rb')
+		self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+		magic, self.stamp, self.count, names_length = self.HEADER.unpack_from(self.map)
+		if magic != self.MAGIC:
+			raise ValueError(f'{self.path} is not a book index')
+		self.shards = json.loads(self.map[self.HEADER.size:self.HEADER.size + names_length])
+		self.start = self.HEADER.size + names_length
+
+		self.inode = os.fstat(self.file.fileno()).st_ino
+		self.lock = threading.Lock()
+		self.shard_maps = {}
+		self.readers = 0 # Open shared_index blocks using this index
+		self.retired = False # Replaced in the shared_index cache
+
+	@classmethod
+	def build(cls, saved_dir:str = './books'):
+		"""
+		Writes books.idx for a directory and returns the opened index
+		"""
+		saved_dir = pathlib.Path(saved_dir)
+		stamp = source_stamp(saved_dir) # Before reading, so records added meanwhile make it stale
+		entries = read_index(saved_dir)
+		if not entries: # Book.save files, one whole record each
+			entries = []
+			for path in saved_dir.glob('*.json'):
+				size = path.stat().st_size
+				entries.append({'key' : path.stem, 'shard' : path.name, 'offset' : 0, 'length' : size, 'position' : 0, 'size' : size})
+
+		shards = {}
+		records = []
+		for entry in entries:
+			if not entry['key'].isdigit():
+				continue
+			shard = shards.setdefault(entry['shard'], len(shards))
+			records.append((int(entry['key']), shard, entry['offset'], entry['length'], entry['position'], entry['size']))
+		records.sort()
+
+		names = json.dumps(list(shards)).encode('utf-8')
+		tmp_path = saved_dir.joinpath(cls.FILENAME + '.tmp')
+		with open(tmp_path, 'wb') as f:
+			f.write(cls.HEADER.pack(cls.MAGIC, stamp, len(records), len(names)) + names)
+			f.write(b''.join(cls.RECORD.pack(*record) for record in records))
+		os.replace(tmp_path, saved_dir.joinpath(cls.FILENAME)) # Readers never see a half-written index
+		if not saved_dir.joinpath('index.tsv').exists():
+			# Writing books.idx touched the directory, so stamp it afterwards
+			with open(saved_dir.joinpath(cls.FILENAME), 'r+b') as f:
+				f.seek(len(cls.MAGIC))
+				f.write(struct.pack('<Q', source_stamp(saved_dir)))
+		logging.debug(f'Indexed {len(records)} books in {saved_dir}')
+		return cls(saved_dir)
+
+	@classmethod
+	def open(cls, saved_dir:str = './books'):
+		"""
+		Opens books.idx, building it first if it is missing or out of date
+		"""
+		saved_dir = pathlib.Path(saved_dir)
+		if not saved_dir.joinpath(cls.FILENAME).exists():
+			return cls.build(saved_dir)
+		try:
+			index = cls(saved_dir)
+		except ValueError: # Written by an older version
+			return cls.build(saved_dir)
+		if index.stamp != source_stamp(saved_dir):
+			index.close()
+			return cls.build(saved_dir)
+		return index
+
+	def is_stale(self):
+		"""
+		True if records were added or books.idx was rebuilt since this index
+		was opened
+		"""
+		try:
+			if self.path.stat().st_ino != self.inode:
+				return True
+		except FileNotFoundError:
+			return True
+		return source_stamp(self.saved_dir) != self.stamp
+
+	def __len__(self):
+		return self.count
+
+	def __contains__(self, gr_book_id):
+		return self.find(gr_book_id) is not None
+
+	def key(self, i):
+		return struct.unpack_from('<Q', self.map, self.start + i * self.RECORD.size)[0]
+
+	def find(self, gr_book_id):
+		"""
+		Index record (gr_book_id, shard, offset, length, position, size) of a
+		book, or None
+		"""
+		gr_book_id = int(gr_book_id)
+		lo, hi = 0, self.count
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if self.key(mid) < gr_book_id:
+				lo = mid + 1
+			else:
+				hi = mid
+		if lo < self.count and self.key(lo) == gr_book_id:
+			return self.RECORD.unpack_from(self.map, self.start + lo * self.RECORD.size)
+		return None
+
+	def shard_map(self, shard):
+		with self.lock:
+			if shard not in self.shard_maps:
+				with open(self.saved_dir.joinpath(self.shards[shard]), 'rb') as f:
+					self.shard_maps[shard] = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+			return self.shard_maps[shard]
+
+	def frame(self, record):
+		"""
+		Bytes of the record's line or of its whole batch, decompressed
+		+ A Book.save file is read whole, since it may have been rewritten
+		"""
+		_, shard, offset, length, _, _ = record
+		if self.shards[shard].endswith('.json'):
+			with open(self.saved_dir.joinpath(self.shards[shard]), 'rb') as f:
+				return f.read()
+		data = self.shard_map(shard)[offset:offset + length]
+		if self.shards[shard].endswith('.zst'):
+			if zstandard is None:
+				raise ImportError('Compressed shards need zstandard. Install it with `pip install zstandard`.')
+			data = zstandard.ZstdDecompressor().decompress(data)
+		return data
+
+	def load(self, gr_book_id):
+		"""
+		Book info dict of an id, or None
+		"""
+		record = self.find(gr_book_id)
+		if record is None:
+			return None
+		try:
+			return self.decode(self.frame(record), record)
+		except FileNotFoundError: # Book.save file deleted since indexing
+			return None
+
+	def load_many(self, gr_book_ids):
+		"""
+		Maps each found id (as a str, like Book.data) to its book info dict,
+		in the order asked
+		+ Records are read in shard order, and a compressed batch is
+		decompressed once for all the books in it
+		"""
+		records = {}
+		for gr_book_id in gr_book_ids:
+			record = self.find(gr_book_id)
+			if record is not None:
+				records[str(gr_book_id)] = record
+
+		books = {}
+		frame = (None, None)
+		for gr_book_id, record in sorted(records.items(), key = lambda item: item[1][1:3]):
+			if frame[0] != record[1:3]:
+				try:
+					frame = (record[1:3], self.frame(record))
+				except FileNotFoundError: # Book.save file deleted since indexing
+					continue
+			books[gr_book_id] = self.decode(frame[1], record)
+		return {gr_book_id : books[gr_book_id] for gr_book_id in records if gr_book_id in books}
+
+	def decode(self, frame, record):
+		"""
+		Book info dict of a record from its frame
+		"""
+		_, shard, _, _, position, size = record
+		if self.shards[shard].endswith('.json'): # Whole file, whatever its length now
+			return decode(frame)
+		return decode(frame[position:position + size])
+
+	def close(self):
+		with self.lock:
+			for shard_map in self.shard_maps.values():
+				shard_map.close()
+			self.shard_maps = {}
+		self.map.close()
+		self.file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self.close()
+
+def decode(data):
+	return orjson.loads(data) if orjson is not None else json.loads(data)
+
+# saved_dir -> open BookIndex, shared by Book.load_by_id and Book.load_many
+# + Guards the cache and every index's reader count
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def source_stamp(saved_dir):
+	"""
+	Changes whenever records are added to saved_dir
+	+ ShardWriter only appends to index.tsv, so its size grows; adding a
+	Book.save file changes the directory mtime. Stamps are compared for
+	equality, since file times are too coarse to order writes.
+	"""
+	tsv = saved_dir.joinpath('index.tsv')
+	return tsv.stat().st_size if tsv.exists() else saved_dir.stat().st_mtime_ns
+
+@contextlib.contextmanager
+def shared_index(saved_dir):
+	"""
+	Open BookIndex of a directory for the length of a with block, or None
+	if the directory does not exist
+	+ The index is reused between calls until it is stale
+	+ A replaced index is closed once the last block reading it exits
+	"""
+	saved_dir = pathlib.Path(saved_dir).resolve()
+	with _indexes_lock:
+		if not saved_dir.is_dir():
+			_retire(_indexes.pop(saved_dir, None))
+			index = None
+		else:
+			index = _indexes.get(saved_dir)
+			if index is None or index.is_stale():
+				_retire(index)
+				index = _indexes[saved_dir] = BookIndex.open(saved_dir)
+			index.readers += 1
+	try:
+		yield index
+	finally:
+		if index is not None:
+			with _indexes_lock:
+				index.readers -= 1
+				if index.retired and not index.readers:
+					index.close()
+
+def _retire(index):
+	"""
+	Marks a replaced index for closing, closing it now if nobody reads it
+	+ Caller must hold _indexes_lock
+	"""
+	if index is None:
+		return
+	index.retired = True
+	if not index.readers:
+		index.close()
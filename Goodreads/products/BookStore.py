@@ -0,0 +1,498 @@
+import json
+import datetime
+import logging
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+try:
+	import pyarrow as pa
+except ImportError:
+	pa = None
+
+from products.Book import Book
+
+# Book fields in the order parse_lookup writes them
+FIELDS = ('source', 'accesed_date', 'gr_book_id', 'title', 'authors', 'cover_url', 'rating_avg',
+		  'rating_count', 'pages', 'pub_date', 'title_original', 'isbn', 'gr_series_id', 'series_name',
+		  'series_book_num', 'characters', 'top_genres', 'similar_book_ids', 'full_similar_link')
+
+# Typed scalar columns; missing ints are stored as -1 and missing floats as nan
+INT_FIELDS = ('gr_book_id', 'rating_count', 'pages')
+FLOAT_FIELDS = ('rating_avg',)
+
+# Dictionary-encoded string columns
+STRING_FIELDS = ('source', 'accesed_date', 'title', 'cover_url', 'title_original', 'gr_series_id',
+				 'series_name', 'series_book_num', 'full_similar_link')
+
+# Dictionary-encoded list columns
+LIST_FIELDS = ('top_genres', 'characters')
+
+class BookStore():
+	"""
+	Columnar, in-memory store of many Book records
+	+ Scalar fields are typed NumPy columns and publication dates are
+	datetime64 columns; strings, genres, characters, and authors are
+	dictionary encoded, so a genre shared by a million books is stored once
+	+ List fields are kept as one flat array of codes plus row offsets
+	+ filter(), sort(), and contains() work on whole columns at once and
+	return new stores; book(i) and books() rebuild Book objects on demand
+	+ Values that do not fit their column (e.g. a date in another format,
+	or a gr_book_id that is an int or has leading zeros) are kept as JSON
+	with any unknown fields, so records round-trip
+	+ Needs numpy; to_arrow() also needs pyarrow
+	"""
+	def __init__(self, columns:dict, n:int):
+		if np is None:
+			raise ImportError('BookStore needs numpy. Install it with `pip install numpy`.')
+		self.columns = columns
+		self.n = n
+
+	@classmethod
+	def from_books(cls, books):
+		"""
+		Builds a store from Book objects or book info dicts
+		"""
+		if np is None:
+			raise ImportError('BookStore needs numpy. Install it with `pip install numpy`.')
+
+		builder = _Builder()
+		for book in books:
+			builder.add(book.data if isinstance(book, Book) else book)
+		logging.debug(f'Built BookStore of {builder.n} books')
+		return cls(builder.build(), builder.n)
+
+	def __len__(self):
+		return self.n
+
+	def __getitem__(self, i):
+		return self.book(i)
+
+	def __iter__(self):
+		return self.books()
+
+	# Columns
+
+	def column(self, field):
+		"""
+		Whole column as an array; strings and lists are decoded per row
+		"""
+		if field in INT_FIELDS or field in FLOAT_FIELDS:
+			return self.columns[field]
+		if field in ('pub_edition', 'pub_original'):
+			return self.columns[field]
+		if field in STRING_FIELDS:
+			return _decode_strings(*self.columns[field])
+		if field in LIST_FIELDS or field in ('authors', 'similar_book_ids'):
+			return _object_array([self.row_list(field, i) for i in range(self.n)])
+		raise KeyError(field)
+
+	def row_list(self, field, i):
+		offsets, codes, dictionary, nulls = self.columns[field]
+		if nulls[i]:
+			return None
+		values = codes[offsets[i]:offsets[i+1]]
+		return values.tolist() if dictionary is None else [dictionary[code] for code in values]
+
+	def contains(self, field, value):
+		"""
+		Boolean mask of books whose list field (e.g. top_genres) holds value
+		"""
+		offsets, codes, dictionary, _ = self.columns[field]
+		if dictionary is None:
+			hits = codes == value
+		else:
+			matches = np.flatnonzero(dictionary == value)
+			if len(matches) == 0:
+				return np.zeros(self.n, dtype = bool)
+			hits = codes == matches[0]
+		rows = np.repeat(np.arange(self.n), np.diff(offsets))
+		mask = np.zeros(self.n, dtype = bool)
+		mask[rows[hits]] = True
+		return mask
+
+	def has_genre(self, genre):
+		return self.contains('top_genres', genre)
+
+	# Selection
+
+	def take(self, indices):
+		"""
+		New store holding the given rows in the given order
+		"""
+		indices = np.asarray(indices, dtype = np.int64)
+		columns = {}
+		for field, column in self.columns.items():
+			if isinstance(column, np.ndarray):
+				columns[field] = column[indices]
+			elif len(column) == 2: # Strings
+				codes, dictionary = column
+				columns[field] = (codes[indices], dictionary)
+			else: # Lists
+				columns[field] = _take_lists(column, indices)
+		return BookStore(columns, len(indices))
+
+	def filter(self, mask):
+		"""
+		New store of the rows where mask is True, e.g.
+		store.filter(store.has_genre('Fantasy') & (store.column('rating_count') > 10000))
+		"""
+		return self.take(np.flatnonzero(mask))
+
+	def sort(self, field, descending:bool = False):
+		"""
+		New store sorted by a scalar or date column; missing values go last
+		"""
+		values = self.column(field)
+		if field in INT_FIELDS:
+			missing = values < 0
+		elif values.dtype.kind == 'M':
+			missing = np.isnat(values)
+		elif values.dtype.kind == 'f':
+			missing = np.isnan(values)
+		else:
+			raise ValueError(f'Cannot sort BookStore by {field}')
+
+		order = np.argsort(-values if descending and values.dtype.kind != 'M' else values, kind = 'stable')
+		if descending and values.dtype.kind == 'M':
+			order = order[::-1]
+		return self.take(np.concatenate([order[~missing[order]], order[missing[order]]]))
+
+	# Records
+
+	def record(self, i):
+		"""
+		Book info dict of row i, as Book.data holds it
+		"""
+		c = self.columns
+		present = int(c['present'][i])
+		record = {}
+		for bit, field in enumerate(FIELDS):
+			if not present & (1 << bit):
+				continue
+			if field == 'gr_book_id':
+				record[field] = str(c[field][i]) if c[field][i] >= 0 else None
+			elif field in INT_FIELDS:
+				record[field] = int(c[field][i]) if c[field][i] >= 0 else None
+			elif field in FLOAT_FIELDS:
+				record[field] = float(c[field][i]) if not np.isnan(c[field][i]) else None
+			elif field in STRING_FIELDS:
+				codes, dictionary = c[field]
+				record[field] = dictionary[codes[i]] if codes[i] >= 0 else None
+			elif field == 'pub_date':
+				record[field] = None if c['pub_null'][i] else {
+					'edition'  : _decode_date(c['pub_edition'][i]),
+					'original' : _decode_date(c['pub_original'][i])
+				}
+			elif field == 'isbn':
+				record[field] = None if c['isbn_null'][i] else {
+					'isbn'   : _decode_string(c['isbn_isbn'], i),
+					'isbn13' : _decode_string(c['isbn_isbn13'], i)
+				}
+			elif field == 'authors':
+				authors = self.row_list('authors', i)
+				str_keys = 'author_str_keys' in c and c['author_str_keys'][i]
+				record[field] = {str(num) if str_keys else num : dict(zip(('gr_author_id', 'name', 'role'), author))
+								 for num, author in enumerate(authors)}
+			else:
+				record[field] = self.row_list(field, i)
+
+		extra = _decode_string(c['extra'], i)
+		if extra is not None:
+			record.update(json.loads(extra))
+		return record
+
+	def book(self, i):
+		return Book(**self.record(i))
+
+	def books(self, indices = None):
+		for i in (range(self.n) if indices is None else indices):
+			yield self.book(int(i))
+
+	def to_arrow(self):
+		"""
+		pyarrow Table of the scalar, string, and list columns, keeping the
+		dictionary encoding
+		"""
+		if pa is None:
+			raise ImportError('BookStore.to_arrow needs pyarrow. Install it with `pip install pyarrow`.')
+
+		c = self.columns
+		arrays = {}
+		for field in INT_FIELDS:
+			arrays[field] = pa.array(c[field], mask = c[field] < 0)
+		for field in FLOAT_FIELDS:
+			arrays[field] = pa.array(c[field], mask = np.isnan(c[field]))
+		for field in ('pub_edition', 'pub_original'):
+			arrays[field] = pa.array(c[field])
+		for field in STRING_FIELDS:
+			codes, dictionary = c[field]
+			arrays[field] = pa.DictionaryArray.from_arrays(pa.array(codes, mask = codes < 0), pa.array(dictionary, type = pa.string()))
+		for field in LIST_FIELDS:
+			offsets, codes, dictionary, nulls = c[field]
+			values = pa.DictionaryArray.from_arrays(pa.array(codes), pa.array(dictionary, type = pa.string()))
+			arrays[field] = pa.ListArray.from_arrays(pa.array(offsets.astype(np.int32)), values, mask = pa.array(nulls))
+		offsets, ids, _, nulls = c['similar_book_ids']
+		arrays['similar_book_ids'] = pa.ListArray.from_arrays(pa.array(offsets.astype(np.int32)), pa.array(ids), mask = pa.array(nulls))
+		return pa.table(arrays)
+
+	# Disk
+
+	def save(self, path):
+		"""
+		Writes the store to one .npz file; dictionaries are stored as JSON
+		"""
+		arrays = {'n' : np.array(self.n)}
+		for field, column in self.columns.items():
+			if isinstance(column, np.ndarray):
+				arrays[field] = column
+			elif len(column) == 2:
+				arrays[f'{field}.codes'] = column[0]
+				arrays[f'{field}.dictionary'] = np.array(json.dumps(column[1].tolist()))
+			else:
+				offsets, codes, dictionary, nulls = column
+				arrays[f'{field}.offsets'] = offsets
+				arrays[f'{field}.codes'] = codes
+				arrays[f'{field}.nulls'] = nulls
+				if dictionary is not None:
+					arrays[f'{field}.dictionary'] = np.array(json.dumps(dictionary.tolist()))
+		np.savez(path, **arrays)
+
+	@classmethod
+	def load(cls, path):
+		if np is None:
+			raise ImportError('BookStore needs numpy. Install it with `pip install numpy`.')
+
+		with np.load(path, allow_pickle = False) as f:
+			arrays = dict(f)
+		n = int(arrays.pop('n'))
+
+		columns = {}
+		for key in sorted(arrays):
+			field, _, part = key.partition('.')
+			if not part:
+				columns[field] = arrays[key]
+			elif field in columns:
+				continue
+			elif f'{field}.offsets' in arrays:
+				dictionary = None
+				if f'{field}.dictionary' in arrays:
+					dictionary = _object_array(json.loads(str(arrays[f'{field}.dictionary'])), tuples = field == 'authors')
+				columns[field] = (arrays[f'{field}.offsets'], arrays[f'{field}.codes'], dictionary, arrays[f'{field}.nulls'])
+			else:
+				columns[field] = (arrays[f'{field}.codes'], _object_array(json.loads(str(arrays[f'{field}.dictionary']))))
+		return cls(columns, n)
+
+class _Builder():
+	"""
+	Accumulates rows in Python lists before they are frozen into arrays
+	"""
+	def __init__(self):
+		self.n = 0
+		self.present = []
+		self.ints = {field : [] for field in INT_FIELDS}
+		self.floats = {field : [] for field in FLOAT_FIELDS}
+		self.strings = {field : _Encoder() for field in STRING_FIELDS + ('isbn_isbn', 'isbn_isbn13', 'extra')}
+		self.dates = {'pub_edition' : [], 'pub_original' : []}
+		self.nulls = {'pub_null' : [], 'isbn_null' : []}
+		self.author_str_keys = []
+		self.lists = {field : _ListEncoder() for field in LIST_FIELDS + ('authors',)}
+		self.similar = _ListEncoder(encode = False)
+
+	def add(self, data):
+		present = 0
+		extra = {key : value for key, value in data.items() if key not in FIELDS}
+		encoded = {}
+		for bit, field in enumerate(FIELDS):
+			if field not in data:
+				continue
+			try:
+				encoded[field] = _encode_field(field, data[field])
+				present |= 1 << bit
+			except (TypeError, ValueError, KeyError, AttributeError):
+				extra[field] = data[field]
+
+		self.present.append(present)
+		for field in INT_FIELDS:
+			self.ints[field].append(encoded.get(field, -1))
+		for field in FLOAT_FIELDS:
+			self.floats[field].append(encoded.get(field, float('nan')))
+		for field in STRING_FIELDS:
+			self.strings[field].add(encoded.get(field))
+
+		edition, original = encoded.get('pub_date', (None, None)) or (None, None)
+		self.nulls['pub_null'].append(encoded.get('pub_date', ()) is None)
+		self.dates['pub_edition'].append(edition)
+		self.dates['pub_original'].append(original)
+
+		isbn = encoded.get('isbn', (None, None))
+		self.nulls['isbn_null'].append(isbn is None)
+		self.strings['isbn_isbn'].add((isbn or (None, None))[0])
+		self.strings['isbn_isbn13'].add((isbn or (None, None))[1])
+
+		for field in LIST_FIELDS:
+			self.lists[field].add(encoded.get(field, []))
+		authors, str_keys = encoded.get('authors', ([], False))
+		self.lists['authors'].add(authors)
+		self.author_str_keys.append(str_keys)
+		self.similar.add(encoded.get('similar_book_ids', []))
+
+		self.strings['extra'].add(json.dumps(extra, sort_keys = True) if extra else None)
+		self.n += 1
+
+	def build(self):
+		columns = {'present' : np.array(self.present, dtype = np.int32)}
+		for field, values in self.ints.items():
+			columns[field] = np.array(values, dtype = np.int64)
+		for field, values in self.floats.items():
+			columns[field] = np.array(values, dtype = np.float64)
+		for field, values in self.dates.items():
+			columns[field] = np.array([value if value is not None else 'NaT' for value in values], dtype = 'datetime64[s]')
+		for field, values in self.nulls.items():
+			columns[field] = np.array(values, dtype = bool)
+		columns['author_str_keys'] = np.array(self.author_str_keys, dtype = bool)
+		for field, encoder in self.strings.items():
+			columns[field] = encoder.build()
+		for field, encoder in self.lists.items():
+			columns[field] = encoder.build(tuples = field == 'authors')
+		columns['similar_book_ids'] = self.similar.build()
+		return columns
+
+class _Encoder():
+	"""
+	Dictionary encoder of single strings; None is code -1
+	"""
+	def __init__(self):
+		self.lookup = {}
+		self.codes = []
+
+	def code(self, value):
+		return self.lookup.setdefault(value, len(self.lookup))
+
+	def add(self, value):
+		self.codes.append(-1 if value is None else self.code(value))
+
+	def build(self):
+		return np.array(self.codes, dtype = np.int32), _object_array(list(self.lookup))
+
+class _ListEncoder(_Encoder):
+	"""
+	Dictionary encoder of lists, stored as flat codes and row offsets
+	"""
+	def __init__(self, encode:bool = True):
+		super().__init__()
+		self.encode = encode
+		self.offsets = [0]
+		self.nulls = []
+
+	def add(self, values):
+		self.nulls.append(values is None)
+		for value in values or []:
+			self.codes.append(self.code(value) if self.encode else value)
+		self.offsets.append(len(self.codes))
+
+	def build(self, tuples:bool = False):
+		offsets = np.array(self.offsets, dtype = np.int64)
+		nulls = np.array(self.nulls, dtype = bool)
+		if not self.encode:
+			return offsets, np.array(self.codes, dtype = np.int64), None, nulls
+		return offsets, np.array(self.codes, dtype = np.int32), _object_array(list(self.lookup), tuples = tuples), nulls
+
+def _encode_field(field, value):
+	"""
+	Converts one field to its column type, raising if it does not fit
+	"""
+	if field == 'gr_book_id':
+		# Read back as str(int), so only ids already in that form fit
+		if value is None:
+			return -1
+		if not isinstance(value, str) or str(int(value)) != value:
+			raise ValueError(field)
+		return _non_negative(int(value))
+	if field in INT_FIELDS:
+		return -1 if value is None else _non_negative(int(value))
+	if field in FLOAT_FIELDS:
+		return float('nan') if value is None else float(value)
+	if field in STRING_FIELDS:
+		if value is not None and not isinstance(value, str):
+			raise TypeError(field)
+		return value
+	if field == 'pub_date':
+		if value is None:
+			return None
+		if set(value) != {'edition', 'original'}:
+			raise KeyError(field)
+		return _encode_date(value['edition']), _encode_date(value['original'])
+	if field == 'isbn':
+		if value is None:
+			return None
+		if set(value) != {'isbn', 'isbn13'}:
+			raise KeyError(field)
+		return value['isbn'], value['isbn13']
+	if field == 'authors':
+		# Parsed books number authors 0, 1, ...; books read back from JSON use '0', '1', ...
+		str_keys = all(isinstance(key, str) for key in value)
+		authors = []
+		for num, (key, author) in enumerate(value.items()):
+			if key != (str(num) if str_keys else num) or set(author) != {'gr_author_id', 'name', 'role'}:
+				raise KeyError(field)
+			authors.append((author['gr_author_id'], author['name'], author['role']))
+		return authors, str_keys
+	if field == 'similar_book_ids':
+		if value is not None and not all(isinstance(book, int) for book in value):
+			raise TypeError(field)
+		return value
+	if value is not None and not all(isinstance(item, str) for item in value):
+		raise TypeError(field)
+	return value
+
+def _non_negative(value):
+	if value < 0:
+		raise ValueError(value)
+	return value
+
+def _encode_date(value):
+	"""
+	'2006-09-16 00:00:00' strings as parse_lookup writes them
+	"""
+	if value is None:
+		return None
+	date = datetime.datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+	if str(date) != value:
+		raise ValueError(value)
+	return date
+
+def _decode_date(value):
+	if np.isnat(value):
+		return None
+	return str(value.astype('datetime64[s]').astype(datetime.datetime))
+
+def _decode_string(column, i):
+	codes, dictionary = column
+	return dictionary[codes[i]] if codes[i] >= 0 else None
+
+def _decode_strings(codes, dictionary):
+	values = np.empty(len(codes), dtype = object)
+	if len(dictionary):
+		values[:] = dictionary[np.maximum(codes, 0)]
+	values[codes < 0] = None
+	return values
+
+def _object_array(values, tuples:bool = False):
+	array = np.empty(len(values), dtype = object)
+	for i, value in enumerate(values):
+		array[i] = tuple(value) if tuples else value
+	return array
+
+def _take_lists(column, indices):
+	"""
+	Gathers the rows of a flat list column
+	"""
+	offsets, codes, dictionary, nulls = column
+	lengths = np.diff(offsets)[indices]
+	new_offsets = np.zeros(len(indices) + 1, dtype = np.int64)
+	np.cumsum(lengths, out = new_offsets[1:])
+	positions = np.repeat(offsets[indices] - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+	return new_offsets, codes[positions], dictionary, nulls[indices]
@@ -0,0 +1,569 @@
+import json
+import queue
+import pathlib
+import logging
+import sqlite3
+import threading
+
+from products.Book import Book
+from products.Shelf import Shelf
+
+# Book fields in the order parse_lookup writes them; a field's position is
+# its bit in the fields and nulls masks of the books table
+FIELDS = ('source', 'accesed_date', 'gr_book_id', 'title', 'authors', 'cover_url', 'rating_avg',
+		  'rating_count', 'pages', 'pub_date', 'title_original', 'isbn', 'gr_series_id', 'series_name',
+		  'series_book_num', 'characters', 'top_genres', 'similar_book_ids', 'full_similar_link')
+
+# Book field -> books table columns it is stored in
+COLUMNS = {
+	'source'            : ('source',),
+	'accesed_date'      : ('accessed_date',),
+	'title'             : ('title',),
+	'cover_url'         : ('cover_url',),
+	'rating_avg'        : ('rating_avg',),
+	'rating_count'      : ('rating_count',),
+	'pages'             : ('pages',),
+	'pub_date'          : ('pub_date_edition', 'pub_date_original'),
+	'title_original'    : ('title_original',),
+	'isbn'              : ('isbn', 'isbn13'),
+	'gr_series_id'      : ('gr_series_id',),
+	'series_name'       : ('series_name',),
+	'series_book_num'   : ('series_book_num',),
+	'full_similar_link' : ('full_similar_link',),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+	gr_book_id        INTEGER PRIMARY KEY,
+	fields            INTEGER NOT NULL DEFAULT 0,
+	nulls             INTEGER NOT NULL DEFAULT 0,
+	source            TEXT,
+	accessed_date     TEXT,
+	title             TEXT,
+	cover_url         TEXT,
+	rating_avg        REAL,
+	rating_count      INTEGER,
+	pages             INTEGER,
+	pub_date_edition  TEXT,
+	pub_date_original TEXT,
+	title_original    TEXT,
+	isbn              TEXT,
+	isbn13            TEXT,
+	gr_series_id      TEXT,
+	series_name       TEXT,
+	series_book_num   TEXT,
+	full_similar_link TEXT,
+	extra             TEXT
+);
+CREATE INDEX IF NOT EXISTS books_series ON books (gr_series_id);
+CREATE INDEX IF NOT EXISTS books_rating_count ON books (rating_count);
+
+CREATE TABLE IF NOT EXISTS authors (
+	gr_author_id TEXT PRIMARY KEY,
+	name         TEXT
+);
+CREATE TABLE IF NOT EXISTS book_authors (
+	gr_book_id   INTEGER NOT NULL,
+	position     INTEGER NOT NULL,
+	gr_author_id TEXT,
+	name         TEXT,
+	role         TEXT,
+	PRIMARY KEY (gr_book_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS book_authors_author ON book_authors (gr_author_id);
+
+CREATE TABLE IF NOT EXISTS genres (
+	genre_id INTEGER PRIMARY KEY,
+	name     TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS book_genres (
+	gr_book_id INTEGER NOT NULL,
+	position   INTEGER NOT NULL,
+	genre_id   INTEGER NOT NULL,
+	PRIMARY KEY (gr_book_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS book_genres_genre ON book_genres (genre_id, gr_book_id);
+
+CREATE TABLE IF NOT EXISTS book_characters (
+	gr_book_id INTEGER NOT NULL,
+	position   INTEGER NOT NULL,
+	name       TEXT,
+	PRIMARY KEY (gr_book_id, position)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS similar_books (
+	gr_book_id      INTEGER NOT NULL,
+	position        INTEGER NOT NULL,
+	similar_book_id INTEGER NOT NULL,
+	PRIMARY KEY (gr_book_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS similar_books_similar ON similar_books (similar_book_id);
+
+CREATE TABLE IF NOT EXISTS shelf_books (
+	genre             TEXT NOT NULL,
+	page              INTEGER NOT NULL,
+	position          INTEGER NOT NULL,
+	gr_book_id        INTEGER,
+	title             TEXT,
+	author            TEXT,
+	topic_count       INTEGER,
+	source            TEXT,
+	accessed_datetime TEXT,
+	PRIMARY KEY (genre, page, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS shelf_books_book ON shelf_books (gr_book_id);
+"""
+
+class Catalog():
+	"""
+	SQLite catalog of books, authors, genres, shelf memberships, and
+	similar-book edges, replacing one JSON file per book or shelf
+	+ The database runs in WAL mode, so queries from any thread read while
+	a batch is being written
+	+ Writes go through put(), which is safe to call from any thread: items
+	are queued and one writer thread upserts them batch_size at a time, each
+	batch in one transaction. flush() waits until everything queued is written.
+	+ upsert_books() and upsert_shelves() write in the calling thread instead,
+	for bulk loads
+	+ A book upsert only replaces the fields the book has, so a lookup with
+	fields does not wipe out the rest of a book stored earlier
+	+ get_books() rebuilds book dicts as parse_lookup returns them
+	+ Every thread opens its own connection, so path must be a file
+	"""
+	def __init__(self, path:str = './catalog.sqlite',
+				 batch_size:int = 500,
+				 timeout:float = 30):
+		self.path = str(path)
+		pathlib.Path(self.path).parent.mkdir(parents = True, exist_ok = True)
+		self.batch_size = batch_size
+		self.timeout = timeout
+
+		self.local = threading.local()
+		self.write_lock = threading.Lock()
+		self.genre_ids = {}
+
+		conn = self.connection()
+		conn.execute('PRAGMA journal_mode = WAL')
+		conn.executescript(SCHEMA)
+
+		self.queue = queue.Queue()
+		self.writer = None
+		self.errors = []
+
+	def connection(self):
+		"""
+		One connection per thread; WAL lets them read side by side
+		"""
+		conn = getattr(self.local, 'conn', None)
+		if conn is None:
+			conn = sqlite3.connect(self.path, timeout = self.timeout, isolation_level = None)
+			conn.execute('PRAGMA synchronous = NORMAL')
+			conn.execute('PRAGMA foreign_keys = OFF')
+			self.local.conn = conn
+		return conn
+
+	# Writing
+
+	def put(self, item):
+		"""
+		Queues a Book, Shelf, book dict, or shelf dict for the writer thread
+		"""
+		self.start_writer()
+		self.queue.put(item)
+
+	def put_result(self, result):
+		"""
+		Queues whatever a client job returned: (book, status_code) from
+		lookup, (shelf, status_code) from shelf, (books, failures) from
+		lookup_many, or a Book or Shelf
+		+ Anything else, such as search results, is ignored
+		"""
+		if isinstance(result, tuple) and len(result) == 2:
+			result = result[0]
+		if isinstance(result, (Book, Shelf)):
+			result = result.data
+		if not isinstance(result, dict) or not result:
+			return
+		if is_shelf(result):
+			self.put(result)
+		elif is_book(result):
+			self.put_book(result)
+		elif all(is_book(book) for book in result.values() if book is not None):
+			for book in result.values():
+				if book is not None:
+					self.put_book(book)
+
+	def put_book(self, book):
+		if parse_id(book.get('gr_book_id')) is None:
+			logging.warning(f'Not cataloging book without a valid gr_book_id: {book.get("gr_book_id")!r}')
+			return
+		self.put(book)
+
+	def start_writer(self):
+		if self.writer is None:
+			with self.write_lock:
+				if self.writer is None:
+					self.writer = threading.Thread(target = self.write_queue, daemon = True)
+					self.writer.start()
+
+	def write_queue(self):
+		"""
+		Writer thread: drains the queue in batches until a None is queued
+		"""
+		while True:
+			items = [self.queue.get()]
+			while len(items) < self.batch_size:
+				try:
+					items.append(self.queue.get_nowait())
+				except queue.Empty:
+					break
+
+			stop = None in items
+			items = [item for item in items if item is not None]
+			try:
+				self.write_items(items)
+			except Exception as e:
+				# Write the batch one item at a time so one bad record cannot drop the rest
+				logging.error(f'Catalog write of {len(items)} items failed: {e!r}. Retrying one at a time.')
+				for item in items:
+					try:
+						self.write_items([item])
+					except Exception as e:
+						logging.error(f'Catalog write of {item!r:.200} failed: {e!r}')
+						self.errors.append(e)
+			finally:
+				for _ in range(len(items) + stop):
+					self.queue.task_done()
+			if stop:
+				return
+
+	def write_items(self, items):
+		books = []
+		shelves = []
+		for item in items:
+			if isinstance(item, (Book, Shelf)):
+				item = item.data
+			(shelves if is_shelf(item) else books).append(item)
+		with self.transaction() as conn:
+			self.write_books(conn, books)
+			self.write_shelves(conn, shelves)
+
+	def flush(self):
+		"""
+		Blocks until every queued item is written
+		"""
+		self.queue.join()
+
+	def upsert_books(self, books):
+		"""
+		Writes Books or book dicts in one transaction and returns the count
+		written; books without a valid gr_book_id are skipped
+		"""
+		books = [book.data if isinstance(book, Book) else book for book in books]
+		with self.transaction() as conn:
+			return self.write_books(conn, books)
+
+	def upsert_shelves(self, shelves):
+		shelves = [shelf.data if isinstance(shelf, Shelf) else shelf for shelf in shelves]
+		with self.transaction() as conn:
+			self.write_shelves(conn, shelves)
+		return len(shelves)
+
+	def transaction(self):
+		return _Transaction(self)
+
+	def write_books(self, conn, books):
+		"""
+		Upserts books grouped by the fields they have, so each group is one
+		executemany
+		+ Books without a valid gr_book_id are logged and skipped
+		+ Returns the number of books written
+		"""
+		written = 0
+		groups = {}
+		children = {'authors' : [], 'characters' : [], 'top_genres' : [], 'similar_book_ids' : []}
+		for book in books:
+			if hasattr(book, 'resolve'): # Lazy book info is parsed in full first
+				book.resolve()
+			gr_book_id = parse_id(book.get('gr_book_id')) if isinstance(book, dict) else None
+			if gr_book_id is None:
+				logging.warning(f'Skipping book without a valid gr_book_id: {book!r:.200}')
+				continue
+			written += 1
+			present = tuple(field for field in COLUMNS if field in book)
+			row = [gr_book_id, _mask(book), _mask(book, nulls = True)]
+			for field in present:
+				row += _columns(field, book[field])
+			extra = {key : value for key, value in book.items() if key not in FIELDS}
+			row.append(json.dumps(extra, sort_keys = True) if extra else None)
+			groups.setdefault(present, []).append(row)
+
+			for field in children:
+				if field in book:
+					children[field].append((gr_book_id, book[field]))
+
+		for present, rows in groups.items():
+			columns = [column for field in present for column in COLUMNS[field]]
+			names = ['gr_book_id', 'fields', 'nulls'] + columns + ['extra']
+			updates = [f'{column} = excluded.{column}' for column in columns] + [
+				'fields = books.fields | excluded.fields',
+				'nulls = (books.nulls & ~excluded.fields) | excluded.nulls',
+				'extra = coalesce(excluded.extra, books.extra)'
+			]
+			conn.executemany(f'INSERT INTO books ({", ".join(names)}) VALUES ({", ".join("?" * len(names))}) '
+							 f'ON CONFLICT (gr_book_id) DO UPDATE SET {", ".join(updates)}', rows)
+
+		self.write_children(conn, 'book_authors', children['authors'],
+							lambda authors: [(author.get('gr_author_id'), author.get('name'), author.get('role'))
+											 for _, author in sorted((authors or {}).items(), key = lambda item: int(item[0]))])
+		conn.executemany('INSERT INTO authors (gr_author_id, name) VALUES (?, ?) '
+						 'ON CONFLICT (gr_author_id) DO UPDATE SET name = excluded.name',
+						 {(author.get('gr_author_id'), author.get('name'))
+						  for _, authors in children['authors'] for author in (authors or {}).values()
+						  if author.get('gr_author_id') is not None})
+		self.write_children(conn, 'book_characters', children['characters'],
+							lambda characters: [(character,) for character in characters or []])
+		self.write_children(conn, 'book_genres', children['top_genres'],
+							lambda genres: [(self.genre_id(conn, genre),) for genre in genres or []])
+		self.write_children(conn, 'similar_books', children['similar_book_ids'],
+							lambda similar: [(parse_id(gr_book_id),) for gr_book_id in similar or []
+											 if parse_id(gr_book_id) is not None])
+		return written
+
+	def write_children(self, conn, table, books, rows):
+		"""
+		Replaces the rows of each book in a child table
+		+ rows(value) turns a book field into rows without the book id and position
+		"""
+		if not books:
+			return
+		conn.executemany(f'DELETE FROM {table} WHERE gr_book_id = ?', [(gr_book_id,) for gr_book_id, _ in books])
+		values = [(gr_book_id, position) + row for gr_book_id, value in books for position, row in enumerate(rows(value))]
+		if values:
+			conn.executemany(f'INSERT INTO {table} VALUES ({", ".join("?" * len(values[0]))})', values)
+
+	def genre_id(self, conn, genre):
+		genre_id = self.genre_ids.get(genre)
+		if genre_id is None:
+			conn.execute('INSERT OR IGNORE INTO genres (name) VALUES (?)', (genre,))
+			(genre_id,) = conn.execute('SELECT genre_id FROM genres WHERE name = ?', (genre,)).fetchone()
+			self.genre_ids[genre] = genre_id
+		return genre_id
+
+	def write_shelves(self, conn, shelves):
+		"""
+		Replaces the stored books of each shelf page
+		"""
+		pages = []
+		for shelf in shelves:
+			for page_num, page in shelf['pages'].items():
+				if parse_id(page_num) is None or not isinstance(page, dict):
+					logging.warning(f'Skipping page {page_num!r} of shelf {shelf["genre"]}')
+					continue
+				pages.append((shelf['genre'], parse_id(page_num), page))
+
+		conn.executemany('DELETE FROM shelf_books WHERE genre = ? AND page = ?', [(genre, page_num) for genre, page_num, _ in pages])
+		conn.executemany('INSERT INTO shelf_books VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', [
+			(genre, page_num, position,
+			 parse_id(book.get('gr_book_id')),
+			 book.get('title'), book.get('author'), book.get('topic_count'),
+			 page.get('source'), page.get('accessed_datetime'))
+			for genre, page_num, page in pages for position, book in enumerate(page.get('books', []))
+		])
+
+	def close(self):
+		"""
+		Writes what is queued, then stops the writer thread
+		"""
+		if self.writer is not None:
+			self.queue.put(None)
+			self.writer.join()
+			self.writer = None
+		conn = getattr(self.local, 'conn', None)
+		if conn is not None:
+			conn.close()
+			self.local.conn = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self.close()
+
+	# Reading
+
+	def find_books(self, genre:str = None,
+				   min_ratings:int = None,
+				   gr_series_id:str = None,
+				   limit:int = None):
+		"""
+		Ids of books matching every filter given, most rated first
+		+ e.g. find_books(genre = 'Fantasy', min_ratings = 10000)
+		"""
+		joins = []
+		where = []
+		params = []
+		if genre is not None:
+			joins.append('JOIN book_genres USING (gr_book_id) JOIN genres USING (genre_id)')
+			where.append('genres.name = ?')
+			params.append(genre)
+		if min_ratings is not None:
+			where.append('books.rating_count > ?')
+			params.append(min_ratings)
+		if gr_series_id is not None:
+			where.append('books.gr_series_id = ?')
+			params.append(str(gr_series_id))
+
+		sql = f'SELECT DISTINCT books.gr_book_id, books.rating_count FROM books {" ".join(joins)}'
+		if where:
+			sql += f' WHERE {" AND ".join(where)}'
+		sql += ' ORDER BY books.rating_count DESC, books.gr_book_id'
+		if limit is not None:
+			sql += f' LIMIT {int(limit)}'
+		return [row[0] for row in self.connection().execute(sql, params)]
+
+	def get_books(self, gr_book_ids):
+		"""
+		Maps each stored id to its book dict; missing ids are left out
+		"""
+		gr_book_ids = [int(gr_book_id) for gr_book_id in gr_book_ids]
+		conn = self.connection()
+		books = {}
+		# Stay under SQLite's limit on query parameters
+		for start in range(0, len(gr_book_ids), 500):
+			chunk = gr_book_ids[start:start + 500]
+			marks = ', '.join('?' * len(chunk))
+			cursor = conn.execute(f'SELECT * FROM books WHERE gr_book_id IN ({marks})', chunk)
+			names = [column[0] for column in cursor.description]
+			rows = {row[0] : dict(zip(names, row)) for row in cursor}
+
+			lists = {gr_book_id : {} for gr_book_id in rows}
+			for gr_book_id, gr_author_id, name, role in conn.execute(
+					f'SELECT gr_book_id, gr_author_id, name, role FROM book_authors WHERE gr_book_id IN ({marks}) ORDER BY gr_book_id, position', chunk):
+				lists[gr_book_id].setdefault('authors', []).append({'gr_author_id' : gr_author_id, 'name' : name, 'role' : role})
+			for gr_book_id, name in conn.execute(
+					f'SELECT gr_book_id, name FROM book_characters WHERE gr_book_id IN ({marks}) ORDER BY gr_book_id, position', chunk):
+				lists[gr_book_id].setdefault('characters', []).append(name)
+			for gr_book_id, name in conn.execute(
+					f'SELECT gr_book_id, genres.name FROM book_genres JOIN genres USING (genre_id) WHERE gr_book_id IN ({marks}) ORDER BY gr_book_id, position', chunk):
+				lists[gr_book_id].setdefault('top_genres', []).append(name)
+			for gr_book_id, similar_book_id in conn.execute(
+					f'SELECT gr_book_id, similar_book_id FROM similar_books WHERE gr_book_id IN ({marks}) ORDER BY gr_book_id, position', chunk):
+				lists[gr_book_id].setdefault('similar_book_ids', []).append(similar_book_id)
+
+			for gr_book_id, row in rows.items():
+				books[gr_book_id] = _book(row, lists[gr_book_id])
+
+		return {gr_book_id : books[gr_book_id] for gr_book_id in gr_book_ids if gr_book_id in books}
+
+	def get_book(self, gr_book_id):
+		"""
+		Book of a stored id, or None
+		"""
+		data = self.get_books([gr_book_id]).get(int(gr_book_id))
+		return Book(**data) if data is not None else None
+
+	def get_shelf(self, genre):
+		"""
+		Shelf of every stored page of a genre, or None
+		"""
+		pages = {}
+		for page_num, gr_book_id, title, author, topic_count, source, accessed_datetime in self.connection().execute(
+				'SELECT page, gr_book_id, title, author, topic_count, source, accessed_datetime '
+				'FROM shelf_books WHERE genre = ? ORDER BY page, position', (genre,)):
+			page = pages.setdefault(page_num, {'source' : source, 'accessed_datetime' : accessed_datetime, 'books' : []})
+			page['books'].append({
+				'title'       : title,
+				'author'      : author,
+				'gr_book_id'  : str(gr_book_id) if gr_book_id is not None else None,
+				'topic_count' : topic_count
+			})
+		return Shelf(genre = genre, pages = pages) if pages else None
+
+	def count_books(self):
+		(count,) = self.connection().execute('SELECT count(*) FROM books').fetchone()
+		return count
+
+class _Transaction():
+	"""
+	Serializes writers and wraps a batch in BEGIN ... COMMIT
+	"""
+	def __init__(self, catalog):
+		self.catalog = catalog
+
+	def __enter__(self):
+		self.catalog.write_lock.acquire()
+		self.conn = self.catalog.connection()
+		self.conn.execute('BEGIN IMMEDIATE')
+		return self.conn
+
+	def __exit__(self, exc_type, exc, tb):
+		try:
+			self.conn.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+		finally:
+			if exc_type is not None:
+				self.catalog.genre_ids.clear() # Ids from the rolled back batch are gone
+			self.catalog.write_lock.release()
+
+def is_book(data):
+	return isinstance(data, dict) and 'gr_book_id' in data and 'genre' not in data
+
+def parse_id(value):
+	"""
+	Non-negative integer id from an int or digit string, or None
+	"""
+	if isinstance(value, bool):
+		return None
+	try:
+		value = int(value)
+	except (TypeError, ValueError):
+		return None
+	return value if value >= 0 else None
+
+def is_shelf(data):
+	return isinstance(data, dict) and 'genre' in data and isinstance(data.get('pages'), dict)
+
+def _mask(book, nulls:bool = False):
+	mask = 0
+	for bit, field in enumerate(FIELDS):
+		if field in book and (not nulls or book[field] is None):
+			mask |= 1 << bit
+	return mask
+
+def _columns(field, value):
+	"""
+	Values of the books table columns a field is stored in
+	"""
+	if field == 'pub_date':
+		value = value or {}
+		return [value.get('edition'), value.get('original')]
+	if field == 'isbn':
+		value = value or {}
+		return [value.get('isbn'), value.get('isbn13')]
+	return [value]
+
+def _book(row, lists):
+	"""
+	Rebuilds a book dict from its books row and child table rows
+	"""
+	book = {}
+	for bit, field in enumerate(FIELDS):
+		if not row['fields'] & (1 << bit):
+			continue
+		if row['nulls'] & (1 << bit):
+			book[field] = None
+		elif field == 'gr_book_id':
+			book[field] = str(row['gr_book_id'])
+		elif field == 'pub_date':
+			book[field] = {'edition' : row['pub_date_edition'], 'original' : row['pub_date_original']}
+		elif field == 'isbn':
+			book[field] = {'isbn' : row['isbn'], 'isbn13' : row['isbn13']}
+		elif field == 'authors':
+			book[field] = dict(enumerate(lists.get('authors', [])))
+		elif field in COLUMNS:
+			book[field] = row[COLUMNS[field][0]]
+		else:
+			book[field] = lists.get(field, [])
+	if row['extra']:
+		book.update(json.loads(row['extra']))
+	return book
@@ -0,0 +1,269 @@
+import os
+import json
+import pathlib
+import logging
+import threading
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+from products.Book import Book
+from products.Shelf import Shelf
+
+# Index line fields; see ShardWriter
+INDEX_FIELDS = ('key', 'shard', 'offset', 'length', 'position', 'size')
+
+FSYNC_POLICIES = ('never', 'batch', 'close')
+
+class ShardWriter():
+	"""
+	Append-only writer of Book or Shelf records to JSONL shard files, in
+	place of one pretty-printed file per book
+	+ Records are buffered and written batch_size at a time; each batch is
+	one write (and, with compress, one zstd frame)
+	+ A new shard is started once the current one passes shard_bytes
+	+ fsync: 'never' leaves syncing to the OS, 'batch' syncs after every
+	batch, 'close' syncs once when the writer is closed
+	+ index.tsv holds one line per record: key, shard, offset, length,
+	position, size. offset and length locate the record's line (or its
+	zstd frame) in the shard; position and size locate the line within the
+	decompressed frame. Index lines are written after their batch, so every
+	indexed record is on disk.
+	+ A key written twice is read back from its latest record
+	+ key_field is 'gr_book_id' for books and 'genre' for shelves
+	+ Safe to share across threads
+	"""
+	def __init__(self, out_dir:str = './books',
+				 key_field:str = 'gr_book_id',
+				 shard_bytes:int = 64 * 1024 * 1024,
+				 batch_size:int = 1000,
+				 compress:bool = False,
+				 level:int = 3,
+				 fsync:str = 'never'):
+		if compress and zstandard is None:
+			raise ImportError('Compressed shards need zstandard. Install it with `pip install zstandard`.')
+		if fsync not in FSYNC_POLICIES:
+			raise ValueError(f'fsync policy {fsync} not recognized')
+
+		self.out_dir = pathlib.Path(out_dir)
+		self.out_dir.mkdir(parents = True, exist_ok = True)
+		self.index_path = self.out_dir.joinpath('index.tsv')
+		self.key_field = key_field
+		self.shard_bytes = shard_bytes
+		self.batch_size = batch_size
+		self.compressor = zstandard.ZstdCompressor(level = level) if compress else None
+		self.fsync = fsync
+
+		self.lock = threading.Lock()
+		self.buffer = []
+		shards = sorted(self.out_dir.glob('shard-*.jsonl*'))
+		self.shard = int(shards[-1].name.split('.')[0].split('-')[1]) if shards else 0
+		self.shard_file = None
+		self.index_file = None
+		self.counts = {
+			'records' : 0,
+			'batches' : 0,
+			'bytes'   : 0
+		}
+
+	def shard_name(self, shard):
+		return f'shard-{shard:05d}.jsonl' + ('.zst' if self.compressor is not None else '')
+
+	def write(self, item):
+		"""
+		Buffers a Book, Shelf, or info dict, writing the batch once it is full
+		"""
+		self.write_many([item])
+
+	def write_many(self, items):
+		records = []
+		for item in items:
+			data = item.data if isinstance(item, (Book, Shelf)) else item
+			if hasattr(data, 'resolve'): # Lazy book info is parsed in full first
+				data.resolve()
+			line = json.dumps(data, sort_keys = True, separators = (',', ':')).encode('utf-8') + b'\n'
+			records.append((str(data[self.key_field]), line))
+
+		with self.lock:
+			self.buffer.extend(records)
+			while len(self.buffer) >= self.batch_size:
+				batch = self.buffer[:self.batch_size]
+				del self.buffer[:self.batch_size]
+				self.write_batch(batch)
+
+	def flush(self):
+		"""
+		Writes whatever is buffered
+		"""
+		with self.lock:
+			if self.buffer:
+				self.write_batch(self.buffer)
+				self.buffer = []
+
+	def write_batch(self, batch):
+		"""
+		Writes one batch to the current shard, then its index lines
+		+ Caller must hold the lock
+		"""
+		self.open_shard()
+		offset = self.shard_file.tell()
+		shard = self.shard_name(self.shard)
+
+		entries = []
+		if self.compressor is None:
+			data = b''.join(line for _, line in batch)
+			for key, line in batch:
+				entries.append((key, shard, offset, len(line), 0, len(line)))
+				offset += len(line)
+		else:
+			frame = self.compressor.compress(b''.join(line for _, line in batch))
+			data = frame
+			position = 0
+			for key, line in batch:
+				entries.append((key, shard, offset, len(frame), position, len(line)))
+				position += len(line)
+
+		self.shard_file.write(data)
+		self.shard_file.flush()
+		if self.fsync == 'batch':
+			os.fsync(self.shard_file.fileno())
+
+		self.index_file.write(''.join('\t'.join(str(field) for field in entry) + '\n' for entry in entries))
+		self.index_file.flush()
+		if self.fsync == 'batch':
+			os.fsync(self.index_file.fileno())
+
+		self.counts['records'] += len(batch)
+		self.counts['batches'] += 1
+		self.counts['bytes'] += len(data)
+
+	def open_shard(self):
+		"""
+		Opens the current shard for appending, rolling over to a new one when full
+		+ Caller must hold the lock
+		"""
+		if self.index_file is None:
+			self.index_file = open(self.index_path, 'a', encoding = 'utf-8')
+
+		if self.shard_file is not None and self.shard_file.tell() >= self.shard_bytes:
+			self.close_shard()
+			self.shard += 1
+		if self.shard_file is None:
+			path = self.out_dir.joinpath(self.shard_name(self.shard))
+			# Shards from an earlier run are never appended to once full or
+			# when written with the other compression setting
+			while any(self.out_dir.glob(f'shard-{self.shard:05d}.jsonl*')) and \
+				  (not path.exists() or path.stat().st_size >= self.shard_bytes):
+				self.shard += 1
+				path = self.out_dir.joinpath(self.shard_name(self.shard))
+			self.shard_file = open(path, 'ab')
+			logging.debug(f'Writing records to {path}')
+
+	def close_shard(self):
+		if self.fsync == 'close':
+			os.fsync(self.shard_file.fileno())
+		self.shard_file.close()
+		self.shard_file = None
+
+	def stats(self):
+		with self.lock:
+			return dict(self.counts, shard = self.shard, buffered = len(self.buffer))
+
+	def close(self):
+		"""
+		Writes what is buffered and closes the files
+		"""
+		self.flush()
+		with self.lock:
+			if self.shard_file is not None:
+				self.close_shard()
+			if self.index_file is not None:
+				if self.fsync == 'close':
+					os.fsync(self.index_file.fileno())
+				self.index_file.close()
+				self.index_file = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self.close()
+
+def read_index(out_dir, latest:bool = True):
+	"""
+	Index entries of a shard directory as dicts of INDEX_FIELDS
+	+ With latest, only the last record of each key is kept
+	"""
+	index_path = pathlib.Path(out_dir).joinpath('index.tsv')
+	if not index_path.exists():
+		return []
+
+	entries = []
+	with open(index_path, 'r', encoding = 'utf-8') as f:
+		for line in f:
+			fields = line.rstrip('\n').split('\t')
+			if len(fields) != len(INDEX_FIELDS): # Line cut short by a crash while writing
+				continue
+			key, shard, offset, length, position, size = fields
+			entries.append({
+				'key'      : key,
+				'shard'    : shard,
+				'offset'   : int(offset),
+				'length'   : int(length),
+				'position' : int(position),
+				'size'     : int(size)
+			})
+
+	if latest:
+		entries = list({entry['key'] : entry for entry in entries}.values())
+	return entries
+
+def read_record(out_dir, entry, f = None):
+	"""
+	Decoded record of one index entry
+	+ Pass the entry's open shard file to avoid reopening it for every record
+	"""
+	data = read_frame(out_dir, entry, f)
+	return json.loads(data[entry['position']:entry['position'] + entry['size']])
+
+def read_frame(out_dir, entry, f = None):
+	"""
+	Bytes of the batch holding an entry, decompressed
+	"""
+	if f is None:
+		with open(pathlib.Path(out_dir).joinpath(entry['shard']), 'rb') as f:
+			return read_frame(out_dir, entry, f)
+
+	f.seek(entry['offset'])
+	data = f.read(entry['length'])
+	if entry['shard'].endswith('.zst'):
+		if zstandard is None:
+			raise ImportError('Compressed shards need zstandard. Install it with `pip install zstandard`.')
+		data = zstandard.ZstdDecompressor().decompress(data)
+	return data
+
+def iter_records(out_dir, entries = None):
+	"""
+	Yields (entry, record) in shard order, latest record of each key by default
+	"""
+	if entries is None:
+		entries = read_index(out_dir)
+
+	f = None
+	shard = None
+	frame = (None, None) # Records of one compressed batch share a frame
+	try:
+		for entry in sorted(entries, key = lambda entry: (entry['shard'], entry['offset'], entry['position'])):
+			if entry['shard'] != shard:
+				if f is not None:
+					f.close()
+				shard = entry['shard']
+				f = open(pathlib.Path(out_dir).joinpath(shard), 'rb')
+			if frame[0] != (shard, entry['offset']):
+				frame = ((shard, entry['offset']), read_frame(out_dir, entry, f))
+			yield entry, json.loads(frame[1][entry['position']:entry['position'] + entry['size']])
+	finally:
+		if f is not None:
+			f.close()
@@ -79,6 +79,12 @@ class Shelf():
 				json.dump(obj = self.data, fp = f, indent = 4, sort_keys = True)
 			return True
 
+	def save_to(self, writer):
+		"""
+		Appends shelf to a ShardWriter, written with the writer's next batch
+		"""
+		writer.write(self)
+
 	def load(self, filepath):
 		"""
 		Reads in json file to dictionary
@@ -0,0 +1,82 @@
+import queue
+import atexit
+import pathlib
+import logging
+import threading
+import logging.handlers
+
+class LogRouter(logging.Handler):
+	"""
+	Hands each record to the file handler registered for its logger name
+	+ Lets one background listener serve every client log file
+	"""
+	def __init__(self):
+		super().__init__()
+		self.routes = {}
+
+	def emit(self, record):
+		handler = self.routes.get(record.name)
+		if handler is not None:
+			handler.handle(record)
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+	"""
+	Queues records without formatting them
+	+ The stock QueueHandler formats the message in the calling thread;
+	here the listener thread does it, so the caller only pays for a put
+	"""
+	def prepare(self, record):
+		return record
+
+_lock = threading.Lock()
+_queue = None
+_router = None
+_file_handlers = {}
+
+def start_listener():
+	"""
+	Starts the single background log writer for this process
+	+ Safe to call repeatedly; the listener is stopped at exit
+	"""
+	global _queue, _router
+	with _lock:
+		if _queue is None:
+			_queue = queue.SimpleQueue()
+			_router = LogRouter()
+			listener = logging.handlers.QueueListener(_queue, _router)
+			listener.start()
+			atexit.register(listener.stop)
+	return _queue
+
+def attach_queue_handler(logger, log_path, formatter):
+	"""
+	Routes a logger's records through the background writer to log_path
+	+ Idempotent: a logger gets at most one queue handler, and each log file
+	is opened once no matter how many clients write to it
+	"""
+	log_queue = start_listener()
+	log_path = str(pathlib.Path(log_path).resolve())
+
+	with _lock:
+		if log_path not in _file_handlers:
+			handler = logging.FileHandler(filename = log_path, mode = 'a')
+			handler.setFormatter(formatter)
+			_file_handlers[log_path] = handler
+		_router.routes[logger.name] = _file_handlers[log_path]
+
+		if not any(isinstance(handler, LazyQueueHandler) for handler in logger.handlers):
+			logger.addHandler(LazyQueueHandler(log_queue))
+
+def attach_file_handler(logger, log_path, formatter):
+	"""
+	Adds a synchronous file handler unless the logger already writes to log_path
+	"""
+	log_path = str(pathlib.Path(log_path).resolve())
+
+	for handler in logger.handlers:
+		if isinstance(handler, logging.FileHandler) and handler.baseFilename == log_path:
+			return
+
+	handler = logging.FileHandler(filename = log_path, mode = 'a')
+	handler.setFormatter(formatter)
+	logger.addHandler(handler)
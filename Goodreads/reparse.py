@@ -0,0 +1,121 @@
+"""
+Runs a parser over every page in a ResponseArchive on all cores
++ Run from the Goodreads directory:
+	python reparse.py --archive ./archive --parser parse_lookup --out books.jsonl
++ Writes one JSON line per page: url, fetched_at, and the parsed result,
+or the error the parser raised
++ By default only the latest copy of each url under the parser's endpoint
+is parsed; --path picks another endpoint and --all-versions keeps every copy
++ Workers read records straight from the shards, so only index entries and
+results pass between processes
+"""
+
+import sys
+import json
+import time
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+from network.ResponseArchive import ResponseArchive
+from parsers import backends
+from parsers.parse_lookup     import parse_lookup
+from parsers.parse_shelf      import parse_shelf
+from parsers.parse_similar    import parse_similar
+from parsers.parse_search_api import parse_search_api
+
+# Parser name -> (parser, endpoint its pages come from)
+PARSERS = {
+	'parse_lookup'     : (parse_lookup, '/book/show'),
+	'parse_shelf'      : (parse_shelf, '/shelf/show'),
+	'parse_similar'    : (parse_similar, '/book/similar'),
+	'parse_search_api' : (parse_search_api, '/search.xml'),
+}
+
+def _init_worker(backend):
+	backends.set_backend(backend)
+
+def reparse_batch(archive_dir, parser_name, entries):
+	"""
+	Parses a batch of archived pages, returning one result dict per entry
+	"""
+	parser, _ = PARSERS[parser_name]
+	archive = ResponseArchive(archive_dir = archive_dir)
+
+	results = []
+	for entry, response in archive.iter_responses(entries):
+		result = {'url' : entry['url'], 'fetched_at' : entry['fetched_at']}
+		try:
+			result['parsed'] = parser(response = response)
+		except Exception as e:
+			result['error'] = repr(e)
+		results.append(result)
+	return results
+
+def batched(entries, batch_size):
+	entries = iter(entries)
+	while True:
+		batch = list(itertools.islice(entries, batch_size))
+		if not batch:
+			return
+		yield batch
+
+def reparse(archive_dir, parser_name, out_path,
+			path_prefix = None,
+			latest = True,
+			workers = None,
+			batch_size = 64,
+			backend = None):
+	"""
+	Parses the archive into out_path and returns (pages, errors)
+	+ Batches are parsed in parallel but written in archive order
+	"""
+	if path_prefix is None:
+		path_prefix = PARSERS[parser_name][1]
+	entries = ResponseArchive(archive_dir = archive_dir).entries(path_prefix = path_prefix, latest = latest)
+	entries.sort(key = lambda entry: (entry['shard'], entry['offset']))
+
+	pages = 0
+	errors = 0
+	with ProcessPoolExecutor(max_workers = workers,
+							 initializer = _init_worker,
+							 initargs = (backend or backends.get_backend(),)) as executor, \
+		 open(out_path, 'w', encoding = 'utf-8') as out:
+		batches = batched(entries, batch_size)
+		for results in executor.map(reparse_batch, itertools.repeat(archive_dir), itertools.repeat(parser_name), batches):
+			for result in results:
+				out.write(json.dumps(result, default = str) + '\n') # Search cover urls are yarl.URLs
+				pages += 1
+				errors += 'error' in result
+
+	return pages, errors
+
+def main():
+	parser = argparse.ArgumentParser(description = 'Re-parse archived responses')
+	parser.add_argument('--archive', default = './archive', help = 'ResponseArchive directory')
+	parser.add_argument('--parser', required = True, choices = list(PARSERS))
+	parser.add_argument('--out', required = True, help = 'JSONL file of results')
+	parser.add_argument('--path', default = None, help = "url path prefix; defaults to the parser's endpoint")
+	parser.add_argument('--all-versions', action = 'store_true', help = 'parse every archived copy of a url')
+	parser.add_argument('--workers', type = int, default = None, help = 'parser processes; defaults to all cores')
+	parser.add_argument('--batch-size', type = int, default = 64)
+	parser.add_argument('--backend', choices = backends.BACKENDS, default = None)
+	args = parser.parse_args()
+
+	start = time.perf_counter()
+	pages, errors = reparse(
+		archive_dir = args.archive,
+		parser_name = args.parser,
+		out_path = args.out,
+		path_prefix = args.path,
+		latest = not args.all_versions,
+		workers = args.workers,
+		batch_size = args.batch_size,
+		backend = args.backend
+	)
+	print(f'Parsed {pages} pages ({errors} errors) in {time.perf_counter() - start:.1f}s')
+	if errors:
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()